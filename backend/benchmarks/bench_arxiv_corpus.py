@@ -0,0 +1,43 @@
+"""Time importing a metadata dump into the local arXiv corpus and searching it.
+
+Every synthetic paper matches the queries, so search times are the worst
+case where bm25 has to score the whole corpus.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_arxiv_corpus
+"""
+import os
+import tempfile
+import time
+
+from benchmarks.bench_arxiv_parser import make_feed
+from src.core.arxiv_corpus import ArxivCorpus
+
+SIZES = [10000, 100000]
+QUERIES = ["graph neural networks", "message passing on sparse graphs", "synthetic paper 4242"]
+
+
+def main():
+    print(f"{'papers':>8} {'import s':>9} {'papers/s':>10} {'query ms':>9}")
+    for size in SIZES:
+        with tempfile.TemporaryDirectory() as directory:
+            dump = os.path.join(directory, "dump.xml")
+            with open(dump, "wb") as f:
+                f.write(make_feed(size))
+            corpus = ArxivCorpus(os.path.join(directory, "corpus.db"))
+
+            start = time.perf_counter()
+            written = corpus.import_dump(dump)
+            elapsed = time.perf_counter() - start
+            assert written == size
+
+            start = time.perf_counter()
+            for query in QUERIES:
+                assert corpus.search(query, 100)
+            per_query = (time.perf_counter() - start) / len(QUERIES) * 1000
+            print(f"{size:>8} {elapsed:>9.2f} {size / elapsed:>10.0f} {per_query:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
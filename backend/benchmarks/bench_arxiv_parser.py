@@ -0,0 +1,128 @@
+"""Compare the streaming arXiv parser with the old BeautifulSoup path.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_arxiv_parser
+
+Each parser runs in a fresh subprocess so peak RSS is measured per parser.
+The "read-only" row is the peak of a child that only loads the feed, for reference.
+"""
+import re
+import resource
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SIZES = [1000, 10000]
+CHUNK_SIZE = 64 * 1024
+
+
+def make_feed(entries: int) -> bytes:
+    """Build a synthetic arXiv Atom feed with `entries` entries"""
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:arxiv="http://arxiv.org/schemas/atom">\n'
+        '<title type="html">ArXiv Query</title>\n'
+    ]
+    for i in range(entries):
+        parts.append(
+            f'<entry>\n'
+            f'<id>http://arxiv.org/abs/2401.{i:05d}v1</id>\n'
+            f'<updated>2024-01-{i % 28 + 1:02d}T00:00:00Z</updated>\n'
+            f'<published>2024-01-{i % 28 + 1:02d}T00:00:00Z</published>\n'
+            f'<title>Synthetic Paper {i} on Graph Neural Networks\n  and Message Passing</title>\n'
+            f'<summary>  {"We study message passing on large sparse graphs. " * 20}</summary>\n'
+            f'<author><name>Author {i} A</name></author>\n'
+            f'<author><name>Author {i} B</name></author>\n'
+            f'<author><name>Author {i} C</name></author>\n'
+            f'<link href="http://arxiv.org/abs/2401.{i:05d}v1" rel="alternate" type="text/html"/>\n'
+            f'<arxiv:primary_category term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>\n'
+            f'</entry>\n'
+        )
+    parts.append('</feed>\n')
+    return "".join(parts).encode("utf-8")
+
+
+def parse_with_bs4(data: bytes):
+    """The parser _search_arxiv used before the streaming one"""
+    from bs4 import BeautifulSoup
+
+    papers = []
+    soup = BeautifulSoup(data.decode("utf-8"), 'xml')
+    for entry in soup.find_all('entry'):
+        title_elem = entry.find('title')
+        authors_elem = entry.findAll('author')
+        abstract_elem = entry.find('summary')
+        published_elem = entry.find('published')
+        year = None
+        if published_elem:
+            year_match = re.search(r'(\d{4})', published_elem.text)
+            if year_match:
+                year = int(year_match.group(1))
+        papers.append({
+            "title": title_elem.text.strip() if title_elem else "No Title",
+            "authors": ", ".join([author.find('name').text for author in authors_elem if author.find('name')]),
+            "abstract": abstract_elem.text.strip() if abstract_elem else "",
+            "year": year,
+            "url": entry.find('id').text if entry.find('id') else "",
+            "source": "arXiv"
+        })
+    return papers
+
+
+def parse_streaming(data: bytes):
+    """Feed the document in network-sized chunks, like the harvester does"""
+    from src.core.arxiv_parser import ArxivFeedParser
+
+    parser = ArxivFeedParser()
+    papers = []
+    for offset in range(0, len(data), CHUNK_SIZE):
+        papers.extend(parser.feed(data[offset:offset + CHUNK_SIZE]))
+    papers.extend(parser.close())
+    return papers
+
+
+def run_one(name: str, path: str):
+    """Runs in the child process, prints `papers seconds peak_rss_kb`"""
+    # import both parsers up front so every child pays the same import cost
+    import bs4  # noqa: F401
+    import src.core.arxiv_parser  # noqa: F401
+
+    with open(path, "rb") as f:
+        data = f.read()
+    parse = {"bs4": parse_with_bs4, "lxml-stream": parse_streaming}.get(name, lambda _: [])
+    start = time.perf_counter()
+    papers = parse(data)
+    elapsed = time.perf_counter() - start
+    print(len(papers), elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def main():
+    print(f"{'parser':<12} {'entries':>8} {'seconds':>9} {'entries/s':>11} {'peak RSS MB':>12}")
+    for entries in SIZES:
+        # the feed is built here so building it doesn't count towards the child's peak
+        with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as f:
+            f.write(make_feed(entries))
+        try:
+            for name in ("read-only", "bs4", "lxml-stream"):
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_arxiv_parser", "--child", name, f.name],
+                    check=True, capture_output=True, text=True
+                ).stdout.split()
+                count, elapsed, rss_kb = int(out[0]), float(out[1]), int(out[2])
+                if name == "read-only":
+                    print(f"{name:<12} {entries:>8} {'-':>9} {'-':>11} {rss_kb / 1024:>12.1f}")
+                    continue
+                assert count == entries, f"{name} parsed {count} of {entries} entries"
+                print(f"{name:<12} {entries:>8} {elapsed:>9.3f} {entries / elapsed:>11.0f} {rss_kb / 1024:>12.1f}")
+        finally:
+            os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        run_one(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,77 @@
+"""Time near-duplicate detection on synthetic harvests.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_dedup
+
+Each harvest has 20% injected duplicates (arXiv versions, punctuation/case
+changes, a dropped word, or a retitled copy with the same abstract), and the
+script reports time per 1k papers plus how many injected duplicates were found.
+"""
+import random
+import time
+
+from src.core.dedup import NearDuplicateIndex
+
+SIZES = [1000, 10000, 50000]
+
+
+def make_vocabulary(size: int, rng: random.Random):
+    """Pseudo-words, a small real vocabulary makes every abstract look alike"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def make_papers(count: int, seed: int = 0):
+    """Synthetic papers, returns (papers, number of injected duplicates)"""
+    rng = random.Random(seed)
+    words = make_vocabulary(5000, rng)
+    originals = count - count // 5
+    papers = []
+    for i in range(originals):
+        papers.append({
+            "title": " ".join(rng.choice(words) for _ in range(rng.randint(6, 12))).title(),
+            "abstract": " ".join(rng.choice(words) for _ in range(150)),
+            "url": f"http://arxiv.org/abs/{2300 + i // 100000}.{i % 100000:05d}v1",
+            "year": 2023,
+            "source": "arXiv",
+        })
+
+    for _ in range(count - originals):
+        original = rng.choice(papers[:originals])
+        copy = dict(original)
+        variant = rng.randrange(4)
+        if variant == 0:
+            copy["url"] = copy["url"][:-2] + "v3"
+            copy["title"] = copy["title"].upper()
+        elif variant == 1:
+            copy["title"] = copy["title"].replace(" ", "  ", 2) + "."
+            copy["url"] = ""
+        elif variant == 2:
+            words = copy["title"].split()
+            del words[rng.randrange(len(words))]
+            copy["title"] = " ".join(words)
+            copy["url"] = ""
+        else:
+            copy["title"] = "On " + copy["title"] + " Revisited"
+            copy["url"] = ""
+        papers.append(copy)
+
+    rng.shuffle(papers)
+    return papers, count - originals
+
+
+def main():
+    index = NearDuplicateIndex()
+    print(f"{'papers':>8} {'seconds':>9} {'ms / 1k':>9} {'removed':>8} {'injected':>9}")
+    for size in SIZES:
+        papers, injected = make_papers(size)
+        start = time.perf_counter()
+        unique = index.deduplicate(papers)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>8} {elapsed:>9.3f} {elapsed * 1000 / (size / 1000):>9.1f} "
+              f"{size - len(unique):>8} {injected:>9}")
+
+
+if __name__ == "__main__":
+    main()
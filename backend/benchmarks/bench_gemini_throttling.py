@@ -0,0 +1,146 @@
+"""Time GeminiClient's rate limiting against a local fake of the Gemini API.
+
+The fake answers 429 to every request above its rate in a one second
+window. The client is configured for far more than that, so it has to find
+the real rate from the 429s. Reports how long the calls take, the rate the
+limiter settles at and how fast it recovers once the fake stops
+throttling. tests/test_gemini_throttling.py checks the same behaviour.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_gemini_throttling
+"""
+import asyncio
+import collections
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVER_RPS = 5
+CLIENT_RPM = 1200
+CALLS = 120
+RECOVERY_CALLS = 100
+# prompts containing this get a 400, which retrying can't fix
+BAD_REQUEST = "malformed request"
+
+
+class FakeGemini(BaseHTTPRequestHandler):
+    """Gemini REST stand-in: 429 above rps requests per second, 400 for BAD_REQUEST prompts"""
+    rps = SERVER_RPS
+    window = collections.deque()
+    lock = threading.Lock()
+    served = 0
+    throttled = 0
+    rejected = 0
+
+    @classmethod
+    def reset(cls, rps: int = SERVER_RPS):
+        with cls.lock:
+            cls.rps = rps
+            cls.window.clear()
+            cls.served = cls.throttled = cls.rejected = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("content-length", 0)))
+        if BAD_REQUEST.encode() in body:
+            with self.lock:
+                FakeGemini.rejected += 1
+            self._send(400, {"error": {"code": 400, "message": "Invalid argument", "status": "INVALID_ARGUMENT"}})
+            return
+        now = time.monotonic()
+        with self.lock:
+            while self.window and now - self.window[0] > 1.0:
+                self.window.popleft()
+            allowed = len(self.window) < FakeGemini.rps
+            if allowed:
+                self.window.append(now)
+                FakeGemini.served += 1
+            else:
+                FakeGemini.throttled += 1
+        if allowed:
+            self._send(200, {"candidates": [{
+                "content": {"parts": [{"text": "ok " * 50}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }]})
+        else:
+            self._send(429, {"error": {"code": 429, "message": "Resource exhausted", "status": "RESOURCE_EXHAUSTED"}})
+
+    def _send(self, status, body):
+        out = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+async def run(client, prefix, calls):
+    """Make calls concurrently, returns (seconds, completion times, failures, lowest limiter rate)"""
+    start = time.perf_counter()
+    done = []
+    lowest = client.rate_limiter.requests.rate
+
+    async def one(i):
+        await client.generate_text(f"{prefix} {i}")
+        done.append(time.perf_counter() - start)
+
+    async def watch():
+        nonlocal lowest
+        while True:
+            lowest = min(lowest, client.rate_limiter.requests.rate)
+            await asyncio.sleep(0.05)
+
+    watcher = asyncio.ensure_future(watch())
+    results = await asyncio.gather(*(one(i) for i in range(calls)), return_exceptions=True)
+    watcher.cancel()
+    failed = [r for r in results if isinstance(r, Exception)]
+    return time.perf_counter() - start, sorted(done), failed, lowest * 60
+
+
+async def report(client):
+    configured = client.rate_limiter.requests_per_minute
+
+    elapsed, done, failed, lowest = await run(client, "throttled", CALLS)
+    throttled_rate = client.rate_limiter.stats()["requests_per_minute"]
+    print(f"throttled: {CALLS} calls, failed {len(failed)}, {elapsed:.1f}s")
+    print(f"  server allows {SERVER_RPS}/s, served {FakeGemini.served}, answered 429 {FakeGemini.throttled} times")
+    # throughput over the second half, once the limiter has settled
+    half = done[len(done) // 2:]
+    if len(half) > 1:
+        print(f"  settled rate {(len(half) - 1) / (half[-1] - half[0]):.1f}/s")
+    print(f"  limiter went down to {lowest:.0f} rpm of {configured}, ended at {throttled_rate:.0f} rpm")
+
+    # the fake stops throttling, successes should bring the rate back up
+    FakeGemini.reset(10 ** 6)
+    elapsed, _, failed, _ = await run(client, "recovering", RECOVERY_CALLS)
+    recovered_rate = client.rate_limiter.stats()["requests_per_minute"]
+    print(f"recovery: {RECOVERY_CALLS} calls, failed {len(failed)}, {elapsed:.1f}s, limiter at {recovered_rate:.0f} rpm")
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # settings are read on import, so they go in before src is loaded
+    os.environ.setdefault("GEMINI_API_KEY", "fake")
+    os.environ["GEMINI_API_ENDPOINT"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ["GEMINI_RPM"] = str(CLIENT_RPM)
+    os.environ["GEMINI_MAX_RETRIES"] = "8"
+    os.environ["GEMINI_RETRY_BASE"] = "0.5"
+    os.environ["GEMINI_RETRY_MAX"] = "8"
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    from src.models.gemini import GeminiClient
+
+    try:
+        asyncio.run(report(GeminiClient()))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
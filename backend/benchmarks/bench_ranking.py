@@ -0,0 +1,32 @@
+"""Time BM25 ranking of harvested papers.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_ranking
+"""
+import time
+
+from benchmarks.bench_dedup import make_papers
+from src.core.ranking import PaperRanker
+
+SIZES = [1000, 5000, 10000]
+SEEDS = [{"title": "Message passing on sparse graphs"}, {"title": "Scalable graph attention"}]
+
+
+def main():
+    ranker = PaperRanker()
+    print(f"{'papers':>8} {'seconds':>9}")
+    for size in SIZES:
+        papers, _ = make_papers(size)
+        # give the queries something to hit in the synthetic vocabulary
+        domain = " ".join(papers[0]["title"].split()[:3])
+        focus = " ".join(papers[1]["abstract"].split()[:8])
+        start = time.perf_counter()
+        ranked = ranker.rank(papers, domain, focus, SEEDS)
+        elapsed = time.perf_counter() - start
+        assert len(ranked) == size
+        print(f"{size:>8} {elapsed:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,24 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from ..models.gemini import shutdown_executor
+from ..services.pdf import shutdown_pdf_renderer
+from ..utils.http import close_http_session
+from .routes import research_service
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await research_service.scheduler.close()
+    await asyncio.to_thread(research_service.partials.close)
+    await asyncio.to_thread(research_service.jobs.close)
+    await close_http_session()
+    shutdown_executor()
+    shutdown_pdf_renderer()
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="AI-Researcher API")
+    app = FastAPI(title="AI-Researcher API", lifespan=lifespan)
     
     app.add_middleware(
         CORSMiddleware,
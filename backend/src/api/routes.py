@@ -1,253 +1,240 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+import asyncio
+import json
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, HTTPException, Header, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
 from ..models.schemas import ResearchRequest, ResearchStatus
 from ..services.research_service import ResearchService
-import markdown
-from weasyprint import HTML
-import tempfile
-import os
+from ..services.scheduler import QueueFullError
+from ..utils.rendering import get_paper_renderer, paper_key
+from ..models.gemini import get_response_cache, get_inflight_stats, get_rate_limiter_stats
+from ..core.arxiv_harvester import get_arxiv_inflight_stats
+from ..utils.logging import as_dict, get_job_logs
+from ..config import STATUS_MAX_WAIT
 
 router = APIRouter(prefix="/api")
 research_service = ResearchService()
 
 @router.post("/research/start")
-async def start_research(request: ResearchRequest, background_tasks: BackgroundTasks):
-    job_id = research_service.create_job(request)
-    background_tasks.add_task(research_service.process_research, job_id, request)
-    return {"job_id": job_id, "message": "Research pipeline initiated"}
+async def start_research(request: ResearchRequest):
+    try:
+        job_id = research_service.submit_job(request)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+    return {
+        "job_id": job_id,
+        "message": "Research pipeline initiated",
+        "queue_position": research_service.scheduler.position(job_id)
+    }
+
+@router.post("/research/{job_id}/resume")
+async def resume_research(job_id: str):
+    job = research_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Research job not found")
+    
+    if job["status"] != "error":
+        raise HTTPException(status_code=409, detail="Only failed research jobs can be resumed")
+    
+    try:
+        research_service.resume_job(job_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+    return {"job_id": job_id, "message": "Research pipeline resumed"}
+
+@router.post("/research/{job_id}/cancel")
+async def cancel_research(job_id: str):
+    job = research_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Research job not found")
+    
+    if job["status"] not in ("queued", "active"):
+        raise HTTPException(status_code=409, detail="Only queued or running research jobs can be cancelled")
+    
+    if not research_service.cancel_job(job_id):
+        raise HTTPException(status_code=409, detail="Research job is run by another worker process")
+    return {"job_id": job_id, "message": "Research pipeline cancelled, it can be resumed"}
+
+def status_etag(status: ResearchStatus) -> str:
+    # queue position moves without the job changing, so it is part of the tag
+    return f'"{status.version}.{status.queue_position or 0}"'
 
 @router.get("/research/{job_id}/status", response_model=ResearchStatus)
-async def get_research_status(job_id: str):
-    if job_id not in research_service.research_jobs:
+async def get_research_status(
+    job_id: str,
+    wait: float = 0,
+    version: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    status = research_service.get_status(job_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="Research job not found")
     
-    job = research_service.research_jobs[job_id]
-    return ResearchStatus(
-        job_id=job_id,
-        status=job["status"],
-        current_stage=job["current_stage"],
-        progress=job["progress"],
-        details=job.get("details")
-    )
+    # long poll: hold the request while the client already has what we'd send
+    wait = min(max(wait, 0), STATUS_MAX_WAIT)
+    if wait and (if_none_match or version is not None):
+        status = await research_service.wait_for_status(
+            job_id,
+            lambda current: status_etag(current) == if_none_match or current.version == version,
+            wait
+        )
+    
+    etag = status_etag(status)
+    if etag == if_none_match:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(status.dict(), headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def sse_message(event_id: Optional[int], event: str, data: Dict[str, Any]) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
+
+@router.get("/research/{job_id}/events")
+async def stream_research_events(
+    job_id: str,
+    last_event_id: Optional[str] = Header(None),
+    after: Optional[int] = None
+):
+    """Server-sent status and log events, resumable with Last-Event-ID (or ?after= where headers can't be set)"""
+    if research_service.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Research job not found")
+    
+    resume_from = int(last_event_id) if last_event_id and last_event_id.isdigit() else after
+    
+    async def body():
+        yield "retry: 3000\n\n"
+        async for entry in research_service.stream_events(job_id, resume_from):
+            yield ": keep-alive\n\n" if entry is None else sse_message(*entry)
+    
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.websocket("/research/{job_id}/ws")
+async def research_events_socket(websocket: WebSocket, job_id: str, after: Optional[int] = None):
+    """The same events as /events as JSON messages, for clients that prefer a WebSocket"""
+    if research_service.get_job(job_id) is None:
+        await websocket.close(code=4404)
+        return
+    
+    await websocket.accept()
+    try:
+        async for entry in research_service.stream_events(job_id, after):
+            if entry is None:
+                await websocket.send_json({"event": "keep-alive"})
+            else:
+                event_id, event, data = entry
+                await websocket.send_json({"id": event_id, "event": event, "data": data})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+@router.get("/research/{job_id}/partial")
+async def get_research_partial(job_id: str, part: Optional[str] = None, offset: int = 0):
+    """What running stages have written so far: part lengths, or one part's text from offset on"""
+    job = research_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Research job not found")
+    
+    # from another process's job the parts come out of the database
+    parts = await asyncio.to_thread(research_service.partials.read, job_id) or {}
+    if part is None:
+        return {
+            "parts": {name: len(text) for name, text in parts.items()},
+            "job_status": job["status"],
+            "job_stage": job["current_stage"]
+        }
+    
+    text = parts.get(part)
+    if text is None:
+        raise HTTPException(status_code=404, detail="No partial output for this part")
+    return {"part": part, "offset": offset, "text": text[offset:], "length": len(text)}
 
 @router.get("/research/{job_id}/results")
 async def get_research_results(job_id: str):
-    if job_id not in research_service.research_jobs:
+    job = research_service.get_job(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Research job not found")
     
-    job = research_service.research_jobs[job_id]
     if job["status"] != "completed":
         raise HTTPException(status_code=400, detail="Research is not yet complete")
     
-    # Access results safely or use details as fallback
-    if "results" in job:
-        return job["results"]
-    elif "details" in job:
-        return job["details"]
-    else:
-        raise HTTPException(
-            status_code=500, 
-            detail="Research completed but no results were generated."
-        )
+    results = await research_service.get_results(job_id)
+    if results is None:
+        raise HTTPException(status_code=410, detail="Research results have expired")
+    return results
 
-@router.get("/research/{job_id}/pdf", response_class=FileResponse)
-async def get_research_pdf(job_id: str, background_tasks: BackgroundTasks):
-    if job_id not in research_service.research_jobs:
+@router.get("/research/{job_id}/html", response_class=HTMLResponse)
+async def get_research_html(job_id: str, if_none_match: Optional[str] = Header(None)):
+    """The paper as the styled page its PDF is printed from, for previews"""
+    job = research_service.get_job(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Research job not found")
     
-    job = research_service.research_jobs[job_id]
     if job["status"] != "completed":
         raise HTTPException(status_code=400, detail="Research is not yet complete")
     
-    paper = job["results"]["paper"]
+    results = await research_service.get_results(job_id)
+    if results is None:
+        raise HTTPException(status_code=410, detail="Research results have expired")
+    paper = results["paper"]
+    
+    etag = f'"{paper_key(paper["title"], paper["content"])}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # the first render of a paper highlights all its code, keep that off the loop
+    page, _ = await asyncio.to_thread(get_paper_renderer().render, paper["title"], paper["content"])
+    return HTMLResponse(page, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+@router.get("/research/{job_id}/pdf", response_class=FileResponse)
+async def get_research_pdf(job_id: str, if_none_match: Optional[str] = Header(None)):
+    job = research_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Research job not found")
     
-    # Create HTML from the markdown content with IEEE styling
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <title>{paper['title']}</title>
-        <style>
-            @page {{
-                size: letter;
-                margin: 2.54cm;
-            }}
-            body {{ 
-                font-family: 'Times New Roman', Times, serif;
-                line-height: 1.5;
-                font-size: 10pt;
-                column-count: 2;
-                column-gap: 0.5cm;
-                margin: 0;
-                padding: 0;
-            }}
-            .header {{
-                column-span: all;
-                text-align: center;
-                margin-bottom: 1cm;
-                padding-bottom: 0.5cm;
-                border-bottom: 1px solid black;
-            }}
-            h1 {{ 
-                font-size: 18pt;
-                font-weight: bold;
-                text-align: center;
-                margin-bottom: 0.3cm;
-                column-span: all;
-            }}
-            .author {{
-                font-size: 11pt;
-                text-align: center;
-                margin-bottom: 0.5cm;
-                column-span: all;
-            }}
-            .abstract {{
-                font-size: 9pt;
-                font-style: italic;
-                margin-bottom: 0.5cm;
-                text-align: justify;
-                column-span: all;
-            }}
-            h2 {{ 
-                font-size: 12pt;
-                font-weight: bold;
-                margin-top: 0.5cm;
-                margin-bottom: 0.3cm;
-                text-transform: uppercase;
-                break-after: avoid;
-                column-span: all;
-            }}
-            h3 {{ 
-                font-size: 11pt;
-                font-weight: bold;
-                margin-top: 0.5cm;
-                margin-bottom: 0.3cm;
-                break-after: avoid;
-                column-span: all;
-            }}
-            p {{
-                text-align: justify;
-                margin-top: 0;
-                margin-bottom: 0.3cm;
-                hyphens: auto;
-            }}
-            pre {{ 
-                font-family: 'Courier New', Courier, monospace;
-                font-size: 8pt;
-                background-color: #f5f5f5;
-                padding: 0.4cm;
-                margin: 0.5cm 0;
-                border: 1px solid #ddd;
-                white-space: pre-wrap;
-                overflow-x: auto;
-                page-break-inside: avoid;
-                column-span: all;
-            }}
-            code {{ 
-                font-family: 'Courier New', Courier, monospace;
-                font-size: 8pt;
-                background-color: #f5f5f5;
-                padding: 0 3px;
-            }}
-            .references {{ 
-                font-size: 9pt;
-                margin-top: 1cm;
-                border-top: 1px solid black;
-                padding-top: 0.3cm;
-                column-span: all;
-            }}
-            ol {{
-                padding-left: 1.5em;
-            }}
-            ul {{
-                padding-left: 1.5em;
-            }}
-            li {{
-                margin-bottom: 0.2cm;
-                text-align: justify;
-            }}
-            figure {{
-                margin: 0.5cm 0;
-                text-align: center;
-                page-break-inside: avoid;
-                column-span: all;
-            }}
-            figcaption {{
-                font-size: 9pt;
-                font-style: italic;
-                text-align: center;
-            }}
-            table {{
-                width: 100%;
-                border-collapse: collapse;
-                margin: 0.5cm 0;
-                page-break-inside: avoid;
-                column-span: all;
-            }}
-            th, td {{
-                border: 1px solid black;
-                padding: 0.2cm;
-                font-size: 9pt;
-                text-align: center;
-            }}
-            th {{
-                background-color: #f0f0f0;
-            }}
-            img {{
-                max-width: 100%;
-                height: auto;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>{paper['title']}</h1>
-        </div>
-        {markdown.markdown(paper['content'], extensions=['extra', 'codehilite', 'nl2br', 'toc'])}
-    </body>
-    </html>
-    """
+    if job["status"] != "completed":
+        raise HTTPException(status_code=400, detail="Research is not yet complete")
     
-    # Create a temporary file for the PDF
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        # Generate PDF from HTML
-        HTML(string=html_content).write_pdf(tmp.name)
+    results = await research_service.get_results(job_id)
+    if results is None:
+        raise HTTPException(status_code=410, detail="Research results have expired")
+    paper = results["paper"]
     
-    # Add the cleanup task to background_tasks
-    background_tasks.add_task(os.unlink, tmp.name)
+    # the PDF only changes with the paper, so its hash is the tag and a revalidation needs no render
+    etag = f'"{paper_key(paper["title"], paper["content"])}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
     
-    # Return the PDF as a file download
-    filename = f"research-paper-{job_id}.pdf"
+    # usually rendered when the job completed, otherwise this waits for the render
+    path = await research_service.pdfs.render(paper["title"], paper["content"])
     
+    # FileResponse answers Range requests itself
     return FileResponse(
-        tmp.name,
+        path,
         media_type="application/pdf",
-        filename=filename
+        filename=f"research-paper-{job_id}.pdf",
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"}
     )
 
 @router.get("/research/{job_id}/logs")
-async def get_research_logs(job_id: str, last_seen: int = 0):
-    if job_id not in research_service.research_jobs:
+async def get_research_logs(job_id: str, after_seq: int = 0, last_seen: Optional[int] = None):
+    """Log lines after after_seq, last_seq of the reply is what to ask after next time"""
+    job = research_service.get_job(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Research job not found")
     
-    job = research_service.research_jobs[job_id]
-    
-    # Get all logs or just new ones based on last_seen parameter
-    all_logs = job.get("logs", [])
-    all_structured_logs = job.get("structured_logs", [])
-    
-    # Get new logs based on last_seen index
-    new_logs = all_logs[last_seen:] if last_seen < len(all_logs) else []
-    
-    # Get new structured logs (if available)
-    new_structured = all_structured_logs[last_seen:] if last_seen < len(all_structured_logs) else []
+    # last_seen was a count of lines read, which is the seq of the last one
+    if last_seen is not None and not after_seq:
+        after_seq = last_seen
+    lines, last_seq = get_job_logs().after(job_id, after_seq)
+    structured = [as_dict(line) for line in lines]
     
     return {
-        "logs": new_logs,
-        "structured_logs": new_structured,
-        "total_count": len(all_logs),
-        "new_count": len(new_logs),
+        "logs": [f"{entry['timestamp']} [{entry['level']}] {entry['message']}" for entry in structured],
+        "structured_logs": structured,
+        "last_seq": last_seq,
+        "total_count": last_seq,
+        "new_count": len(structured),
         "job_status": job["status"],
         "job_stage": job["current_stage"],
         "job_progress": job["progress"]
@@ -255,4 +242,18 @@ async def get_research_logs(job_id: str, last_seen: int = 0):
 
 @router.get("/health")
 async def health_check():
-    return {"status": "ok", "service": "AI-Researcher API"}
+    cache = get_response_cache()
+    return {
+        "status": "ok",
+        "service": "AI-Researcher API",
+        "llm_cache": cache.stats() if cache else None,
+        "jobs": research_service.scheduler.stats(),
+        "artifacts": research_service.artifacts.stats(),
+        "pdf": research_service.pdfs.stats(),
+        "html": get_paper_renderer().stats(),
+        "gemini_rate": get_rate_limiter_stats(),
+        "coalesced": {
+            "gemini": get_inflight_stats(),
+            "arxiv": get_arxiv_inflight_stats()
+        }
+    }
@@ -0,0 +1,122 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+# Max Gemini calls in flight per process, everything above this waits its turn
+GEMINI_MAX_CONCURRENCY = _env_int("GEMINI_MAX_CONCURRENCY", 8)
+
+# Gemini quota per model, calls beyond it wait. 429/503 answers lower the rate until calls get through again
+GEMINI_RPM = _env_int("GEMINI_RPM", 60)
+GEMINI_TPM = _env_int("GEMINI_TPM", 1000000)
+# retries of throttled or transiently failed calls, with jittered exponential backoff (seconds)
+GEMINI_MAX_RETRIES = _env_int("GEMINI_MAX_RETRIES", 5)
+GEMINI_RETRY_BASE = float(os.environ.get("GEMINI_RETRY_BASE", "1"))
+GEMINI_RETRY_MAX = float(os.environ.get("GEMINI_RETRY_MAX", "60"))
+# talk to this endpoint over REST instead of Google's, for proxies and local fakes
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT") or None
+
+# LLM response cache, set LLM_CACHE_PATH to also keep responses on disk
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+LLM_CACHE_MAX_ENTRIES = _env_int("LLM_CACHE_MAX_ENTRIES", 1024)
+LLM_CACHE_MAX_DISK_ENTRIES = _env_int("LLM_CACHE_MAX_DISK_ENTRIES", 20000)
+LLM_CACHE_TTL = _env_int("LLM_CACHE_TTL", 7 * 24 * 3600)
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH") or None
+
+# Shared outbound HTTP pool
+HTTP_POOL_SIZE = _env_int("HTTP_POOL_SIZE", 32)
+HTTP_TIMEOUT = _env_int("HTTP_TIMEOUT", 60)
+
+# arXiv harvesting, the rate is shared by every job in the process
+ARXIV_API_URL = os.environ.get("ARXIV_API_URL", "http://export.arxiv.org/api/query")
+ARXIV_MAX_RESULTS_PER_QUERY = _env_int("ARXIV_MAX_RESULTS_PER_QUERY", 100)
+ARXIV_PAGE_SIZE = _env_int("ARXIV_PAGE_SIZE", 50)
+ARXIV_REQUESTS_PER_SECOND = float(os.environ.get("ARXIV_REQUESTS_PER_SECOND", "1"))
+ARXIV_BURST = _env_int("ARXIV_BURST", 6)
+
+# Local vector index of every abstract collected, see src/core/vector_index.py
+DATA_DIR = os.environ.get("RESEARCHU_DATA_DIR", "data")
+VECTOR_INDEX_ENABLED = os.environ.get("VECTOR_INDEX_ENABLED", "1").lower() not in ("0", "false", "no")
+VECTOR_INDEX_DIR = os.environ.get("VECTOR_INDEX_DIR") or os.path.join(DATA_DIR, "vector_index")
+VECTOR_INDEX_DIM = _env_int("VECTOR_INDEX_DIM", 512)
+# a domain harvested within this many seconds is served from the index, 0 disables that
+VECTOR_INDEX_DOMAIN_TTL = _env_int("VECTOR_INDEX_DOMAIN_TTL", 7 * 24 * 3600)
+VECTOR_INDEX_LOCAL_RESULTS = _env_int("VECTOR_INDEX_LOCAL_RESULTS", 300)
+
+# Local arXiv corpus (SQLite full text search), filled by harvests and imported metadata dumps
+ARXIV_CORPUS_ENABLED = os.environ.get("ARXIV_CORPUS_ENABLED", "1").lower() not in ("0", "false", "no")
+ARXIV_CORPUS_PATH = os.environ.get("ARXIV_CORPUS_PATH") or os.path.join(DATA_DIR, "arxiv_corpus.db")
+# a query harvested within this many seconds is answered from the corpus, 0 always asks arXiv
+ARXIV_CORPUS_TTL = _env_int("ARXIV_CORPUS_TTL", 7 * 24 * 3600)
+ARXIV_CORPUS_RESULTS = _env_int("ARXIV_CORPUS_RESULTS", ARXIV_MAX_RESULTS_PER_QUERY)
+# never go to arXiv, search only the corpus
+ARXIV_CORPUS_OFFLINE = os.environ.get("ARXIV_CORPUS_OFFLINE", "0").lower() not in ("0", "false", "no")
+
+# Per-paper enrichment (topics, contribution, applications, relevance), many papers per Gemini call
+ENRICHMENT_ENABLED = os.environ.get("ENRICHMENT_ENABLED", "1").lower() not in ("0", "false", "no")
+ENRICHMENT_MAX_PAPERS = _env_int("ENRICHMENT_MAX_PAPERS", 200)
+ENRICHMENT_BATCH_SIZE = _env_int("ENRICHMENT_BATCH_SIZE", 25)
+ENRICHMENT_BATCH_TOKENS = _env_int("ENRICHMENT_BATCH_TOKENS", 8000)
+ENRICHMENT_RETRIES = _env_int("ENRICHMENT_RETRIES", 2)
+# share of the model's relevance rating in a paper's ranking score, the rest is BM25
+ENRICHMENT_RANK_WEIGHT = float(os.environ.get("ENRICHMENT_RANK_WEIGHT", "0.3"))
+
+# Gap analysis, corpora bigger than one chunk are summarized chunk by chunk and merged
+GAP_ANALYSIS_MAX_PAPERS = _env_int("GAP_ANALYSIS_MAX_PAPERS", 200)
+GAP_ANALYSIS_CHUNK_TOKENS = _env_int("GAP_ANALYSIS_CHUNK_TOKENS", 6000)
+GAP_ANALYSIS_FAN_IN = _env_int("GAP_ANALYSIS_FAN_IN", 8)
+
+# Prompt size cap in tokens, long windows are allowed but every token adds latency
+PROMPT_MAX_TOKENS = _env_int("PROMPT_MAX_TOKENS", 16000)
+
+# Papers are written as an outline and then all sections in parallel, 0 writes them in one call
+PAPER_SECTIONED = os.environ.get("PAPER_SECTIONED", "1").lower() not in ("0", "false", "no")
+
+# Seconds between writes of streamed, unfinished stage output to the job and its event stream
+PARTIAL_FLUSH_INTERVAL = _env_int("PARTIAL_FLUSH_INTERVAL", 1)
+
+# Stage checkpoints, finished stages are reused by resumed jobs and reruns with the same inputs
+CHECKPOINT_ENABLED = os.environ.get("CHECKPOINT_ENABLED", "1").lower() not in ("0", "false", "no")
+CHECKPOINT_PATH = os.environ.get("CHECKPOINT_PATH") or os.path.join(DATA_DIR, "checkpoints.db")
+CHECKPOINT_TTL = _env_int("CHECKPOINT_TTL", 7 * 24 * 3600)
+
+# Job scheduling, at most PIPELINE_WORKERS pipelines run at once and JOB_QUEUE_MAX wait behind them
+PIPELINE_WORKERS = _env_int("PIPELINE_WORKERS", 2)
+JOB_QUEUE_MAX = _env_int("JOB_QUEUE_MAX", 20)
+# starting guess for a job's duration in seconds, refined as jobs finish
+JOB_DURATION_ESTIMATE = _env_int("JOB_DURATION_ESTIMATE", 300)
+
+# Job store, "sqlite" is shared by every worker process and survives restarts, "memory" is neither
+JOB_STORE = os.environ.get("JOB_STORE", "sqlite").lower()
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH") or os.path.join(DATA_DIR, "jobs.db")
+
+# Completed job results, compressed on disk with the hottest few kept in memory
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR") or os.path.join(DATA_DIR, "artifacts")
+ARTIFACT_CACHE_ENTRIES = _env_int("ARTIFACT_CACHE_ENTRIES", 16)
+ARTIFACT_TTL = _env_int("ARTIFACT_TTL", 30 * 24 * 3600)
+
+# Rendered paper pages (HTML) kept in memory per process, for /html and the PDFs
+HTML_CACHE_ENTRIES = _env_int("HTML_CACHE_ENTRIES", 32)
+
+# Rendered paper PDFs, stored by content hash and rendered by PDF_WORKERS processes
+PDF_DIR = os.environ.get("PDF_DIR") or os.path.join(DATA_DIR, "pdfs")
+PDF_WORKERS = _env_int("PDF_WORKERS", 1)
+
+# Longest a status long poll (?wait=) is held open, in seconds
+STATUS_MAX_WAIT = _env_int("STATUS_MAX_WAIT", 30)
+
+# Lines of log kept per job for /logs, older ones are dropped
+JOB_LOG_LINES = _env_int("JOB_LOG_LINES", 500)
+
+# Pushed job events (/events, /ws), ids a reconnecting client can resume from are kept per job
+EVENT_HISTORY = _env_int("EVENT_HISTORY", 1000)
+# events a slow subscriber may fall behind by before it is cut off and has to reconnect
+EVENT_SUBSCRIBER_QUEUE = _env_int("EVENT_SUBSCRIBER_QUEUE", 500)
+# seconds between keep-alive comments on an idle event stream
+EVENT_KEEPALIVE = _env_int("EVENT_KEEPALIVE", 15)
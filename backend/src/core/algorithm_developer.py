@@ -1,26 +1,53 @@
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
+import asyncio
+from ..utils.context import ContextPacker
+from ..utils.tokens import prompt_budget
+
+# generate_text's default output limit, every call here uses it
+MAX_OUTPUT_TOKENS = 4096
+# the fixed instructions around the packed sections
+PROMPT_OVERHEAD_TOKENS = 400
+# about a full arXiv abstract
+ABSTRACT_TOKENS = 300
+
+# gets each piece of a response as it streams in
+TextCallback = Callable[[str], None]
 
 class AlgorithmDeveloper:
     """Designs and implements algorithms based on research directions"""
     
-    def __init__(self, ai_model):
+    def __init__(self, ai_model, vector_index=None):
         """Initialize the algorithm developer with an AI model client"""
         self.ai_model = ai_model
+        self.vector_index = vector_index
     
-    async def design_algorithm(self, research_direction: Dict[str, Any], papers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async def design_algorithm(
+        self,
+        research_direction: Dict[str, Any],
+        papers: List[Dict[str, Any]],
+        on_text: Optional[TextCallback] = None
+    ) -> Dict[str, Any]:
         """Design an algorithm based on the research direction and papers"""
         direction_text = research_direction.get("direction", "")
         
-        # summaries of papers
+        # papers closest to the direction itself, not just to the domain
+        if self.vector_index is not None and direction_text:
+            papers = await asyncio.to_thread(self.vector_index.blend, papers, direction_text, 5)
+        
+        # the top ranked papers, abstracts cut down to the sentences closest to the direction
+        packer = ContextPacker(self._budget(), query=direction_text).add("direction", direction_text, weight=2, query="")
+        for i, paper in enumerate(papers[:5]):
+            packer.add(f"paper{i}", paper.get("abstract", "N/A"), max_tokens=ABSTRACT_TOKENS)
+        context = packer.pack()
         papers_context = "\n".join([
-            f"- {paper.get('title')}: {paper.get('abstract', 'N/A')[:200]}..."
-            for paper in papers[:5]
+            f"- {paper.get('title')}: {context[f'paper{i}']}"
+            for i, paper in enumerate(papers[:5])
         ])
         
         prompt = f"""
         Based on this research direction:
         
-        {direction_text}
+        {context["direction"]}
         
         And considering these relevant papers:
         
@@ -36,15 +63,15 @@ class AlgorithmDeveloper:
         Format your response as a structured algorithm design document.
         """
         
-        design = await self.ai_model.generate_text(prompt, temperature=0.4)
+        design = await self.ai_model.generate_text(prompt, temperature=0.4, on_text=on_text)
         
         return {
             "design_document": design
         }
     
-    async def implement_algorithm(self, algorithm_design: Dict[str, Any]) -> Dict[str, Any]:
+    async def implement_algorithm(self, algorithm_design: Dict[str, Any], on_text: Optional[TextCallback] = None) -> Dict[str, Any]:
         """Implement the designed algorithm in code"""
-        design_doc = algorithm_design.get("design_document", "")
+        design_doc = ContextPacker(self._budget()).add("design", algorithm_design.get("design_document", "")).pack()["design"]
         
         prompt = f"""
         Based on this algorithm design:
@@ -61,16 +88,16 @@ class AlgorithmDeveloper:
         Format your response as Python code with appropriate documentation.
         """
         
-        implementation = await self.ai_model.generate_text(prompt, temperature=0.2)
+        implementation = await self.ai_model.generate_text(prompt, temperature=0.2, on_text=on_text)
         
         return {
             "code": implementation,
             "language": "python"
         }
     
-    async def evaluate_algorithm(self, implementation: Dict[str, Any]) -> Dict[str, Any]:
+    async def evaluate_algorithm(self, implementation: Dict[str, Any], on_text: Optional[TextCallback] = None) -> Dict[str, Any]:
         """Evaluate the implemented algorithm"""
-        code = implementation.get("code", "")
+        code = ContextPacker(self._budget()).add("code", implementation.get("code", ""), kind="code").pack()["code"]
         
         prompt = f"""
         Evaluate this algorithm implementation:
@@ -89,16 +116,27 @@ class AlgorithmDeveloper:
         Format your response as a structured evaluation report.
         """
         
-        evaluation = await self.ai_model.generate_text(prompt, temperature=0.3)
+        evaluation = await self.ai_model.generate_text(prompt, temperature=0.3, on_text=on_text)
         
         return {
             "evaluation_report": evaluation
         }
     
-    async def refine_algorithm(self, implementation: Dict[str, Any], evaluation: Dict[str, Any]) -> Dict[str, Any]:
+    async def refine_algorithm(
+        self,
+        implementation: Dict[str, Any],
+        evaluation: Dict[str, Any],
+        on_text: Optional[TextCallback] = None
+    ) -> Dict[str, Any]:
         """Refine the algorithm based on evaluation results"""
-        code = implementation.get("code", "")
-        report = evaluation.get("evaluation_report", "")
+        # the refined code is written out again in full, half the output is reserved for it
+        context = (
+            ContextPacker(self._budget())
+            .add("code", implementation.get("code", ""), weight=2, kind="code", max_tokens=MAX_OUTPUT_TOKENS // 2)
+            .add("report", evaluation.get("evaluation_report", ""))
+            .pack()
+        )
+        code, report = context["code"], context["report"]
         
         prompt = f"""
         Based on this algorithm implementation:
@@ -119,7 +157,7 @@ class AlgorithmDeveloper:
         Format your response with the improved Python code followed by the explanation.
         """
         
-        refinement = await self.ai_model.generate_text(prompt, temperature=0.2)
+        refinement = await self.ai_model.generate_text(prompt, temperature=0.2, on_text=on_text)
         
         # Split the response to extract code and explanation
         # improvement HERE
@@ -131,4 +169,7 @@ class AlgorithmDeveloper:
             "explanation": explanation,
             "language": "python"
         }
-    
\ No newline at end of file
+    
+    def _budget(self) -> int:
+        """Tokens the packed sections of a prompt may take"""
+        return prompt_budget(getattr(self.ai_model, "model", None), MAX_OUTPUT_TOKENS) - PROMPT_OVERHEAD_TOKENS
@@ -0,0 +1,180 @@
+import argparse
+import gzip
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..config import ARXIV_CORPUS_ENABLED, ARXIV_CORPUS_PATH
+from .arxiv_parser import iter_metadata_dump
+from ..utils.text import normalize_text
+from .ranking import STOPWORDS
+from .vector_index import paper_key
+
+# papers written per transaction while importing a dump
+IMPORT_BATCH = 2000
+# at most this many words of a query go into the full text search
+MAX_QUERY_TERMS = 16
+
+FIELDS = ("title", "authors", "abstract", "year", "url")
+WORD_RE = re.compile(r"\w+")
+
+
+class ArxivCorpus:
+    """Local copy of arXiv metadata with an FTS5 index over titles and abstracts
+
+    Every harvested page and every imported metadata dump is upserted by
+    arXiv id. Searches are ranked by FTS5's bm25 with titles counting
+    double. Each query harvested from arXiv is remembered with its time,
+    so the collector can tell which queries the corpus already answers.
+    """
+
+    def __init__(self, path: str = ARXIV_CORPUS_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS papers (
+                id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, title TEXT, authors TEXT,
+                abstract TEXT, year INTEGER, url TEXT, updated_at REAL NOT NULL);
+            CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+                title, abstract, content='papers', content_rowid='id', tokenize='porter unicode61');
+            -- external content table, the triggers keep the index in step with the rows
+            CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+                INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+            END;
+            CREATE TRIGGER IF NOT EXISTS papers_ad AFTER DELETE ON papers BEGIN
+                INSERT INTO papers_fts (papers_fts, rowid, title, abstract) VALUES ('delete', old.id, old.title, old.abstract);
+            END;
+            CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE ON papers BEGIN
+                INSERT INTO papers_fts (papers_fts, rowid, title, abstract) VALUES ('delete', old.id, old.title, old.abstract);
+                INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+            END;
+            CREATE TABLE IF NOT EXISTS queries (query TEXT PRIMARY KEY, harvested_at REAL NOT NULL);
+        """)
+        self._db.commit()
+
+    def add(self, papers: Iterable[Dict[str, Any]]) -> int:
+        """Insert papers or refresh the ones already stored, returns how many were written"""
+        rows = {}
+        now = time.time()
+        for paper in papers:
+            key = paper_key(paper)
+            if key and paper.get("abstract"):
+                rows[key] = (key,) + tuple(paper.get(field) for field in FIELDS) + (now,)
+        if not rows:
+            return 0
+        with self._lock:
+            try:
+                self._db.executemany(
+                    "INSERT INTO papers (key, title, authors, abstract, year, url, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                    "title = excluded.title, authors = excluded.authors, abstract = excluded.abstract, "
+                    "year = excluded.year, url = excluded.url, updated_at = excluded.updated_at",
+                    list(rows.values())
+                )
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+        return len(rows)
+
+    def import_dump(self, path: str) -> int:
+        """Load an arXiv Atom feed or OAI-PMH metadata dump (optionally gzipped), returns papers written"""
+        opener = gzip.open if path.endswith(".gz") else open
+        written = 0
+        batch = []
+        with opener(path, "rb") as f:
+            for paper in iter_metadata_dump(f):
+                batch.append(paper)
+                if len(batch) >= IMPORT_BATCH:
+                    written += self.add(batch)
+                    batch = []
+        return written + self.add(batch)
+
+    def search(self, query: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Papers matching any word of query, best bm25 match first"""
+        match = self._match_expression(query)
+        if match is None or limit <= 0:
+            return []
+        with self._lock:
+            # rank inside the index first, only the rows that make the cut are looked up
+            rows = self._db.execute(
+                "SELECT p.title, p.authors, p.abstract, p.year, p.url FROM ("
+                "SELECT rowid, bm25(papers_fts, 2.0, 1.0) AS score FROM papers_fts "
+                "WHERE papers_fts MATCH ? ORDER BY score LIMIT ?) hits "
+                "JOIN papers p ON p.id = hits.rowid ORDER BY hits.score",
+                (match, limit)
+            ).fetchall()
+        return [dict(zip(FIELDS, row), source="arXiv") for row in rows]
+
+    def mark_query(self, query: str):
+        """Remember that query was just harvested from arXiv"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO queries (query, harvested_at) VALUES (?, ?)",
+                (normalize_text(query), time.time())
+            )
+            self._db.commit()
+
+    def is_fresh(self, query: str, max_age: float) -> bool:
+        """Whether query was harvested within the last max_age seconds"""
+        if max_age <= 0:
+            return False
+        with self._lock:
+            row = self._db.execute(
+                "SELECT harvested_at FROM queries WHERE query = ?", (normalize_text(query),)
+            ).fetchone()
+        return row is not None and time.time() - row[0] <= max_age
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            papers = self._db.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+            queries = self._db.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+        return {"papers": papers, "queries": queries}
+
+    @staticmethod
+    def _match_expression(query: str) -> Optional[str]:
+        # every word quoted and OR-ed, so nothing in the query is read as FTS syntax
+        terms = []
+        for word in WORD_RE.findall(query.lower()):
+            if word not in STOPWORDS and word not in terms:
+                terms.append(word)
+        if not terms:
+            return None
+        return " OR ".join(f'"{term}"' for term in terms[:MAX_QUERY_TERMS])
+
+
+_arxiv_corpus: Optional[ArxivCorpus] = None
+
+
+def get_arxiv_corpus() -> Optional[ArxivCorpus]:
+    """Get the process-wide arXiv corpus, None when it is disabled"""
+    global _arxiv_corpus
+    if _arxiv_corpus is None and ARXIV_CORPUS_ENABLED:
+        _arxiv_corpus = ArxivCorpus()
+    return _arxiv_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import arXiv metadata dumps into the local corpus")
+    parser.add_argument("dumps", nargs="+", help="Atom feeds or OAI-PMH ListRecords files, .gz is fine")
+    parser.add_argument("--path", default=ARXIV_CORPUS_PATH, help="corpus database")
+    args = parser.parse_args()
+
+    corpus = ArxivCorpus(args.path)
+    for dump in args.dumps:
+        started = time.time()
+        written = corpus.import_dump(dump)
+        print(f"{dump}: {written} papers in {time.time() - started:.1f}s")
+    print(f"corpus now holds {corpus.stats()['papers']} papers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from urllib.parse import quote_plus
+
+import aiohttp
+
+from ..config import (
+    ARXIV_API_URL,
+    ARXIV_MAX_RESULTS_PER_QUERY,
+    ARXIV_PAGE_SIZE,
+    ARXIV_REQUESTS_PER_SECOND,
+    ARXIV_BURST,
+)
+from .arxiv_parser import ArxivFeedParser
+from ..utils.http import get_http_session
+from ..utils.rate_limit import RateLimiter
+from ..utils.singleflight import SingleFlight
+
+# concurrent jobs asking arXiv for the same page share one request
+_arxiv_inflight = SingleFlight()
+
+# arXiv asks API clients to go easy on it, this budget is shared by every job
+_arxiv_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_arxiv_inflight_stats() -> Dict[str, int]:
+    """Counters for coalesced arXiv requests"""
+    return _arxiv_inflight.stats()
+
+
+def get_arxiv_rate_limiter() -> RateLimiter:
+    """Get the process-wide politeness limiter for the arXiv API"""
+    global _arxiv_rate_limiter
+    if _arxiv_rate_limiter is None:
+        _arxiv_rate_limiter = RateLimiter(ARXIV_REQUESTS_PER_SECOND, burst=ARXIV_BURST)
+    return _arxiv_rate_limiter
+
+
+class ArxivHarvester:
+    """Runs many arXiv queries concurrently, paging through each of them"""
+
+    def __init__(
+        self,
+        base_url: str = ARXIV_API_URL,
+        max_results: int = ARXIV_MAX_RESULTS_PER_QUERY,
+        page_size: int = ARXIV_PAGE_SIZE,
+        rate_limiter: Optional[RateLimiter] = None,
+        session: Optional[aiohttp.ClientSession] = None
+    ):
+        """Initialize the harvester, defaults come from the app config"""
+        self.base_url = base_url
+        self.max_results = max_results
+        self.page_size = page_size
+        self.rate_limiter = rate_limiter or get_arxiv_rate_limiter()
+        self.session = session
+
+    async def harvest(self, queries: List[str], failed: Optional[Set[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield papers for all queries as pages come in, in no particular order
+
+        Queries arXiv couldn't answer in full are added to failed.
+        """
+        pages: asyncio.Queue = asyncio.Queue()
+        tasks = [asyncio.ensure_future(self._harvest_query(query, pages, failed)) for query in queries]
+        remaining = len(tasks)
+
+        try:
+            while remaining:
+                papers = await pages.get()
+                # None marks the end of one query
+                if papers is None:
+                    remaining -= 1
+                    continue
+                for paper in papers:
+                    yield paper
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _harvest_query(self, query: str, pages: asyncio.Queue, failed: Optional[Set[str]] = None):
+        """Page through one query, pushing each page onto the queue"""
+        try:
+            start = 0
+            while start < self.max_results:
+                page_size = min(self.page_size, self.max_results - start)
+                url = self._build_url(query, start, page_size)
+                papers = await _arxiv_inflight.do(url, lambda: self._fetch_page(url))
+                # the list is shared with other jobs, hand out our own copies
+                await pages.put([dict(paper) for paper in papers])
+                # a short page means arXiv has nothing more for this query
+                if len(papers) < page_size:
+                    break
+                start += page_size
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Error searching arXiv for '{query}': {e}")
+            if failed is not None:
+                failed.add(query)
+        finally:
+            pages.put_nowait(None)
+
+    async def _fetch_page(self, url: str) -> List[Dict[str, Any]]:
+        """Fetch and parse a single page of results"""
+        await self.rate_limiter.acquire()
+        session = self.session or get_http_session()
+
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise RuntimeError(f"arXiv returned HTTP {response.status} for {url}")
+            # parse while the body streams in rather than holding the whole document
+            parser = ArxivFeedParser()
+            papers = []
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                papers.extend(parser.feed(chunk))
+            papers.extend(parser.close())
+
+        return papers
+
+    def _build_url(self, query: str, start: int, page_size: int) -> str:
+        return f"{self.base_url}?search_query={quote_plus('all:' + query)}&start={start}&max_results={page_size}"
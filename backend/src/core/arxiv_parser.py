@@ -0,0 +1,150 @@
+import re
+from typing import IO, Any, Dict, Iterable, Iterator, List, Union
+
+from lxml import etree
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+ENTRY = ATOM + "entry"
+TITLE = ATOM + "title"
+SUMMARY = ATOM + "summary"
+AUTHOR = ATOM + "author"
+NAME = ATOM + "name"
+ID = ATOM + "id"
+PUBLISHED = ATOM + "published"
+
+# OAI-PMH metadata dumps, in arXiv's own format or Dublin Core
+OAI_ARXIV = "{http://arxiv.org/OAI/arXiv/}"
+OAI_DC = "{http://www.openarchives.org/OAI/2.0/oai_dc/}dc"
+DC = "{http://purl.org/dc/elements/1.1/}"
+
+YEAR_RE = re.compile(r'(\d{4})')
+
+
+class ArxivFeedParser:
+    """Incremental arXiv Atom parser, feed it bytes and read papers out entry by entry"""
+
+    def __init__(self):
+        self._parser = etree.XMLPullParser(events=("end",), tag=ENTRY, resolve_entities=False, huge_tree=True)
+
+    def feed(self, data: Union[bytes, str]) -> List[Dict[str, Any]]:
+        """Feed the next chunk, returns papers whose entries are now complete"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._parser.feed(data)
+        return list(self._read())
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Finish the document, returns any papers left over"""
+        self._parser.close()
+        return list(self._read())
+
+    def _read(self) -> Iterator[Dict[str, Any]]:
+        for _, entry in self._parser.read_events():
+            yield _entry_to_paper(entry)
+            # drop the entry and everything before it so memory stays flat
+            entry.clear()
+            parent = entry.getparent()
+            if parent is not None:
+                while entry.getprevious() is not None:
+                    del parent[0]
+
+
+def _entry_to_paper(entry) -> Dict[str, Any]:
+    title = None
+    abstract = None
+    url = ""
+    year = None
+    authors = []
+
+    # one pass over the children instead of a find() per field
+    for child in entry:
+        tag = child.tag
+        if tag == AUTHOR:
+            name = child.findtext(NAME)
+            if name:
+                authors.append(name)
+        elif tag == TITLE:
+            title = child.text
+        elif tag == SUMMARY:
+            abstract = child.text
+        elif tag == ID:
+            url = child.text or ""
+        elif tag == PUBLISHED and child.text:
+            year_match = YEAR_RE.search(child.text)
+            if year_match:
+                year = int(year_match.group(1))
+
+    return {
+        "title": title.strip() if title else "No Title",
+        "authors": ", ".join(authors),
+        "abstract": abstract.strip() if abstract else "",
+        "year": year,
+        "url": url,
+        "source": "arXiv"
+    }
+
+
+def parse_arxiv_feed(data: Union[bytes, str, Iterable[bytes]]) -> List[Dict[str, Any]]:
+    """Parse a whole arXiv Atom response (or an iterable of chunks) into paper dicts"""
+    parser = ArxivFeedParser()
+    papers = []
+    chunks = [data] if isinstance(data, (bytes, str)) else data
+    for chunk in chunks:
+        papers.extend(parser.feed(chunk))
+    papers.extend(parser.close())
+    return papers
+
+
+def _oai_arxiv_to_paper(record) -> Dict[str, Any]:
+    authors = []
+    for author in record.iter(OAI_ARXIV + "author"):
+        name = " ".join(filter(None, (author.findtext(OAI_ARXIV + "forenames"), author.findtext(OAI_ARXIV + "keyname"))))
+        if name:
+            authors.append(name)
+    arxiv_id = (record.findtext(OAI_ARXIV + "id") or "").strip()
+    year_match = YEAR_RE.search(record.findtext(OAI_ARXIV + "created") or "")
+    title = record.findtext(OAI_ARXIV + "title")
+    abstract = record.findtext(OAI_ARXIV + "abstract")
+    return {
+        "title": " ".join(title.split()) if title else "No Title",
+        "authors": ", ".join(authors),
+        "abstract": abstract.strip() if abstract else "",
+        "year": int(year_match.group(1)) if year_match else None,
+        "url": f"http://arxiv.org/abs/{arxiv_id}" if arxiv_id else "",
+        "source": "arXiv"
+    }
+
+
+def _oai_dc_to_paper(record) -> Dict[str, Any]:
+    url = next((text for text in (e.text or "" for e in record.iter(DC + "identifier")) if "arxiv.org/abs/" in text), "")
+    year_match = YEAR_RE.search(record.findtext(DC + "date") or "")
+    title = record.findtext(DC + "title")
+    abstract = record.findtext(DC + "description")
+    return {
+        "title": " ".join(title.split()) if title else "No Title",
+        "authors": ", ".join(e.text for e in record.iter(DC + "creator") if e.text),
+        "abstract": abstract.strip() if abstract else "",
+        "year": int(year_match.group(1)) if year_match else None,
+        "url": url.strip(),
+        "source": "arXiv"
+    }
+
+
+def iter_metadata_dump(source: Union[str, IO[bytes]]) -> Iterator[Dict[str, Any]]:
+    """Papers of an arXiv metadata dump read as a stream, an Atom feed or OAI-PMH records
+
+    OAI records may be in the arXiv or the oai_dc format, deleted records
+    carry no metadata and are skipped.
+    """
+    converters = {ENTRY: _entry_to_paper, OAI_ARXIV + "arXiv": _oai_arxiv_to_paper, OAI_DC: _oai_dc_to_paper}
+    for _, element in etree.iterparse(source, events=("end",), tag=list(converters),
+                                      resolve_entities=False, huge_tree=True):
+        yield converters[element.tag](element)
+        # same as the feed parser, but OAI records are nested deeper so every level is pruned
+        element.clear()
+        node = element
+        while node.getparent() is not None:
+            parent = node.getparent()
+            while node.getprevious() is not None:
+                del parent[0]
+            node = parent
@@ -0,0 +1,211 @@
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from ..utils.text import mix64, normalize_text
+
+# new style ids (2101.00001) and old style ones (hep-th/9901001), version suffix dropped
+ARXIV_ID_RE = re.compile(
+    r'(?:arxiv\.org/(?:abs|pdf)/|arxiv:\s*)?'
+    r'(\d{4}\.\d{4,5}|[a-z][a-z\-]*(?:\.[a-z]{2})?/\d{7})(?:v\d+)?(?:\.pdf)?\b',
+    re.IGNORECASE
+)
+
+MASK64 = np.iinfo(np.uint64).max
+GOLDEN64 = np.uint64(0x9E3779B97F4A7C15)
+
+# fields a duplicate may fill in on the paper we keep
+MERGE_FIELDS = ("abstract", "authors", "year", "url")
+
+
+def canonical_arxiv_id(paper: Dict[str, Any]) -> Optional[str]:
+    """Version-less arXiv id of a paper, if its url or id field has one"""
+    for field in ("arxiv_id", "url", "id"):
+        value = paper.get(field)
+        if not value:
+            continue
+        value = str(value)
+        # bare "2101.00001v2" style values or anything pointing at arxiv.org
+        if field == "arxiv_id" or "arxiv" in value.lower():
+            match = ARXIV_ID_RE.search(value)
+            if match:
+                return match.group(1).lower()
+    return None
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH near-duplicate detection over paper titles and abstracts
+
+    Papers are first matched exactly on canonical arXiv id and normalized
+    title. Then character shingles of the normalized title and of the start
+    of the abstract get one-permutation MinHash signatures (vectorized with
+    NumPy, so each shingle is hashed once rather than once per hash function),
+    which are banded into LSH buckets. Bucket candidates whose estimated
+    Jaccard similarity clears the threshold are merged. Everything is linear
+    in the number of papers.
+    """
+
+    def __init__(
+        self,
+        num_perm: int = 32,
+        bands: int = 8,
+        shingle_size: int = 5,
+        title_threshold: float = 0.7,
+        abstract_threshold: float = 0.8,
+        abstract_chars: int = 200,
+        seed: int = 1
+    ):
+        if num_perm & (num_perm - 1) or num_perm % bands:
+            raise ValueError("num_perm must be a power of two and a multiple of bands")
+        if not 1 <= shingle_size <= 8:
+            raise ValueError("shingle_size must be between 1 and 8")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.title_threshold = title_threshold
+        self.abstract_threshold = abstract_threshold
+        self.abstract_chars = abstract_chars
+
+        rng = np.random.default_rng(seed)
+        self._seed = rng.integers(0, 2**63, dtype=np.uint64)
+        self._band_mix = rng.integers(1, 2**63, size=num_perm // bands, dtype=np.uint64) | np.uint64(1)
+
+    def deduplicate(self, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep the first paper of every duplicate group, filling its gaps from the others"""
+        groups = self.find_groups(papers)
+        unique_papers = []
+        for group in groups:
+            keeper = papers[group[0]]
+            for index in group[1:]:
+                for field in MERGE_FIELDS:
+                    if not keeper.get(field) and papers[index].get(field):
+                        keeper[field] = papers[index][field]
+            unique_papers.append(keeper)
+        return unique_papers
+
+    def find_groups(self, papers: List[Dict[str, Any]]) -> List[List[int]]:
+        """Indices of duplicate groups, ordered by first occurrence"""
+        n = len(papers)
+        parent = list(range(n))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i: int, j: int):
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                # the earlier paper always ends up as the root
+                parent[max(ri, rj)] = min(ri, rj)
+
+        titles = [normalize_text(paper.get("title")) for paper in papers]
+        # twice the budget before normalizing leaves room for stripped punctuation
+        abstracts = [
+            normalize_text((paper.get("abstract") or "")[:2 * self.abstract_chars])[:self.abstract_chars]
+            for paper in papers
+        ]
+
+        # exact keys first, they are cheap and catch arXiv versions
+        seen: Dict[Any, int] = {}
+        for i, paper in enumerate(papers):
+            arxiv_id = canonical_arxiv_id(paper)
+            for key in (("id", arxiv_id), ("title", titles[i])):
+                if not key[1]:
+                    continue
+                if key in seen:
+                    union(i, seen[key])
+                else:
+                    seen[key] = i
+
+        title_rows = [i for i in range(n) if titles[i]]
+        for i, j in self._similar_pairs([titles[i] for i in title_rows], self.title_threshold):
+            union(title_rows[i], title_rows[j])
+
+        # very short abstracts say nothing about identity
+        abstract_rows = [i for i in range(n) if len(abstracts[i]) >= 50]
+        for i, j in self._similar_pairs([abstracts[i] for i in abstract_rows], self.abstract_threshold):
+            union(abstract_rows[i], abstract_rows[j])
+
+        groups: Dict[int, List[int]] = {}
+        for i in range(n):
+            # papers without a title can't be cited, drop them
+            if not papers[i].get("title"):
+                continue
+            groups.setdefault(find(i), []).append(i)
+        return list(groups.values())
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """MinHash signature matrix of shape (len(texts), num_perm)"""
+        k = self.shingle_size
+        # pad so every text has at least one shingle
+        encoded = [text.encode("utf-8").ljust(k) for text in texts]
+        lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+        # padded so the 8 byte read at the last offset stays inside the buffer
+        buf = np.frombuffer(b"".join(encoded) + bytes(8), dtype=np.uint8)
+
+        # shingle value = its k bytes packed into an integer: an unaligned uint64 view
+        # starting at every offset, masked down to k bytes
+        count = len(buf) - 8 - k + 1
+        windows = as_strided(buf[:8].view(np.uint64), shape=(count,), strides=(1,))
+        shingles = windows & np.uint64((1 << (8 * k)) - 1)
+
+        # drop shingles that straddle two texts
+        if k > 1:
+            ends = np.cumsum(lengths)
+            valid = np.ones(count, dtype=bool)
+            for j in range(1, k):
+                valid[ends[:-1] - j] = False
+            shingles = shingles[valid]
+        # every (padded) text has exactly len - k + 1 shingles of its own
+        docs = np.repeat(np.arange(len(texts)), lengths - k + 1)
+
+        with np.errstate(over="ignore"):
+            hashed = mix64(shingles ^ self._seed)
+        # top bits pick the bin, the rest is the value competing for the bin minimum
+        bin_bits = self.num_perm.bit_length() - 1
+        bins = (hashed >> np.uint64(64 - bin_bits)).astype(np.int64)
+        values = hashed & np.uint64((1 << (64 - bin_bits)) - 1)
+
+        signatures = np.full(len(texts) * self.num_perm, MASK64, dtype=np.uint64)
+        np.minimum.at(signatures, docs * self.num_perm + bins, values)
+        return self._densify(signatures.reshape(len(texts), self.num_perm))
+
+    def _densify(self, signatures: np.ndarray) -> np.ndarray:
+        """Fill empty bins from the next non-empty bin to the right, wrapping around"""
+        k = self.num_perm
+        columns = np.arange(k)
+        filled = signatures != MASK64
+        never = 4 * k
+        positions = np.concatenate(
+            [np.where(filled, columns, never), np.where(filled, columns + k, never)], axis=1
+        )
+        source = np.minimum.accumulate(positions[:, ::-1], axis=1)[:, ::-1][:, :k]
+        dense = np.take_along_axis(np.concatenate([signatures, signatures], axis=1), source, axis=1)
+        # offset borrowed values by distance so they don't collide with real ones
+        with np.errstate(over="ignore"):
+            return dense + (source - columns).astype(np.uint64) * GOLDEN64
+
+    def _similar_pairs(self, texts: List[str], threshold: float) -> List[tuple]:
+        """Pairs (i, j) of texts whose estimated Jaccard similarity is >= threshold"""
+        if len(texts) < 2:
+            return []
+        sig = self.signatures(texts)
+        rows = self.num_perm // self.bands
+        pairs = []
+        with np.errstate(over="ignore"):
+            for band in range(self.bands):
+                keys = (sig[:, band * rows:(band + 1) * rows] * self._band_mix).sum(axis=1)
+                _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+                representative = first[inverse]
+                candidates = np.nonzero(representative != np.arange(len(texts)))[0]
+                if not len(candidates):
+                    continue
+                # each bucket member is checked against the bucket's first member
+                similarity = (sig[candidates] == sig[representative[candidates]]).mean(axis=1)
+                matched = candidates[similarity >= threshold]
+                pairs.extend(zip(representative[matched].tolist(), matched.tolist()))
+        return pairs
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+from ..config import (
+    ENRICHMENT_BATCH_SIZE,
+    ENRICHMENT_BATCH_TOKENS,
+    ENRICHMENT_MAX_PAPERS,
+    ENRICHMENT_RETRIES,
+)
+from ..models.gemini import GeminiError
+from ..utils.tokens import estimate_tokens
+
+# longer abstracts are cut, the first paragraph says what the paper is about
+ABSTRACT_CHARS = 1500
+# output budget per paper in a batch, the answer is a few short fields
+TOKENS_PER_PAPER = 150
+
+JSON_ARRAY = re.compile(r"\[.*\]", re.S)
+
+
+class PaperEnricher:
+    """Topics, contribution, applications and a relevance rating for each paper
+
+    Papers are packed into prompts of up to batch_size papers and
+    batch_tokens tokens. The model answers each prompt with a JSON array
+    keyed by the papers' numbers in it. Items that are missing or malformed
+    go round again up to `retries` times, in half as big batches at a higher
+    temperature (the same prompt would get the same cached answer). A call
+    that failed was already retried by the client, its papers are given up
+    and no further round is started. All batches of a round run at once.
+    """
+
+    def __init__(
+        self,
+        ai_model,
+        max_papers: int = ENRICHMENT_MAX_PAPERS,
+        batch_size: int = ENRICHMENT_BATCH_SIZE,
+        batch_tokens: int = ENRICHMENT_BATCH_TOKENS,
+        retries: int = ENRICHMENT_RETRIES
+    ):
+        self.ai_model = ai_model
+        self.max_papers = max_papers
+        self.batch_size = max(batch_size, 1)
+        self.batch_tokens = batch_tokens
+        self.retries = retries
+
+    async def enrich(self, papers: List[Dict[str, Any]], domain: str) -> Dict[str, int]:
+        """Fill in the fields of the first max_papers papers in place, returns counts of what it took
+
+        Each enriched paper gets `topics`, `contribution`, `applications` and
+        `llm_relevance` (0 to 1). Papers that still fail after the retries
+        are left as they are.
+        """
+        pending = [
+            paper for paper in papers[:self.max_papers]
+            if paper.get("title") and paper.get("abstract") and "llm_relevance" not in paper
+        ]
+        wanted = len(pending)
+        requests = 0
+        given_up = 0
+        for attempt in range(self.retries + 1):
+            if not pending:
+                break
+            batches = self._batches(pending, max(self.batch_size >> attempt, 1))
+            requests += len(batches)
+            temperature = 0.2 + 0.2 * attempt
+            results = await asyncio.gather(*[self._enrich_batch(batch, domain, temperature) for batch in batches])
+            calls_failed = sum(failed is None for failed in results)
+            given_up += sum(len(batch) for batch, failed in zip(batches, results) if failed is None)
+            pending = [paper for failed in results if failed is not None for paper in failed]
+            if calls_failed:
+                # Gemini is pushing back, more calls would only make that worse
+                logging.warning(f"Enrichment: {calls_failed} of {len(batches)} calls failed, stopping")
+                given_up += len(pending)
+                pending = []
+                break
+            if pending and attempt < self.retries:
+                logging.info(f"Enrichment: retrying {len(pending)} papers")
+        given_up += len(pending)
+        if given_up:
+            logging.warning(f"Enrichment: gave up on {given_up} papers")
+        return {"papers": wanted, "enriched": wanted - given_up, "requests": requests}
+
+    def _batches(self, papers: List[Dict[str, Any]], batch_size: int) -> List[List[Dict[str, Any]]]:
+        """Consecutive runs of papers within the size and token budgets"""
+        batches = []
+        current, current_tokens = [], 0
+        for paper in papers:
+            tokens = estimate_tokens(self._paper_text(0, paper))
+            if current and (len(current) >= batch_size or current_tokens + tokens > self.batch_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(paper)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _enrich_batch(
+        self, papers: List[Dict[str, Any]], domain: str, temperature: float
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Enrich one batch, returns the papers the answer left out or got wrong, None when the call failed"""
+        papers_context = "\n\n".join(self._paper_text(i, paper) for i, paper in enumerate(papers))
+        prompt = f"""
+        For each of these papers from the field "{domain}":
+
+        {papers_context}
+
+        Return a JSON array with one object per paper and nothing else, no commentary:
+        [{{"index": <the paper's number>, "topics": [3 to 5 short key topics],
+          "contribution": "<the main contribution, one sentence>",
+          "applications": [1 to 3 short potential applications],
+          "relevance": <how relevant the paper is to "{domain}", 0 to 10>}}]
+        """
+
+        try:
+            text = await self.ai_model.generate_text(
+                prompt, temperature=temperature, max_tokens=TOKENS_PER_PAPER * len(papers) + 200
+            )
+        except GeminiError as e:
+            logging.warning(f"Enrichment batch of {len(papers)} papers failed: {e}")
+            return None
+
+        items = self._parse(text, len(papers))
+        failed = []
+        for i, paper in enumerate(papers):
+            fields = items.get(i + 1)
+            if fields is None:
+                failed.append(paper)
+            else:
+                paper.update(fields)
+        return failed
+
+    @classmethod
+    def _parse(cls, text: str, count: int) -> Dict[int, Dict[str, Any]]:
+        """Valid items of a response by paper number, anything unusable is left out"""
+        match = JSON_ARRAY.search(text or "")
+        if match is None:
+            return {}
+        try:
+            items = json.loads(match.group(0))
+        except ValueError:
+            return {}
+        if not isinstance(items, list):
+            return {}
+
+        parsed = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            index = item.get("index")
+            if not isinstance(index, int) or not 1 <= index <= count:
+                continue
+            fields = cls._validate(item)
+            if fields is not None:
+                parsed[index] = fields
+        return parsed
+
+    @staticmethod
+    def _validate(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        topics = item.get("topics")
+        contribution = item.get("contribution")
+        applications = item.get("applications")
+        relevance = item.get("relevance")
+        # a lone application comes back as a string often enough to allow it
+        if isinstance(applications, str):
+            applications = [applications]
+        if not (isinstance(topics, list) and topics and all(isinstance(t, str) for t in topics)):
+            return None
+        if not (isinstance(contribution, str) and contribution.strip()):
+            return None
+        if not (isinstance(applications, list) and all(isinstance(a, str) for a in applications)):
+            return None
+        if isinstance(relevance, bool) or not isinstance(relevance, (int, float)):
+            return None
+        return {
+            "topics": [topic.strip() for topic in topics if topic.strip()][:5],
+            "contribution": contribution.strip(),
+            "applications": [application.strip() for application in applications if application.strip()][:3],
+            "llm_relevance": round(min(max(relevance / 10, 0.0), 1.0), 2),
+        }
+
+    @staticmethod
+    def _paper_text(i: int, paper: Dict[str, Any]) -> str:
+        return f"[{i+1}] {paper.get('title')}\n{(paper.get('abstract') or '')[:ABSTRACT_CHARS]}"
@@ -1,51 +1,86 @@
 from typing import List, Dict, Any, Optional
-import aiohttp
-import re
-from bs4 import BeautifulSoup
+import asyncio
+import logging
+import time
+from .arxiv_corpus import ArxivCorpus
+from .arxiv_harvester import ArxivHarvester
+from .dedup import NearDuplicateIndex
+from .enrichment import PaperEnricher
+from .ranking import PaperRanker
+from .vector_index import PaperVectorIndex
+from ..models.gemini import GeminiError
+from ..config import (
+    ARXIV_CORPUS_OFFLINE,
+    ARXIV_CORPUS_RESULTS,
+    ARXIV_CORPUS_TTL,
+    ENRICHMENT_ENABLED,
+    VECTOR_INDEX_DOMAIN_TTL,
+    VECTOR_INDEX_LOCAL_RESULTS,
+)
 
 class LiteratureCollector:
     """Collects relevant research papers from various academic sources"""
     
-    def __init__(self, ai_model):
+    def __init__(self, ai_model, harvester: Optional[ArxivHarvester] = None,
+                 vector_index: Optional[PaperVectorIndex] = None, enricher: Optional[PaperEnricher] = None,
+                 corpus: Optional[ArxivCorpus] = None):
         """Initialize the literature collector with an AI model client"""
         self.ai_model = ai_model
-        self.session = None
+        self.harvester = harvester or ArxivHarvester()
+        self.vector_index = vector_index
+        self.corpus = corpus
+        self.dedup_index = NearDuplicateIndex()
+        self.ranker = PaperRanker()
+        if enricher is None and ENRICHMENT_ENABLED:
+            enricher = PaperEnricher(ai_model)
+        self.enricher = enricher
     
     async def gather_papers(self, domain: str, seed_papers: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Gather relevant research papers based on domain and optional seed papers"""
-        # api calling
-        self.session = aiohttp.ClientSession()
+        collected_papers = []
         
-        try:
-            collected_papers = []
+        # seed papers
+        if seed_papers and len(seed_papers) > 0:
+            collected_papers.extend(seed_papers)
             
-            # seed papers
-            if seed_papers and len(seed_papers) > 0:
-                collected_papers.extend(seed_papers)
-                
+        # domains we harvested recently are already in the local index, no need to go out
+        from_index = self.vector_index is not None and await asyncio.to_thread(
+            self.vector_index.is_fresh_domain, domain, VECTOR_INDEX_DOMAIN_TTL
+        )
+        
+        if from_index:
+            query = " ".join([domain] + [paper.get("title", "") for paper in seed_papers or []])
+            local_papers = await asyncio.to_thread(self.vector_index.search, query, VECTOR_INDEX_LOCAL_RESULTS)
+            logging.info(f"Domain '{domain}' is in the local index, retrieved {len(local_papers)} papers without arXiv")
+            collected_papers.extend(local_papers)
+        else:
             search_queries = await self._generate_search_queries(domain, seed_papers)
             
             # academia databasse, this is the only open source lol
-            arxiv_papers = await self._search_arxiv(search_queries, max_results=20)
+            arxiv_papers = await self._search_arxiv(search_queries)
             collected_papers.extend(arxiv_papers)
-            
-            # maybe we can add libgem ? :devil:
-            #  all these for future:
-            # google_scholar_papers = await self._search_google_scholar(search_queries)
-            # ieee_papers = await self._search_ieee(search_queries)
-            # collected_papers.extend(google_scholar_papers)
-            # collected_papers.extend(ieee_papers)
-            
-            unique_papers = await self._deduplicate_papers(collected_papers)
-            
-            
-            enriched_papers = await self._enrich_papers(unique_papers)
-            
-            return enriched_papers
-            
-        finally:
-            if self.session:
-                await self.session.close()
+        
+        # maybe we can add libgem ? :devil:
+        #  all these for future:
+        # google_scholar_papers = await self._search_google_scholar(search_queries)
+        # ieee_papers = await self._search_ieee(search_queries)
+        # collected_papers.extend(google_scholar_papers)
+        # collected_papers.extend(ieee_papers)
+        
+        unique_papers = await self._deduplicate_papers(collected_papers)
+        
+        if self.vector_index is not None and not from_index:
+            added = await asyncio.to_thread(self.vector_index.add, unique_papers)
+            await asyncio.to_thread(self.vector_index.mark_domain, domain, len(unique_papers))
+            logging.info(f"Added {added} new papers to the local index")
+        
+        # best first, every later stage only reads the top of this list. thousands of papers
+        # take a good part of a second to rank, that runs on a thread and not on the loop
+        ranked_papers = await asyncio.to_thread(self.ranker.rank, unique_papers, domain, seed_papers=seed_papers)
+        
+        enriched_papers = await self._enrich_papers(ranked_papers, domain, seed_papers)
+        
+        return enriched_papers
     
     async def _generate_search_queries(self, domain: str, seed_papers: List[Dict[str, Any]] = None) -> List[str]:
         """Generate effective search queries based on domain and seed papers"""
@@ -64,121 +99,80 @@ class LiteratureCollector:
         Return only the list of search queries, one per line.
         """
         
-        response = await self.ai_model.generate_text(prompt, temperature=0.3)
+        try:
+            response = await self.ai_model.generate_text(prompt, temperature=0.3)
+        except GeminiError as e:
+            # the domain alone still finds papers, losing the job over this would be worse
+            logging.warning(f"Couldn't generate search queries, searching the domain only: {e}")
+            return [domain, f"{domain} recent advances", f"{domain} state of the art"]
         
         queries = [line.strip() for line in response.strip().split('\n') if line.strip()]
         queries.append(domain)
         
         return queries
     
-    async def _search_arxiv(self, queries: List[str], max_results: int = 10) -> List[Dict[str, Any]]:
-        """Search arXiv for papers matching the queries"""
-        all_papers = []
+    async def _search_arxiv(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """Search arXiv for papers matching the queries
+
+        With a local corpus, queries harvested within ARXIV_CORPUS_TTL are
+        answered from it, the rest go to arXiv and what comes back is added
+        to it. Queries arXiv fails on fall back to the corpus too.
+        """
+        if self.corpus is None:
+            return [paper async for paper in self.harvester.harvest(queries)]
+        
+        if ARXIV_CORPUS_OFFLINE:
+            local, remote = list(queries), []
+        else:
+            fresh = await asyncio.to_thread(lambda: [self.corpus.is_fresh(query, ARXIV_CORPUS_TTL) for query in queries])
+            local = [query for query, is_fresh in zip(queries, fresh) if is_fresh]
+            remote = [query for query, is_fresh in zip(queries, fresh) if not is_fresh]
+        
+        papers = []
+        if remote:
+            failed = set()
+            papers = [paper async for paper in self.harvester.harvest(remote, failed=failed)]
+            await asyncio.to_thread(self._store_harvest, papers, [query for query in remote if query not in failed])
+            if failed:
+                logging.warning(f"arXiv failed on {len(failed)} queries, searching the local corpus for them")
+                local.extend(failed)
         
+        if local:
+            started = time.time()
+            found = await asyncio.to_thread(
+                lambda: [paper for query in local for paper in self.corpus.search(query, ARXIV_CORPUS_RESULTS)]
+            )
+            logging.info(
+                f"Local corpus answered {len(local)} queries with {len(found)} papers in {time.time() - started:.3f} seconds"
+            )
+            papers.extend(found)
+        return papers
+    
+    def _store_harvest(self, papers: List[Dict[str, Any]], queries: List[str]):
+        self.corpus.add(papers)
         for query in queries:
-            try:
-                # Encode query for URL
-                encoded_query = query.replace(' ', '+')
-                url = f"http://export.arxiv.org/api/query?search_query=all:{encoded_query}&start=0&max_results={max_results}"
-                
-                async with self.session.get(url) as response:
-                    if response.status != 200:
-                        continue
-                    
-                    data = await response.text()
-                    soup = BeautifulSoup(data, 'xml')
-                    
-                    entries = soup.find_all('entry')
-                    for entry in entries:
-                        title_elem = entry.find('title')
-                        authors_elem = entry.findAll('author')
-                        abstract_elem = entry.find('summary')
-                        published_elem = entry.find('published')
-                        
-                        # Extract data if elements exist
-                        title = title_elem.text.strip() if title_elem else "No Title"
-                        authors = ", ".join([author.find('name').text for author in authors_elem if author.find('name')])
-                        abstract = abstract_elem.text.strip() if abstract_elem else ""
-                        
-                        # Extract year from published date
-                        year = None
-                        if published_elem:
-                            year_match = re.search(r'(\d{4})', published_elem.text)
-                            if year_match:
-                                year = int(year_match.group(1))
-                        
-                        paper = {
-                            "title": title,
-                            "authors": authors,
-                            "abstract": abstract,
-                            "year": year,
-                            "url": entry.find('id').text if entry.find('id') else "",
-                            "source": "arXiv"
-                        }
-                        
-                        all_papers.append(paper)
-                        
-            except Exception as e:
-                print(f"Error searching arXiv: {str(e)}")
-                continue
-        
-        return all_papers
+            self.corpus.mark_query(query)
     
     async def _deduplicate_papers(self, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Remove duplicate papers based on title similarity"""
+        """Remove duplicate papers: same arXiv id, or near-identical title or abstract"""
         if not papers:
             return []
-            
-        unique_papers = []
-        seen_titles = set()
-        
-        for paper in papers:
-            title = paper.get("title", "").lower()
-            # Simple deduplication based on exact title match
-            # IMPROVEMENT here
-            if title and title not in seen_titles:
-                seen_titles.add(title)
-                unique_papers.append(paper)
-                
-        return unique_papers
+        
+        # seed papers come first, so they are the ones kept and get filled in from arXiv.
+        # tens of milliseconds per thousand papers, on a thread so the loop keeps going meanwhile
+        return await asyncio.to_thread(self.dedup_index.deduplicate, papers)
     
-    async def _enrich_papers(self, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Enrich papers with additional metadata and analysis using AI"""
-        # enriched_papers = []
-        
-        # for paper in papers:
-        #     try:
-        #         # Skip papers that don't have basic information
-        #         if not paper.get('title') or not paper.get('abstract'):
-        #             continue
-                
-        #         prompt = f"""
-        #         Based on this paper:
-        #         Title: {paper['title']}
-        #         Abstract: {paper['abstract']}
-                
-        #         Provide the following in JSON format:
-        #         1. A list of 3-5 key topics covered
-        #         2. The main research contribution
-        #         3. Potential applications
-        #         Keep each response very brief.
-        #         """
-                
-        #         enrichment = await self.ai_model.generate_text(prompt, temperature=0.3)
-                
-        #         paper['enriched_metadata'] = enrichment
-                
-        #         # Add relevance score (placeholder for future implementation)
-        #         paper['relevance_score'] = 1.0
-                
-        #         enriched_papers.append(paper)
-                
-        #     except Exception as e:
-        #         print(f"Error enriching paper {paper.get('title')}: {str(e)}")
-        #         enriched_papers.append(paper)  
-        
-        
-        #  LMFAO THAT IMPLEMENTATION breaks the API bruh
-        return papers
-                
-        # return enriched_papers
+    async def _enrich_papers(self, papers: List[Dict[str, Any]], domain: str,
+                             seed_papers: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Tag the top papers with topics, contribution, applications and a relevance rating, then rank again"""
+        if self.enricher is None or not papers:
+            return papers
+        
+        started = time.time()
+        counts = await self.enricher.enrich(papers, domain)
+        logging.info(
+            f"Enriched {counts['enriched']} of {counts['papers']} papers with {counts['requests']} requests "
+            f"in {time.time() - started:.2f} seconds"
+        )
+        # the ratings and topics move papers within the top, the ranking is cheap to redo
+        return await asyncio.to_thread(self.ranker.rank, papers, domain, seed_papers=seed_papers)
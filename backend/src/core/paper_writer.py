@@ -1,11 +1,49 @@
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional, Tuple
+import asyncio
+import re
+from ..config import PAPER_SECTIONED
+from ..utils.context import ContextPacker
+from ..utils.tokens import estimate_tokens, prompt_budget
+
+PAPER_MAX_TOKENS = 9000
+# the fixed instructions around the packed sections
+PROMPT_OVERHEAD_TOKENS = 800
+# what the title prompt gets to see of the direction and design
+TITLE_CONTEXT_TOKENS = 1200
+OUTLINE_MAX_TOKENS = 1500
+# a fenced block in a model reply, the refinement comes with its code in one and prose around it
+FENCED_CODE = re.compile(r"```[^\n`]*\n(.*?)```", re.S)
+
+# sections written in parallel once the outline is there:
+# heading, what it covers, weight of each source in its prompt, output tokens
+PAPER_SECTIONS = [
+    ("Introduction", "Motivate the problem, state the research gap it addresses and list the contributions.",
+     {"direction": 2, "design": 1, "references": 0.5}, 1200),
+    ("Related Work", "Discuss the prior work among the references, citing it as [n], and how this work differs from it.",
+     {"references": 2, "direction": 1}, 1200),
+    ("Methodology", "Describe the approach and the algorithm in detail, with equations and pseudocode where they help.",
+     {"design": 2, "direction": 1}, 2000),
+    ("Implementation", "Explain how the implementation realizes the method: its structure, key functions and choices. "
+     "Do not reproduce the code, the complete listing is appended right after this section as Listing 1.",
+     {"code": 2, "design": 1}, 1500),
+    ("Evaluation", "Present the experimental setup, the results and a discussion of what they show.",
+     {"evaluation": 2, "code": 0.5}, 1800),
+    ("Conclusion", "Summarize the contributions and findings, then limitations and future work.",
+     {"direction": 1, "evaluation": 1}, 800),
+]
+
+# called with a section's name and markdown as soon as it is written
+SectionCallback = Callable[[str, str], None]
+# called with a section's name and each piece of it as it streams in
+PartCallback = Callable[[str, str], None]
 
 class PaperWriter:
     """Generates research papers based on findings and implementations"""
     
-    def __init__(self, ai_model):
+    def __init__(self, ai_model, sectioned: bool = PAPER_SECTIONED):
         """Initialize the paper writer with an AI model client"""
         self.ai_model = ai_model
+        self.sectioned = sectioned
     
     async def generate_paper(
         self, 
@@ -16,21 +54,217 @@ class PaperWriter:
         reference_papers: List[Dict[str, Any]]
     ) -> Dict[str, Any]:
         """Generate a complete research paper"""
+        references_text = self.format_references(reference_papers)
+        # the title doesn't need the paper, so both are written at once
+        paper_content, title = await asyncio.gather(
+            self.write(research_direction, algorithm_design, implementation, evaluation, references_text),
+            self.generate_title(research_direction, algorithm_design)
+        )
         
-        direction = research_direction.get("direction", "")
-        design_doc = algorithm_design.get("design_document", "")
-        code = implementation.get("refined_code", implementation.get("code", ""))
-        eval_report = evaluation.get("evaluation_report", "")
-        
-        references_text = "\n".join([
+        return {
+            "title": title,
+            "content": paper_content,
+            "references": len(reference_papers)
+        }
+    
+    def format_references(self, reference_papers: List[Dict[str, Any]]) -> str:
+        """Reference list for the paper, no model call involved"""
+        # reference_papers are ranked, the first 20 are the most relevant ones
+        return "\n".join([
             f"[{i+1}] {paper.get('authors', 'Unknown')}. \"{paper.get('title', 'Untitled')}\". "
             f"{paper.get('year', '')}. {paper.get('source', 'Unknown Source')}. {paper.get('url', '')}"
             for i, paper in enumerate(reference_papers[:20])
         ])
+    
+    async def write(
+        self,
+        research_direction: Dict[str, Any],
+        algorithm_design: Dict[str, Any],
+        implementation: Dict[str, Any],
+        evaluation: Dict[str, Any],
+        references_text: str,
+        on_section: Optional[SectionCallback] = None,
+        on_text: Optional[PartCallback] = None
+    ) -> str:
+        """Write the paper section by section or in one call, as configured"""
+        if self.sectioned:
+            return await self.write_paper_sections(
+                research_direction, algorithm_design, implementation, evaluation, references_text, on_section, on_text
+            )
+        return await self.write_paper(
+            research_direction, algorithm_design, implementation, evaluation, references_text,
+            on_text=(lambda piece: on_text("paper", piece)) if on_text is not None else None
+        )
+    
+    async def write_paper_sections(
+        self,
+        research_direction: Dict[str, Any],
+        algorithm_design: Dict[str, Any],
+        implementation: Dict[str, Any],
+        evaluation: Dict[str, Any],
+        references_text: str,
+        on_section: Optional[SectionCallback] = None,
+        on_text: Optional[PartCallback] = None
+    ) -> str:
+        """Write the paper as an outline and then all sections at once
+
+        Takes about as long as the outline plus the slowest section instead of
+        one long call, and no section is cut short by the ones before it. The
+        references and the code listing are put in as they are, not written
+        by the model. A section that fails fails the whole paper.
+        """
+        sources = {
+            "direction": research_direction.get("direction", ""),
+            "design": algorithm_design.get("design_document", ""),
+            "code": self._code_listing(implementation),
+            "evaluation": evaluation.get("evaluation_report", ""),
+            "references": references_text,
+        }
+        abstract, outline = await self._outline(sources)
+        if on_section is not None and abstract:
+            on_section("Abstract", f"## Abstract\n\n{abstract}")
+        
+        async def write_section(number: int, name: str, instructions: str, weights: Dict[str, float], max_tokens: int):
+            text = await self._section(number, name, instructions, weights, max_tokens, outline, sources, on_text)
+            if name == "Implementation" and sources["code"]:
+                text += f"\n\n**Listing 1.** Implementation of the proposed algorithm.\n\n```python\n{sources['code']}\n```"
+            if on_section is not None:
+                on_section(name, text)
+            return text
+        
+        sections = await asyncio.gather(*(
+            write_section(number, *section) for number, section in enumerate(PAPER_SECTIONS, start=1)
+        ))
+        
+        parts = [f"## Abstract\n\n{abstract}"] if abstract else []
+        parts += sections
+        parts.append(f"## References\n\n{references_text}")
+        return "\n\n".join(parts)
+    
+    async def _outline(self, sources: Dict[str, str]) -> Tuple[str, str]:
+        """Abstract and per-section outline every section is written against"""
+        context = (
+            ContextPacker(prompt_budget(self._model(), OUTLINE_MAX_TOKENS) - PROMPT_OVERHEAD_TOKENS,
+                          query=sources["direction"])
+            .add("direction", sources["direction"], weight=2, query="")
+            .add("design", sources["design"], weight=2)
+            .add("evaluation", sources["evaluation"])
+            .add("references", sources["references"], weight=0.5, kind="lines")
+            .pack()
+        )
+        headings = "\n".join(f"### {name}\n- ..." for name, *_ in PAPER_SECTIONS)
+        prompt = f"""
+        Plan an IEEE research paper based on the following components:
+        
+        1. Research Direction:
+        {context["direction"]}
+        
+        2. Algorithm Design:
+        {context["design"]}
+        
+        3. Evaluation Results:
+        {context["evaluation"]}
+        
+        4. References:
+        {context["references"]}
+        
+        Reply in exactly this markdown structure and nothing else:
+        
+        ## Abstract
+        (the complete abstract, 150 to 250 words)
+        
+        ## Outline
+        {headings}
+        
+        Give each section 3 to 6 bullet points with the specific claims, methods, results and references [n] it
+        should cover, so that sections written separately fit together without repeating each other.
+        """
+        text = await self.ai_model.generate_text(prompt, temperature=0.3, max_tokens=OUTLINE_MAX_TOKENS)
+        
+        match = re.search(r"^#+\s*Abstract\s*$(.*?)^#+\s*Outline\s*$(.*)", text, re.S | re.M | re.I)
+        if match is None:
+            # no usable structure, the whole reply still works as the outline
+            return "", text.strip()
+        return match.group(1).strip(), match.group(2).strip()
+    
+    async def _section(
+        self,
+        number: int,
+        name: str,
+        instructions: str,
+        weights: Dict[str, float],
+        max_tokens: int,
+        outline: str,
+        sources: Dict[str, str],
+        on_text: Optional[PartCallback] = None
+    ) -> str:
+        """One section of the paper in markdown, starting with its heading"""
+        heading = f"## {number}. {name}"
+        packer = ContextPacker(
+            prompt_budget(self._model(), max_tokens) - PROMPT_OVERHEAD_TOKENS - estimate_tokens(outline),
+            query=sources["direction"]
+        )
+        for source, weight in weights.items():
+            kind = "code" if source == "code" else "lines" if source == "references" else "text"
+            packer.add(source, sources[source], weight=weight, kind=kind)
+        context = packer.pack()
+        material = "\n\n".join(f"{source.title()}:\n{context[source]}" for source in weights)
+        
+        prompt = f"""
+        You are writing one section of an IEEE research paper. Every section is written from this shared outline:
+        
+        {outline}
+        
+        Source material for this section:
+        
+        {material}
+        
+        Write ONLY the section "{heading}" in markdown, starting with that exact heading line. {instructions}
+        
+        IMPORTANT GUIDELINES:
+        1. Cover what the outline lists for this section and leave the other sections' points to them
+        2. Cite only the references given, as [n], and never invent any
+        3. Write complete content, no placeholders or summaries of what would be there
+        4. Use ### for subsections
+        """
+        text = await self.ai_model.generate_text(
+            prompt, temperature=0.4, max_tokens=max_tokens,
+            on_text=(lambda piece: on_text(name, piece)) if on_text is not None else None
+        )
+        text = text.strip()
+        if not text.startswith("#"):
+            text = f"{heading}\n\n{text}"
+        return text
+    
+    async def write_paper(
+        self,
+        research_direction: Dict[str, Any],
+        algorithm_design: Dict[str, Any],
+        implementation: Dict[str, Any],
+        evaluation: Dict[str, Any],
+        references_text: str,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Write the body of the paper in markdown"""
+        direction = research_direction.get("direction", "")
+        design_doc = algorithm_design.get("design_document", "")
+        code = self._code_listing(implementation)
+        eval_report = evaluation.get("evaluation_report", "")
+        
+        # the paper has to reproduce the code, so it can't take more than a third of the output
+        context = (
+            ContextPacker(prompt_budget(self._model(), PAPER_MAX_TOKENS) - PROMPT_OVERHEAD_TOKENS, query=direction)
+            .add("references", references_text, weight=2, kind="lines")
+            .add("direction", direction, query="")
+            .add("design", design_doc, weight=1.5)
+            .add("code", code, weight=2, kind="code", max_tokens=PAPER_MAX_TOKENS // 3)
+            .add("evaluation", eval_report)
+            .pack()
+        )
         
         code_section = f"""
         ```python
-        {code}
+        {context["code"]}
         ```
         """
         
@@ -38,16 +272,16 @@ class PaperWriter:
         Generate a complete academic research paper based on the following components:
         
         1. Research Direction:
-        {direction[:1500]}...
+        {context["direction"]}
         
         2. Algorithm Design:
-        {design_doc[:1500]}...
+        {context["design"]}
         
         3. Implementation Details:
         {code_section}
         
         4. Evaluation Results:
-        {eval_report[:1500]}...
+        {context["evaluation"]}
         
         The paper should follow standard IEEE academic structure:
         - Title
@@ -65,7 +299,7 @@ class PaperWriter:
         
         ## References
         
-        {references_text}
+        {context["references"]}
         
         IMPORTANT GUIDELINES:
         1. Format the paper in a clean, professional academic style with proper sections and subsections
@@ -78,17 +312,28 @@ class PaperWriter:
 
         """
         
-        paper_content = await self.ai_model.generate_text(
+        return await self.ai_model.generate_text(
             prompt, 
             temperature=0.4,
-            max_tokens=9000
+            max_tokens=PAPER_MAX_TOKENS,
+            on_text=on_text
         )
-
-        # Generate a title separately for better quality
+    
+    async def generate_title(self, research_direction: Dict[str, Any], algorithm_design: Dict[str, Any]) -> str:
+        """Title from what the paper is about, so it can be written alongside the paper"""
+        context = (
+            ContextPacker(TITLE_CONTEXT_TOKENS)
+            .add("direction", research_direction.get("direction", ""))
+            .add("design", algorithm_design.get("design_document", ""))
+            .pack()
+        )
+        
         title_prompt = f"""
-        Based on this abstract and introduction:
+        Based on this research direction and the algorithm it proposes:
         
-        {paper_content[:1000]}
+        {context["direction"]}
+        
+        {context["design"]}
         
         Generate a SINGLE concise, descriptive title for this research paper following IEEE conference paper style.
         DO NOT provide multiple options or alternatives.
@@ -105,12 +350,14 @@ class PaperWriter:
         title = title.strip().split('\n')[0]
         if ':' in title and not title.startswith('http'):
             title = title.split(':', 1)[1].strip()
-        
-        return {
-            "title": title.strip(),
-            "content": paper_content,
-            "references": len(reference_papers)
-        }
-        
-
-  
\ No newline at end of file
+        return title.strip()
+    
+    def _model(self) -> Optional[str]:
+        return getattr(self.ai_model, "model", None)
+    
+    @staticmethod
+    def _code_listing(implementation: Dict[str, Any]) -> str:
+        """The code of an implementation without the fences and prose a model reply has around it"""
+        code = implementation.get("refined_code", implementation.get("code", "")) or ""
+        match = FENCED_CODE.search(code)
+        return (match.group(1) if match else code).strip()
@@ -0,0 +1,202 @@
+import math
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from ..utils.text import mix64, normalize_text
+from ..config import ENRICHMENT_RANK_WEIGHT
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in into is it its of on or our over that the their
+this to under we which with via using based towards toward new approach method methods paper
+""".split()) | frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+
+# terms are hashed straight into columns (the hashing trick), no vocabulary to build
+HASH_BITS = 20
+# a term is its first 8 characters, which doubles as a crude stemmer
+TERM_CHARS = 8
+SPACE = ord(" ")
+
+# lowercases letters and turns every other non-alphanumeric byte into a space
+BYTE_TABLE = bytes(
+    c + 32 if 65 <= c <= 90 else c if 48 <= c <= 57 or 97 <= c <= 122 else SPACE
+    for c in range(256)
+)
+# TERM_MASKS[n] keeps the first n bytes of a little-endian packed word
+TERM_MASKS = np.array([(1 << (8 * n)) - 1 for n in range(TERM_CHARS + 1)], dtype=np.uint64)
+
+
+def _ascii_bytes(text: Optional[str]) -> bytes:
+    if not text:
+        return b""
+    if not text.isascii():
+        # decomposing then dropping non-ascii strips the accents off letters
+        text = unicodedata.normalize("NFKD", text)
+    return text.encode("ascii", "ignore")
+
+
+def hash_terms(texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Column index and text index of every word in texts
+
+    All texts are folded into one byte buffer and the words are found, packed
+    and hashed with array operations, so no Python string is created per word.
+    """
+    joined = " ".join(text or "" for text in texts)
+    if joined.isascii():
+        # the common case, one encode for everything and the lengths are the string lengths
+        lengths = [len(text or "") for text in texts]
+        data = joined.encode("ascii")
+    else:
+        parts = [_ascii_bytes(text) for text in texts]
+        lengths = [len(part) for part in parts]
+        data = b" ".join(parts)
+    # leading space so the buffer starts outside a word, trailing padding for the 8 byte reads
+    joined_bytes = (b" " + data + b" " * (TERM_CHARS + 1)).translate(BYTE_TABLE)
+    buf = np.frombuffer(joined_bytes, dtype=np.uint8)
+    size = len(buf) - TERM_CHARS
+
+    # words start and end where the buffer flips between space and not space
+    is_char = buf[:size] != SPACE
+    edges = np.flatnonzero(is_char[1:] != is_char[:-1]) + 1
+    starts, ends = edges[0::2], edges[1::2]
+    if not len(starts):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # an unaligned uint64 view starting at every byte, so each word is read in one go
+    windows = as_strided(buf[:TERM_CHARS].view(np.uint64), shape=(size,), strides=(1,))
+    keys = windows[starts] & TERM_MASKS[np.minimum(ends - starts, TERM_CHARS)]
+
+    with np.errstate(over="ignore"):
+        columns = (mix64(keys) >> np.uint64(64 - HASH_BITS)).astype(np.int64)
+    # both are sorted, so each text's words are a run found by searching the few text starts
+    text_starts = np.cumsum([1] + [length + 1 for length in lengths[:-1]])
+    first_words = np.searchsorted(starts, text_starts)
+    text_ids = np.repeat(np.arange(len(texts)), np.diff(np.append(first_words, len(starts))))
+    return columns, text_ids
+
+
+STOPWORD_COLUMNS = np.unique(hash_terms(sorted(STOPWORDS))[0])
+# the same as a lookup by column, cheaper than np.isin on millions of words
+IS_STOPWORD = np.zeros(1 << HASH_BITS, dtype=bool)
+IS_STOPWORD[STOPWORD_COLUMNS] = True
+
+
+class PaperRanker:
+    """BM25 relevance ranking of papers against the domain, focus and seed papers
+
+    Titles and abstracts are hashed in one pass, the words of the queries are
+    counted per paper into a papers x query-terms matrix, and all papers are
+    scored against all queries with a single matrix product. Enriched papers
+    are also scored on their topics and contribution, and their model
+    relevance rating makes up enrichment_weight of their score.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, title_weight: int = 2,
+                 focus_weight: float = 1.0, seed_weight: float = 0.5,
+                 enrichment_weight: float = ENRICHMENT_RANK_WEIGHT):
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+        self.focus_weight = focus_weight
+        self.seed_weight = seed_weight
+        self.enrichment_weight = enrichment_weight
+
+    def rank(
+        self,
+        papers: List[Dict[str, Any]],
+        domain: str,
+        focus: Optional[str] = None,
+        seed_papers: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Papers sorted by relevance, each tagged with its `relevance_score`
+
+        Seed papers the user gave us stay at the front regardless of score.
+        """
+        if not papers:
+            return []
+
+        queries = [domain]
+        weights = [1.0]
+        if focus:
+            queries.append(focus)
+            weights.append(self.focus_weight)
+        for seed in seed_papers or []:
+            if seed.get("title"):
+                queries.append(seed["title"])
+                weights.append(self.seed_weight / len(seed_papers))
+
+        scores = self.score(papers, queries, weights)
+        rated = np.array([paper.get("llm_relevance", -1.0) for paper in papers], dtype=np.float64)
+        has_rating = rated >= 0
+        if has_rating.any() and self.enrichment_weight:
+            w = self.enrichment_weight
+            # papers without a rating get the average one, so they neither jump nor sink past the rated ones
+            rated[~has_rating] = rated[has_rating].mean()
+            scores = (1 - w) * scores + w * rated
+        for paper, score in zip(papers, scores.tolist()):
+            paper["relevance_score"] = round(score, 4)
+
+        order = np.argsort(-scores, kind="stable")
+        seed_titles = {normalize_text(seed.get("title")) for seed in seed_papers or []} - {""}
+        if seed_titles:
+            is_seed = np.array([normalize_text(paper.get("title")) in seed_titles for paper in papers])
+            order = order[np.argsort(~is_seed[order], kind="stable")]
+        return [papers[i] for i in order]
+
+    def score(self, papers: List[Dict[str, Any]], queries: List[str], weights: List[float]) -> np.ndarray:
+        """Weighted BM25 score of every paper against every query, scaled to [0, 1]"""
+        query_columns, query_ids = hash_terms(queries)
+        keep = ~IS_STOPWORD[query_columns]
+        # a term repeated within a query still counts once
+        query_terms = np.unique(np.stack([query_columns[keep], query_ids[keep]]), axis=1)
+        terms, term_index = np.unique(query_terms[0], return_inverse=True)
+        if not len(terms):
+            return np.zeros(len(papers))
+        query_matrix = np.zeros((len(terms), len(queries)), dtype=np.float32)
+        query_matrix[term_index, query_terms[1]] = 1.0
+
+        # title and body of each paper, title words count title_weight times
+        texts = []
+        for paper in papers:
+            texts.append(paper.get("title") or "")
+            texts.append(self._body(paper))
+        columns, text_ids = hash_terms(texts)
+        # stopwords don't count towards a paper's length, each title word counts title_weight times
+        words = np.bincount(text_ids[~IS_STOPWORD[columns]], minlength=len(texts)).reshape(len(papers), 2)
+        doc_lengths = words @ np.array([self.title_weight, 1], dtype=np.float64)
+        avg_length = doc_lengths.mean() or 1.0
+
+        # only the query terms are ever scored, so only their frequencies are counted:
+        # a dense papers x terms matrix instead of a sparse one over the whole hash space
+        term_of_column = np.full(1 << HASH_BITS, -1, dtype=np.int32)
+        term_of_column[terms] = np.arange(len(terms), dtype=np.int32)
+        found = term_of_column[columns]
+        hit = np.flatnonzero(found >= 0)
+        hit_ids = text_ids[hit]
+        tf = np.bincount(
+            (hit_ids >> 1) * len(terms) + found[hit],
+            weights=np.where(hit_ids & 1, 1.0, float(self.title_weight)),
+            minlength=len(papers) * len(terms)
+        ).reshape(len(papers), len(terms))
+
+        doc_freq = np.count_nonzero(tf, axis=0)
+        idf = np.log1p((len(papers) - doc_freq + 0.5) / (doc_freq + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * doc_lengths / avg_length)
+        saturated = tf * (self.k1 + 1) / (tf + norm[:, None]) * idf
+
+        per_query = (saturated @ query_matrix).astype(np.float32)
+        # scale each query to [0, 1] so a long focus text doesn't drown out the domain
+        peaks = per_query.max(axis=0)
+        peaks[peaks == 0] = 1.0
+        combined = (per_query / peaks) @ np.asarray(weights, dtype=np.float32)
+        total_weight = math.fsum(weights) or 1.0
+        return combined / total_weight
+
+    @staticmethod
+    def _body(paper: Dict[str, Any]) -> str:
+        abstract = paper.get("abstract") or ""
+        if not paper.get("topics"):
+            return abstract
+        return " ".join([abstract, " ".join(paper["topics"]), paper.get("contribution") or ""])
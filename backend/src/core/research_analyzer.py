@@ -1,20 +1,115 @@
 from typing import List, Dict, Any, Optional
+import asyncio
+import logging
+import time
+from ..config import GAP_ANALYSIS_MAX_PAPERS, GAP_ANALYSIS_CHUNK_TOKENS, GAP_ANALYSIS_FAN_IN
+from ..models.gemini import GeminiError
+from ..utils.tokens import estimate_tokens
 
 class ResearchAnalyzer:
     """Analyzes research papers to identify gaps and generate research directions"""
     
-    def __init__(self, ai_model):
+    def __init__(
+        self,
+        ai_model,
+        vector_index=None,
+        max_papers: int = GAP_ANALYSIS_MAX_PAPERS,
+        chunk_tokens: int = GAP_ANALYSIS_CHUNK_TOKENS,
+        fan_in: int = GAP_ANALYSIS_FAN_IN
+    ):
         """Initialize the research analyzer with an AI model client"""
         self.ai_model = ai_model
+        self.vector_index = vector_index
+        self.max_papers = max_papers
+        self.chunk_tokens = chunk_tokens
+        self.fan_in = max(fan_in, 2)
     
-    async def identify_gaps(self, papers: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Identify research gaps from the collected papers"""
-        papers_context = "\n\n".join([
-            f"Paper {i+1}:\nTitle: {paper.get('title')}\nAuthors: {paper.get('authors', 'Unknown')}\n"
-            f"Year: {paper.get('year', 'Unknown')}\nAbstract: {paper.get('abstract', 'N/A')}\n"
-            for i, paper in enumerate(papers[:15])  # Limit to 15 papers (for gemini we can go 30 actaully)
-        ])
+    async def identify_gaps(
+        self,
+        papers: List[Dict[str, Any]],
+        query: Optional[str] = None,
+        hierarchical: bool = True
+    ) -> Dict[str, Any]:
+        """Identify research gaps from the collected papers
+
+        When the papers don't fit one prompt (and hierarchical is on) they are
+        summarized in token-budgeted chunks, the summaries are merged level by
+        level, and the gap analysis runs on what is left. Raises GeminiError
+        when every call of a level failed.
+        """
+        max_papers = self.max_papers if hierarchical else 15
+        context_papers = papers[:max_papers]
+        # mix in semantically close papers from earlier jobs
+        if self.vector_index is not None and query:
+            context_papers = await asyncio.to_thread(self.vector_index.blend, papers, query, max_papers)
+        
+        chunks = self._chunk_papers(context_papers)
+        if not hierarchical or len(chunks) <= 1:
+            started = time.time()
+            analysis = await self._analyze_gaps(self._papers_context(context_papers))
+            return {
+                "analysis": analysis,
+                "papers_analyzed": len(context_papers),
+                "papers_available": len(papers),
+                "levels": [{"level": 0, "inputs": len(context_papers), "outputs": 1,
+                            "seconds": round(time.time() - started, 2)}]
+            }
+        
+        levels = []
+        
+        # map: every chunk is summarized at once, the Gemini executor caps how many run
+        started = time.time()
+        summaries = await asyncio.gather(*[self._summarize_chunk(chunk) for chunk in chunks], return_exceptions=True)
+        notes = [
+            (summary, len(chunk)) for summary, chunk in zip(summaries, chunks)
+            if not self._failed(summary)
+        ]
+        levels.append({"level": 0, "inputs": len(context_papers), "outputs": len(notes),
+                       "seconds": round(time.time() - started, 2)})
+        if not notes:
+            # like a failed reduce level, fail the stage so the job can be resumed
+            errors = [summary for summary in summaries if isinstance(summary, Exception)]
+            raise GeminiError(
+                f"Every summary of the {len(chunks)} gap analysis chunks failed"
+            ) from (errors[-1] if errors else None)
+        
+        # reduce: merge groups of notes until one prompt can hold them all
+        while len(notes) > self.fan_in:
+            started = time.time()
+            inputs = len(notes)
+            groups = [notes[i:i + self.fan_in] for i in range(0, len(notes), self.fan_in)]
+            merged = await asyncio.gather(
+                *[self._merge_notes([note for note, _ in group]) for group in groups], return_exceptions=True
+            )
+            notes = [
+                (note, sum(count for _, count in group)) for note, group in zip(merged, groups)
+                if not self._failed(note)
+            ]
+            levels.append({"level": len(levels), "inputs": inputs, "outputs": len(notes),
+                           "seconds": round(time.time() - started, 2)})
+            if not notes:
+                # nothing left to analyze, fail the stage so the job can be resumed instead of making gaps up
+                errors = [note for note in merged if isinstance(note, Exception)]
+                raise GeminiError(
+                    f"Every merge of gap analysis level {len(levels) - 1} failed"
+                ) from (errors[-1] if errors else None)
+        
+        started = time.time()
+        notes_context = "\n\n".join(
+            f"Notes {i+1} (covering {count} papers):\n{note}" for i, (note, count) in enumerate(notes)
+        )
+        analysis = await self._analyze_gaps(notes_context)
+        levels.append({"level": len(levels), "inputs": len(notes), "outputs": 1,
+                       "seconds": round(time.time() - started, 2)})
         
+        return {
+            "analysis": analysis,
+            "papers_analyzed": sum(count for _, count in notes),
+            "papers_available": len(papers),
+            "levels": levels
+        }
+    
+    async def _analyze_gaps(self, papers_context: str) -> str:
         prompt = f"""
         Analyze these papers and identify key research gaps in this field:
         
@@ -29,12 +124,74 @@ class ResearchAnalyzer:
         Format your response as a structured analysis with clear sections.
         """
         
-        analysis = await self.ai_model.generate_text(prompt, temperature=0.2)
+        return await self.ai_model.generate_text(prompt, temperature=0.2)
+    
+    async def _summarize_chunk(self, papers: List[Dict[str, Any]]) -> str:
+        prompt = f"""
+        Summarize these papers as notes for a later research gap analysis:
         
-        return {
-            "analysis": analysis,
-            "papers_analyzed": len(papers)
-        }
+        {self._papers_context(papers)}
+        
+        Cover the problems they address, the methods they use, the limitations
+        they admit or show, and the questions they leave open. Group similar
+        papers together, skip anything that isn't about the research itself.
+        Keep it under 400 words.
+        """
+        
+        return await self.ai_model.generate_text(prompt, temperature=0.2, max_tokens=1024)
+    
+    async def _merge_notes(self, notes: List[str]) -> str:
+        notes_context = "\n\n".join(f"Notes {i+1}:\n{note}" for i, note in enumerate(notes))
+        prompt = f"""
+        Merge these literature notes into a single set of notes:
+        
+        {notes_context}
+        
+        Keep every distinct problem, method, limitation and open question,
+        drop repetition. Keep it under 500 words.
+        """
+        
+        return await self.ai_model.generate_text(prompt, temperature=0.2, max_tokens=1024)
+    
+    def _chunk_papers(self, papers: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Consecutive runs of papers that each fit the chunk token budget"""
+        chunks = []
+        current, current_tokens = [], 0
+        for paper in papers:
+            tokens = estimate_tokens(self._paper_text(0, paper))
+            if current and current_tokens + tokens > self.chunk_tokens:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(paper)
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def _papers_context(self, papers: List[Dict[str, Any]]) -> str:
+        return "\n\n".join(self._paper_text(i, paper) for i, paper in enumerate(papers))
+    
+    @staticmethod
+    def _paper_text(i: int, paper: Dict[str, Any]) -> str:
+        text = (
+            f"Paper {i+1}:\nTitle: {paper.get('title')}\nAuthors: {paper.get('authors', 'Unknown')}\n"
+            f"Year: {paper.get('year', 'Unknown')}\nAbstract: {paper.get('abstract', 'N/A')}\n"
+        )
+        # enriched papers come with what they contribute and where it applies, gaps sit between those
+        if paper.get("topics"):
+            text += (
+                f"Topics: {', '.join(paper['topics'])}\nContribution: {paper.get('contribution')}\n"
+                f"Applications: {', '.join(paper.get('applications') or []) or 'N/A'}\n"
+            )
+        return text
+    
+    @staticmethod
+    def _failed(result) -> bool:
+        # one failed or empty chunk costs its papers, not the whole analysis
+        if isinstance(result, Exception):
+            logging.warning(f"Gap analysis chunk failed: {result}")
+            return True
+        return not result
     
     async def generate_research_direction(self, research_gaps: Dict[str, Any], focus: Optional[str] = None) -> Dict[str, Any]:
         """Generate a concrete research direction based on identified gaps"""
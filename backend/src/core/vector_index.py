@@ -0,0 +1,246 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..config import (
+    VECTOR_INDEX_ENABLED,
+    VECTOR_INDEX_DIR,
+    VECTOR_INDEX_DIM,
+)
+from .dedup import canonical_arxiv_id
+from .ranking import STOPWORD_COLUMNS, hash_terms
+from ..utils.text import mix64, normalize_text
+
+# rows are scored in blocks so a big index never needs one huge temporary
+SEARCH_BLOCK = 65536
+
+
+def paper_key(paper: Dict[str, Any]) -> Optional[str]:
+    """Identity of a paper in the index, arXiv id when there is one"""
+    arxiv_id = canonical_arxiv_id(paper)
+    if arxiv_id:
+        return f"arxiv:{arxiv_id}"
+    title = normalize_text(paper.get("title"))
+    return f"title:{title}" if title else None
+
+
+def embed_texts(texts: List[str], dim: int = VECTOR_INDEX_DIM) -> np.ndarray:
+    """Hashed bag of words and bigrams embedding, L2 normalized, shape (len(texts), dim)
+
+    No model to download or run: every word and every pair of neighbouring
+    words is hashed to a signed bucket, counts are log-scaled and normalized.
+    Texts sharing vocabulary and phrasing end up with a high cosine similarity.
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    columns, text_ids = hash_terms(texts)
+    if not len(columns):
+        return vectors
+
+    # bigrams of neighbouring words from the same text, stopwords still in place
+    same_text = text_ids[1:] == text_ids[:-1]
+    with np.errstate(over="ignore"):
+        bigrams = mix64(
+            columns[:-1][same_text].astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+            ^ columns[1:][same_text].astype(np.uint64)
+        ).astype(np.int64)
+    keep = ~np.isin(columns, STOPWORD_COLUMNS)
+    features = np.concatenate((columns[keep], bigrams & ((1 << 20) - 1)))
+    rows = np.concatenate((text_ids[keep], text_ids[:-1][same_text]))
+
+    # low bits pick the bucket, one high bit picks the sign
+    buckets = features % dim
+    signs = np.where((features >> 19) & 1, -1.0, 1.0).astype(np.float32)
+    np.add.at(vectors, (rows, buckets), signs)
+
+    vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class PaperVectorIndex:
+    """Persistent local index of every paper the service has collected
+
+    Vectors live in an append-only float32 file read through np.memmap,
+    paper metadata and known domains live in SQLite next to it. Row i of the
+    matrix is the paper with row id i. Appends are serialized with an
+    immediate SQLite transaction, so several processes can share the files.
+    """
+
+    def __init__(self, path: str = VECTOR_INDEX_DIR, dim: int = VECTOR_INDEX_DIM):
+        self.path = path
+        self.dim = dim
+        os.makedirs(path, exist_ok=True)
+        self.vectors_path = os.path.join(path, f"vectors-{dim}.f32")
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.memmap] = None
+        self._db = sqlite3.connect(os.path.join(path, "papers.db"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS papers ("
+            "row INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, paper TEXT NOT NULL, added_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS domains ("
+            "domain TEXT PRIMARY KEY, harvested_at REAL NOT NULL, paper_count INTEGER NOT NULL)"
+        )
+        self._db.commit()
+        if not os.path.exists(self.vectors_path):
+            open(self.vectors_path, "ab").close()
+
+    def __len__(self) -> int:
+        return os.path.getsize(self.vectors_path) // (self.dim * 4)
+
+    def add(self, papers: List[Dict[str, Any]]) -> int:
+        """Index papers that aren't in the index yet, returns how many were added"""
+        with self._lock:
+            # the write lock is what keeps vector rows and paper rows in step across processes
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                fresh: Dict[str, Dict[str, Any]] = {}
+                for paper in papers:
+                    key = paper_key(paper)
+                    if key and key not in fresh and paper.get("abstract"):
+                        fresh[key] = paper
+                if fresh:
+                    known = set()
+                    keys = list(fresh)
+                    for start in range(0, len(keys), 500):
+                        chunk = keys[start:start + 500]
+                        rows = self._db.execute(
+                            f"SELECT key FROM papers WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                        ).fetchall()
+                        known.update(row[0] for row in rows)
+                    for key in known:
+                        del fresh[key]
+
+                if not fresh:
+                    self._db.commit()
+                    return 0
+
+                first_row = len(self)
+                vectors = embed_texts([self._text(paper) for paper in fresh.values()], self.dim)
+                with open(self.vectors_path, "r+b") as f:
+                    # cut off any half written row a crashed writer left behind
+                    f.truncate(first_row * self.dim * 4)
+                    f.seek(0, os.SEEK_END)
+                    f.write(vectors.tobytes())
+
+                now = time.time()
+                self._db.executemany(
+                    "INSERT INTO papers (row, key, paper, added_at) VALUES (?, ?, ?, ?)",
+                    [
+                        (first_row + i, key, json.dumps(self._stored(paper)), now)
+                        for i, (key, paper) in enumerate(fresh.items())
+                    ]
+                )
+                self._db.commit()
+                return len(fresh)
+            except Exception:
+                self._db.rollback()
+                raise
+
+    def search(self, query: str, k: int = 20) -> List[Dict[str, Any]]:
+        """Top-k papers by cosine similarity to query, each with a `similarity` field"""
+        matrix = self._open_matrix()
+        if matrix is None or k <= 0:
+            return []
+
+        q = embed_texts([query], self.dim)[0]
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, len(matrix), SEARCH_BLOCK):
+            scores = np.asarray(matrix[start:start + SEARCH_BLOCK]) @ q
+            take = min(k, len(scores))
+            top = np.argpartition(-scores, take - 1)[:take]
+            best_rows = np.concatenate((best_rows, top + start))
+            best_scores = np.concatenate((best_scores, scores[top]))
+        order = np.argsort(-best_scores)[:k]
+
+        rows = [int(row) for row in best_rows[order]]
+        similarity = dict(zip(rows, best_scores[order].tolist()))
+        with self._lock:
+            found = self._db.execute(
+                f"SELECT row, paper FROM papers WHERE row IN ({','.join('?' * len(rows))})", rows
+            ).fetchall()
+        papers = {row: json.loads(paper) for row, paper in found}
+
+        results = []
+        for row in rows:
+            if row in papers and similarity[row] > 0:
+                paper = papers[row]
+                paper["similarity"] = round(similarity[row], 4)
+                results.append(paper)
+        return results
+
+    def blend(self, papers: List[Dict[str, Any]], query: str, limit: int) -> List[Dict[str, Any]]:
+        """Up to `limit` papers alternating between the ranked list and index hits for query"""
+        hits = self.search(query, k=limit)
+        blended = []
+        seen = set()
+        for pair in zip(papers[:limit], hits):
+            for paper in pair:
+                title = normalize_text(paper.get("title"))
+                if title not in seen:
+                    seen.add(title)
+                    blended.append(paper)
+        # whichever list is longer fills the rest
+        for paper in papers[:limit] + hits:
+            title = normalize_text(paper.get("title"))
+            if title not in seen:
+                seen.add(title)
+                blended.append(paper)
+        return blended[:limit]
+
+    def mark_domain(self, domain: str, paper_count: int):
+        """Remember that domain was just harvested from the network"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO domains (domain, harvested_at, paper_count) VALUES (?, ?, ?)",
+                (normalize_text(domain), time.time(), paper_count)
+            )
+            self._db.commit()
+
+    def is_fresh_domain(self, domain: str, max_age: float) -> bool:
+        """Whether domain was harvested within the last max_age seconds"""
+        if max_age <= 0:
+            return False
+        with self._lock:
+            row = self._db.execute(
+                "SELECT harvested_at FROM domains WHERE domain = ?", (normalize_text(domain),)
+            ).fetchone()
+        return row is not None and time.time() - row[0] <= max_age
+
+    def _open_matrix(self) -> Optional[np.memmap]:
+        """Map the vectors file, remapping when other writers have grown it"""
+        rows = len(self)
+        if rows == 0:
+            return None
+        if self._matrix is None or len(self._matrix) != rows:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    @staticmethod
+    def _text(paper: Dict[str, Any]) -> str:
+        return f"{paper.get('title') or ''}. {paper.get('abstract') or ''}"
+
+    @staticmethod
+    def _stored(paper: Dict[str, Any]) -> Dict[str, Any]:
+        # job specific fields like scores don't belong in the shared index
+        return {field: paper.get(field) for field in ("title", "authors", "abstract", "year", "url", "source")}
+
+
+_vector_index: Optional[PaperVectorIndex] = None
+
+
+def get_vector_index() -> Optional[PaperVectorIndex]:
+    """Get the process-wide vector index, None when it is disabled"""
+    global _vector_index
+    if _vector_index is None and VECTOR_INDEX_ENABLED:
+        _vector_index = PaperVectorIndex()
+    return _vector_index
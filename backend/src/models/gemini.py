@@ -1,11 +1,140 @@
 import os
+import logging
+import random
 import google.generativeai as genai
-from typing import List, Dict, Any, Optional
+from google.api_core import exceptions as google_exceptions
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional
 import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from ..config import (
+    GEMINI_API_ENDPOINT,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_MAX_RETRIES,
+    GEMINI_RETRY_BASE,
+    GEMINI_RETRY_MAX,
+    GEMINI_RPM,
+    GEMINI_TPM,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_MAX_DISK_ENTRIES,
+    LLM_CACHE_TTL,
+    LLM_CACHE_PATH,
+)
+from ..utils.cache import ResponseCache
+from ..utils.rate_limit import AdaptiveRateLimiter
+from ..utils.singleflight import SingleFlight
+from ..utils.tokens import estimate_tokens
 
 load_dotenv()
 
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+# The SDK calls block, so they run here instead of on the event loop.
+# One pool per process, its size is the in-flight limit for every job.
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get the process-wide executor used for Gemini calls"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=GEMINI_MAX_CONCURRENCY,
+            thread_name_prefix="gemini"
+        )
+    return _executor
+
+
+_response_cache: Optional[ResponseCache] = None
+
+# identical prompts from concurrent jobs share one upstream call
+_inflight = SingleFlight()
+
+
+class _SharedStream:
+    """Pieces of a streamed call so far and the callbacks of everyone waiting on it"""
+
+    def __init__(self):
+        self.pieces: List[str] = []
+        self.listeners: List[Callable[[str], None]] = []
+
+    def push(self, piece: str):
+        self.pieces.append(piece)
+        for listener in list(self.listeners):
+            listener(piece)
+
+
+# streamed calls in flight by request key, a caller joining late is handed what came so far
+_streams: Dict[str, _SharedStream] = {}
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Get the process-wide response cache, None when caching is disabled"""
+    global _response_cache
+    if _response_cache is None and LLM_CACHE_ENABLED:
+        _response_cache = ResponseCache(
+            max_entries=LLM_CACHE_MAX_ENTRIES,
+            ttl_seconds=LLM_CACHE_TTL,
+            db_path=LLM_CACHE_PATH,
+            max_db_entries=LLM_CACHE_MAX_DISK_ENTRIES
+        )
+    return _response_cache
+
+
+class GeminiError(Exception):
+    """A Gemini call failed and retrying won't help, or retries ran out"""
+
+
+class GeminiThrottledError(GeminiError):
+    """Gemini kept answering 429/503 through every retry"""
+
+
+# 429 and 503 mean slow down, the rest are worth another try at the same pace
+_THROTTLED = (google_exceptions.TooManyRequests, google_exceptions.ServiceUnavailable)
+_TRANSIENT = (
+    google_exceptions.InternalServerError,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+# one limiter per model, every job in the process shares the model's quota
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+
+
+def get_rate_limiter(model: str) -> AdaptiveRateLimiter:
+    """Get the process-wide rate limiter of a model"""
+    limiter = _limiters.get(model)
+    if limiter is None:
+        limiter = _limiters[model] = AdaptiveRateLimiter(GEMINI_RPM, GEMINI_TPM)
+    return limiter
+
+
+def get_rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {model: limiter.stats() for model, limiter in _limiters.items()}
+
+
+def get_inflight_stats() -> Dict[str, int]:
+    """Counters for coalesced Gemini calls"""
+    return _inflight.stats()
+
+
+def shutdown_executor():
+    """Stop the Gemini executor, waiting for in-flight calls"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
 class GeminiClient:
     """Client for interacting with Google Gemini API"""
     
@@ -15,46 +144,229 @@ class GeminiClient:
         if not api_key:
             raise ValueError("GEMINI_API_KEY environment variable not set")
             
-        genai.configure(api_key=api_key)
+        if GEMINI_API_ENDPOINT:
+            # a proxy or a local fake of the API, those speak REST
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+        else:
+            genai.configure(api_key=api_key)
         self.model = model
         self.model_instance = genai.GenerativeModel(self.model)
+        self.rate_limiter = get_rate_limiter(model)
     
-    async def generate_text(self, prompt: str, system_prompt: str = None, temperature: float = 0.7, max_tokens: int = 4096):
-        """Generate text from the model"""
+    async def generate_text(
+        self,
+        prompt: str,
+        system_prompt: str = None,
+        temperature: float = 0.7,
+        max_tokens: int = 4096,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Generate text from the model, on_text gets each piece as it streams in
+
+        Calls wait for the model's rate limiter and are retried with backoff when
+        throttled or on transient errors. Raises GeminiError when that doesn't help.
+        Identical calls in flight at the same time share one request, streamed or
+        not, and every on_text among them gets all the pieces.
+        """
+        generation_config = self._generation_config(temperature, max_tokens)
+        request_key = ResponseCache.make_key(self.model, system_prompt, prompt, generation_config)
+        if on_text is not None:
+            return await self._generate_streamed(
+                request_key, prompt, system_prompt, temperature, max_tokens, on_text
+            )
+        
+        cache = get_response_cache()
+        if cache is not None:
+            cached = await cache.aget(request_key)
+            if cached is not None:
+                return cached
+        
+        async def call():
+            loop = asyncio.get_running_loop()
+            prompt_tokens = estimate_tokens(prompt) + estimate_tokens(system_prompt)
+            for attempt in range(GEMINI_MAX_RETRIES + 1):
+                await self.rate_limiter.acquire(prompt_tokens)
+                try:
+                    text = await loop.run_in_executor(
+                        get_executor(),
+                        functools.partial(self._generate_sync, prompt, system_prompt, generation_config)
+                    )
+                except Exception as e:
+                    await self._back_off(e, attempt)
+                    continue
+                self.rate_limiter.on_success(estimate_tokens(text))
+                # only successful responses get here, errors are never cached
+                if cache is not None:
+                    await cache.aset(request_key, text)
+                return text
+        
+        return await _inflight.do(request_key, call)
+    
+    async def _generate_streamed(
+        self,
+        request_key: str,
+        prompt: str,
+        system_prompt: Optional[str],
+        temperature: float,
+        max_tokens: int,
+        on_text: Callable[[str], None]
+    ) -> str:
+        """generate_text with on_text, the leader streams and the pieces go out to every caller"""
+        stream = _streams.get(request_key)
+        if stream is None:
+            stream = _streams[request_key] = _SharedStream()
+        for piece in stream.pieces:
+            on_text(piece)
+        stream.listeners.append(on_text)
+        
+        async def call():
+            try:
+                async for piece in self.stream_text(prompt, system_prompt, temperature, max_tokens):
+                    stream.push(piece)
+                return "".join(stream.pieces)
+            finally:
+                if _streams.get(request_key) is stream:
+                    del _streams[request_key]
+        
         try:
-            generation_config = {
-                "temperature": temperature,
-                "top_p": 1,
-                "top_k": 32,
-                "max_output_tokens": max_tokens,
-            }
+            text = await _inflight.do(request_key, call)
+        finally:
+            stream.listeners.remove(on_text)
+            # joined a call that didn't stream, nothing will push to this one
+            if not stream.listeners and _streams.get(request_key) is stream and not stream.pieces:
+                del _streams[request_key]
+        if not stream.pieces:
+            on_text(text)
+        return text
+    
+    async def stream_text(
+        self,
+        prompt: str,
+        system_prompt: str = None,
+        temperature: float = 0.7,
+        max_tokens: int = 4096
+    ) -> AsyncIterator[str]:
+        """Yield the response piece by piece as the model writes it
+
+        A cached response comes as one piece, and a finished one is cached like
+        any other. Streams aren't coalesced, each caller reads its own. A call
+        is only retried until its first piece arrives, after that a failure
+        raises GeminiError. Leaving the loop early stops reading the response.
+        """
+        generation_config = self._generation_config(temperature, max_tokens)
+        request_key = ResponseCache.make_key(self.model, system_prompt, prompt, generation_config)
+        cache = get_response_cache()
+        if cache is not None:
+            cached = await cache.aget(request_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        loop = asyncio.get_running_loop()
+        prompt_tokens = estimate_tokens(prompt) + estimate_tokens(system_prompt)
+        text = []
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            await self.rate_limiter.acquire(prompt_tokens)
+            pieces: asyncio.Queue = asyncio.Queue()
+            stop = threading.Event()
+            done = object()
             
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            ]
+            def hand_over(item, pieces=pieces, stop=stop):
+                try:
+                    loop.call_soon_threadsafe(pieces.put_nowait, item)
+                except RuntimeError:
+                    # the loop is gone, nobody is reading anymore
+                    stop.set()
             
-            chat = self.model_instance.start_chat(history=[])
+            # the SDK iterates the response on an executor thread, pieces cross over to the loop
+            def produce(hand_over=hand_over, stop=stop, done=done):
+                try:
+                    for piece in self._stream_sync(prompt, system_prompt, generation_config):
+                        if stop.is_set():
+                            return
+                        hand_over(piece)
+                    hand_over(done)
+                except Exception as e:
+                    hand_over(e)
             
-            if system_prompt:
-                chat.send_message(system_prompt, generation_config=generation_config, safety_settings=safety_settings)
-                
-            response = chat.send_message(prompt, generation_config=generation_config, safety_settings=safety_settings)
-            return response.text
+            loop.run_in_executor(get_executor(), produce)
+            try:
+                while True:
+                    item = await pieces.get()
+                    if item is done:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    text.append(item)
+                    yield item
+            except Exception as e:
+                if text:
+                    raise GeminiError(f"Gemini stream broke off: {e}") from e
+                await self._back_off(e, attempt)
+                continue
+            finally:
+                stop.set()
+            break
+        
+        self.rate_limiter.on_success(estimate_tokens("".join(text)))
+        if cache is not None:
+            await cache.aset(request_key, "".join(text))
+    
+    async def _back_off(self, error: Exception, attempt: int):
+        """Sleep before the next attempt of a failed call, or raise when there shouldn't be one"""
+        throttled = isinstance(error, _THROTTLED)
+        if throttled:
+            self.rate_limiter.on_throttle()
+        if not (throttled or isinstance(error, _TRANSIENT)):
+            raise GeminiError(f"Gemini call failed: {error}") from error
+        if attempt >= GEMINI_MAX_RETRIES:
+            raise (GeminiThrottledError if throttled else GeminiError)(
+                f"Gemini call failed after {attempt + 1} attempts: {error}"
+            ) from error
+        # full jitter, callers throttled together don't come back together
+        delay = random.uniform(0, min(GEMINI_RETRY_MAX, GEMINI_RETRY_BASE * 2 ** attempt))
+        logging.warning(f"Gemini call failed ({error.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+    
+    @staticmethod
+    def _generation_config(temperature: float, max_tokens: int) -> Dict[str, Any]:
+        return {
+            "temperature": temperature,
+            "top_p": 1,
+            "top_k": 32,
+            "max_output_tokens": max_tokens,
+        }
+    
+    def _generate_sync(self, prompt: str, system_prompt: Optional[str], generation_config: Dict[str, Any]) -> str:
+        """Blocking SDK call, only ever run on the executor"""
+        chat = self.model_instance.start_chat(history=[])
+        
+        if system_prompt:
+            chat.send_message(system_prompt, generation_config=generation_config, safety_settings=SAFETY_SETTINGS)
             
-        except Exception as e:
-            # Log the error in a production environment
-            print(f"Error generating text: {str(e)}")
-            return f"Error generating response: {str(e)}"
+        response = chat.send_message(prompt, generation_config=generation_config, safety_settings=SAFETY_SETTINGS)
+        return response.text
+    
+    def _stream_sync(self, prompt: str, system_prompt: Optional[str], generation_config: Dict[str, Any]):
+        """Blocking streamed SDK call yielding text pieces, only ever run on the executor"""
+        chat = self.model_instance.start_chat(history=[])
+        
+        if system_prompt:
+            chat.send_message(system_prompt, generation_config=generation_config, safety_settings=SAFETY_SETTINGS)
+        
+        response = chat.send_message(
+            prompt, generation_config=generation_config, safety_settings=SAFETY_SETTINGS, stream=True
+        )
+        for chunk in response:
+            if chunk.parts:
+                yield chunk.text
     
     async def analyze_literature(self, papers: List[Dict[str, Any]], query: str):
         """Analyze a collection of research papers based on a specific query"""
         papers_context = "\n\n".join([
             f"Paper {i+1}:\nTitle: {paper.get('title')}\nAuthors: {paper.get('authors', 'Unknown')}\n"
             f"Year: {paper.get('year', 'Unknown')}\nAbstract: {paper.get('abstract', 'N/A')}\n"
-            for i, paper in enumerate(papers[:10])  # Limit to 10 papers to avoid context length issues
+            for i, paper in enumerate(papers[:10])  # Limit to the 10 best ranked papers to avoid context length issues
         ])
         
         system_prompt = (
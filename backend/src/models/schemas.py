@@ -12,10 +12,17 @@ class ResearchRequest(BaseModel):
     seed_papers: List[PaperRef] = []
     research_focus: Optional[str] = None
     model_preference: str = "gemini-1.5-flash"
+    # higher runs sooner when jobs are queued
+    priority: int = 0
 
 class ResearchStatus(BaseModel):
     job_id: str
     status: str
     current_stage: str
     progress: float
-    details: Optional[dict] = None
+    # bumped on every change, the ETag of the status endpoint is built from it
+    version: int = 0
+    queue_position: Optional[int] = None
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    failed_stage: Optional[str] = None
@@ -0,0 +1,135 @@
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from ..config import ARTIFACT_DIR, ARTIFACT_CACHE_ENTRIES, ARTIFACT_TTL
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ArtifactStore:
+    """Results of completed jobs, compressed on disk with a small LRU of hot ones
+
+    Each job's results are one compressed JSON file (zstd when the
+    zstandard package is installed, gzip otherwise), so memory holds at most
+    `max_entries` results however many jobs finish. Files older than
+    `ttl_seconds` are removed by gc(), which runs on startup and every 50
+    writes.
+    """
+
+    def __init__(self, path: str = ARTIFACT_DIR, max_entries: int = ARTIFACT_CACHE_ENTRIES,
+                 ttl_seconds: float = ARTIFACT_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(path, exist_ok=True)
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.loads = 0
+        self.misses = 0
+        self.gc()
+
+    def put(self, job_id: str, results: Dict[str, Any]) -> int:
+        """Write a job's results, returns the compressed size in bytes"""
+        payload = json.dumps(results, ensure_ascii=False).encode("utf-8")
+        if zstandard is not None:
+            data, suffix = zstandard.ZstdCompressor(level=10).compress(payload), ".json.zst"
+        else:
+            data, suffix = gzip.compress(payload, compresslevel=6), ".json.gz"
+
+        # write then rename, a reader never sees half a file
+        final = os.path.join(self.path, job_id + suffix)
+        partial = f"{final}.{os.getpid()}.tmp"
+        with open(partial, "wb") as f:
+            f.write(data)
+        os.replace(partial, final)
+
+        with self._lock:
+            self._remember(job_id, results)
+            self._writes += 1
+            collect = self._writes % 50 == 0
+        if collect:
+            self.gc()
+        return len(data)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's results, from memory or disk, None when missing or collected"""
+        with self._lock:
+            results = self._memory.get(job_id)
+            if results is not None:
+                self._memory.move_to_end(job_id)
+                self.hits += 1
+                return results
+
+        for suffix in (".json.zst", ".json.gz"):
+            path = os.path.join(self.path, job_id + suffix)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            if suffix == ".json.zst":
+                if zstandard is None:
+                    continue
+                payload = zstandard.ZstdDecompressor().decompress(data)
+            else:
+                payload = gzip.decompress(data)
+            results = json.loads(payload)
+            with self._lock:
+                self._remember(job_id, results)
+                self.loads += 1
+            return results
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def delete(self, job_id: str):
+        with self._lock:
+            self._memory.pop(job_id, None)
+        for suffix in (".json.zst", ".json.gz"):
+            try:
+                os.remove(os.path.join(self.path, job_id + suffix))
+            except FileNotFoundError:
+                pass
+
+    def gc(self) -> int:
+        """Remove results older than the TTL, returns how many went"""
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        for entry in os.scandir(self.path):
+            if entry.name.endswith((".json.zst", ".json.gz", ".tmp")) and entry.stat().st_mtime < cutoff:
+                job_id = entry.name.split(".", 1)[0]
+                with self._lock:
+                    self._memory.pop(job_id, None)
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "hits": self.hits,
+                "disk_loads": self.loads,
+                "misses": self.misses,
+                "codec": "zstd" if zstandard is not None else "gzip",
+            }
+
+    def _remember(self, job_id: str, results: Dict[str, Any]):
+        self._memory[job_id] = results
+        self._memory.move_to_end(job_id)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
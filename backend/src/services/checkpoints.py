@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from ..config import CHECKPOINT_ENABLED, CHECKPOINT_PATH, CHECKPOINT_TTL
+
+
+class CheckpointStore:
+    """Durable stage outputs, keyed by a hash of the stage and its inputs
+
+    A stage whose inputs hash to a stored key doesn't run again, so a failed
+    job resumes after its last finished stage and a rerun that only changes
+    a late input reuses everything upstream of it.
+    """
+
+    def __init__(self, db_path: str = CHECKPOINT_PATH, ttl_seconds: float = CHECKPOINT_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "key TEXT PRIMARY KEY, stage TEXT NOT NULL, outputs TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def make_key(stage: str, salt: str, inputs: Dict[str, Any]) -> str:
+        """Content address of a stage run, inputs must be JSON serializable"""
+        payload = json.dumps([stage, salt, inputs], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Outputs stored under key, None when missing or expired"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT outputs, created_at FROM checkpoints WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, stage: str, outputs: Dict[str, Any]):
+        """Store a finished stage's outputs"""
+        payload = json.dumps(outputs, ensure_ascii=False, default=str)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, stage, outputs, created_at) VALUES (?, ?, ?, ?)",
+                (key, stage, payload, now)
+            )
+            self._writes += 1
+            # expired rows only go away every 100 writes, get() ignores them meanwhile
+            if self._writes % 100 == 0:
+                self._db.execute("DELETE FROM checkpoints WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Stored checkpoints per stage"""
+        with self._lock:
+            rows = self._db.execute("SELECT stage, COUNT(*) FROM checkpoints GROUP BY stage").fetchall()
+        return {stage: count for stage, count in rows}
+
+
+_checkpoint_store: Optional[CheckpointStore] = None
+
+
+def get_checkpoint_store() -> Optional[CheckpointStore]:
+    """Get the process-wide checkpoint store, None when checkpoints are disabled"""
+    global _checkpoint_store
+    if _checkpoint_store is None and CHECKPOINT_ENABLED:
+        _checkpoint_store = CheckpointStore()
+    return _checkpoint_store
@@ -0,0 +1,258 @@
+import atexit
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+from ..config import JOB_STORE, JOB_STORE_PATH
+
+# jobs in these states belong to a live process, if that process is gone they never finish
+UNFINISHED = ("initializing", "queued", "active")
+
+
+def process_owner() -> str:
+    """Identity of this process as recorded on the jobs it runs"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore(ABC):
+    """Where research jobs live
+
+    A job is a JSON-able dict. Reads hand out a dict the caller may change,
+    changes only count once they go through save().
+    """
+
+    @abstractmethod
+    def create(self, job_id: str, job: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save(self, job_id: str, job: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def delete(self, job_id: str):
+        ...
+
+    def recover(self) -> int:
+        """Fail unfinished jobs whose process died, returns how many"""
+        return 0
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every change made so far is stored, False if timeout ran out first"""
+        return True
+
+    def close(self):
+        self.flush()
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+
+class InMemoryJobStore(JobStore):
+    """Jobs in a dict, only for a single worker and lost on restart"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, job_id: str, job: Dict[str, Any]):
+        self._jobs[job_id] = job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(job_id)
+
+    def save(self, job_id: str, job: Dict[str, Any]):
+        self._jobs[job_id] = job
+
+    def delete(self, job_id: str):
+        self._jobs.pop(job_id, None)
+
+
+# (operation, status, job JSON) waiting to be written
+PendingWrite = Tuple[str, str, str]
+
+
+class SqliteJobStore(JobStore):
+    """Jobs in a SQLite file in WAL mode, shared by every worker process on the host
+
+    Each job is one row holding the JSON of the job plus the columns needed
+    to find unfinished ones. Callers are mostly on the event loop, so writes
+    don't touch the database there: create/save/delete leave the job with a
+    writer thread, which writes everything that piled up in one transaction
+    and waits out other processes' locks. Reads look at those unwritten
+    changes first, in WAL mode the database itself never makes them wait.
+    """
+
+    def __init__(self, db_path: str = JOB_STORE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._owner = process_owner()
+        # the latest unwritten change of each job, and the ones being written right now
+        self._pending: Dict[str, PendingWrite] = {}
+        self._writing: Dict[str, PendingWrite] = {}
+        self._changes = threading.Condition()
+        self._closed = False
+        self._writer: Optional[threading.Thread] = None
+        # the writer is a daemon thread, what it hasn't written yet is written on the way out
+        atexit.register(self.close)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, owner TEXT NOT NULL, job TEXT NOT NULL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status)")
+        self._db.commit()
+
+    def create(self, job_id: str, job: Dict[str, Any]):
+        self._queue(job_id, ("create", job.get("status", ""), json.dumps(job)))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._changes:
+            change = self._pending.get(job_id) or self._writing.get(job_id)
+        if change is not None:
+            operation, _, payload = change
+            return None if operation == "delete" else json.loads(payload)
+        with self._lock:
+            row = self._db.execute("SELECT job FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, job_id: str, job: Dict[str, Any]):
+        # serialized now, the caller may go on changing the dict
+        self._queue(job_id, ("save", job.get("status", ""), json.dumps(job)))
+
+    def delete(self, job_id: str):
+        self._queue(job_id, ("delete", "", ""))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._changes:
+            return self._changes.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def close(self):
+        self.flush()
+        with self._changes:
+            self._closed = True
+            self._changes.notify_all()
+        if self._writer is not None:
+            self._writer.join()
+
+    def _queue(self, job_id: str, change: PendingWrite):
+        with self._changes:
+            if self._closed:
+                raise RuntimeError("job store is closed")
+            earlier = self._pending.get(job_id)
+            # a job created and saved before the writer got to it still has to be inserted
+            if earlier is not None and earlier[0] == "create" and change[0] == "save":
+                change = ("create",) + change[1:]
+            self._pending[job_id] = change
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="job-store-writer", daemon=True)
+                self._writer.start()
+            self._changes.notify_all()
+
+    def _write_loop(self):
+        # a connection of its own, waiting on other processes' locks never holds up the readers'
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            with self._changes:
+                self._changes.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    break
+                self._writing, self._pending = self._pending, {}
+                batch = dict(self._writing)
+            try:
+                self._write(db, batch)
+            except sqlite3.Error as e:
+                logging.warning(f"Writing {len(batch)} jobs failed, retrying: {e}")
+                time.sleep(0.5)
+                with self._changes:
+                    # newer changes of the same jobs replace the ones that failed
+                    self._pending = {**batch, **self._pending}
+                    self._writing = {}
+                continue
+            with self._changes:
+                self._writing = {}
+                self._changes.notify_all()
+        db.close()
+
+    def _write(self, db: sqlite3.Connection, batch: Dict[str, PendingWrite]):
+        now = time.time()
+        try:
+            for job_id, (operation, status, payload) in batch.items():
+                if operation == "create":
+                    db.execute(
+                        "INSERT INTO jobs (job_id, status, owner, job, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (job_id) DO UPDATE SET status = excluded.status, owner = excluded.owner, "
+                        "job = excluded.job, updated_at = excluded.updated_at",
+                        (job_id, status, self._owner, payload, now, now)
+                    )
+                elif operation == "save":
+                    # whoever saves a job is the process running it
+                    db.execute(
+                        "UPDATE jobs SET status = ?, owner = ?, job = ?, updated_at = ? WHERE job_id = ?",
+                        (status, self._owner, payload, now, job_id)
+                    )
+                else:
+                    db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    def recover(self) -> int:
+        host = socket.gethostname()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT job_id, owner, job FROM jobs WHERE status IN ({','.join('?' * len(UNFINISHED))})",
+                UNFINISHED
+            ).fetchall()
+            recovered = 0
+            for job_id, owner, payload in rows:
+                owner_host, _, pid = owner.rpartition(":")
+                # other hosts' processes can't be checked from here, leave their jobs be.
+                # our own pid means a restarted container reused it, we don't run anything yet
+                if owner_host != host or (owner != self._owner and _process_alive(int(pid))):
+                    continue
+                job = json.loads(payload)
+                job["status"] = "error"
+                job["current_stage"] = "error"
+                job.setdefault("details", {})["error"] = "Interrupted by a server restart, resume to continue"
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, job = ?, updated_at = ? WHERE job_id = ?",
+                    ("error", json.dumps(job), time.time(), job_id)
+                )
+                recovered += 1
+            self._db.commit()
+        return recovered
+
+
+def get_job_store() -> JobStore:
+    """Build the job store JOB_STORE asks for"""
+    if JOB_STORE == "memory":
+        return InMemoryJobStore()
+    if JOB_STORE == "sqlite":
+        return SqliteJobStore()
+    raise ValueError(f"Unknown JOB_STORE '{JOB_STORE}', expected 'sqlite' or 'memory'")
@@ -0,0 +1,172 @@
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..config import PARTIAL_FLUSH_INTERVAL
+from ..utils.events import JobEvents
+
+# (job_id, part, text, whether text replaces the stored part or is appended to it)
+PartWrite = Tuple[str, str, str, bool]
+
+
+class PartialOutputs:
+    """Text of stages still being written, as the model streams it
+
+    Each job has named parts ("implementation", "paper_writing/Introduction")
+    that only ever grow, or are set whole ("paper_sections/Introduction").
+    They are kept in memory for readers in this process, and every
+    `interval` seconds the new text is pushed as 'partial' events and
+    appended to a table of their own in the job database for readers in
+    other processes. The job row never holds them, so status reads stay
+    small, and the writes happen on a thread of their own. Without a
+    database (the memory job store) there is only the one process.
+    """
+
+    def __init__(self, events: JobEvents, db_path: Optional[str] = None, interval: float = PARTIAL_FLUSH_INTERVAL):
+        self.events = events
+        self.db_path = db_path
+        self.interval = interval
+        self._texts: Dict[str, Dict[str, str]] = {}
+        # how much of each part has been pushed as events, and how much stored
+        self._published: Dict[str, Dict[str, int]] = {}
+        self._stored: Dict[str, Dict[str, int]] = {}
+        self._flushed_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # readers' connection, the writer thread opens its own and waits out locks there
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._write_db: Optional[sqlite3.Connection] = None
+        # a single thread, so writes land in the order they were made
+        self._writer: Optional[ThreadPoolExecutor] = None
+        if db_path is not None:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS job_partials ("
+                "job_id TEXT NOT NULL, part TEXT NOT NULL, text TEXT NOT NULL, PRIMARY KEY (job_id, part))"
+            )
+            self._db.commit()
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="partials-writer")
+
+    def writer(self, job_id: str, part: str) -> Callable[[str], None]:
+        """Callback that appends the pieces it gets to one part of a job, which starts out empty"""
+        # a stage that runs again (a resume) writes its text over
+        with self._lock:
+            self._texts.get(job_id, {}).pop(part, None)
+            self._published.get(job_id, {}).pop(part, None)
+            self._stored.setdefault(job_id, {})[part] = -1
+        return lambda piece: self.append(job_id, part, piece)
+
+    def append(self, job_id: str, part: str, piece: str):
+        with self._lock:
+            parts = self._texts.setdefault(job_id, {})
+            parts[part] = parts.get(part, "") + piece
+            due = time.monotonic() - self._flushed_at.get(job_id, 0.0) >= self.interval
+        if due:
+            self.flush(job_id)
+
+    def set(self, job_id: str, part: str, text: str):
+        """Store a finished part whole, it goes out as its own event so it isn't published as partial"""
+        with self._lock:
+            self._texts.setdefault(job_id, {})[part] = text
+            self._published.setdefault(job_id, {})[part] = len(text)
+            self._stored.setdefault(job_id, {})[part] = len(text)
+        self._store([(job_id, part, text, True)])
+
+    def flush(self, job_id: str):
+        """Push what was added since the last flush and store it"""
+        with self._lock:
+            parts = self._texts.get(job_id, {})
+            published = self._published.setdefault(job_id, {})
+            stored = self._stored.setdefault(job_id, {})
+            added = {}
+            writes: List[PartWrite] = []
+            for part, text in parts.items():
+                offset = published.get(part, 0)
+                if len(text) > offset:
+                    added[part] = (offset, text[offset:])
+                    published[part] = len(text)
+                # -1 is a part started over, whatever was stored of it goes
+                start = stored.get(part, 0)
+                if len(text) > start or start < 0:
+                    writes.append((job_id, part, text[max(start, 0):], start < 0))
+                    stored[part] = len(text)
+            self._flushed_at[job_id] = time.monotonic()
+
+        for part, (offset, text) in added.items():
+            self.events.publish(job_id, "partial", {"part": part, "offset": offset, "text": text})
+        self._store(writes)
+
+    def read(self, job_id: str) -> Optional[Dict[str, str]]:
+        """All parts of a job, from memory or what another process stored, None when it has none"""
+        with self._lock:
+            parts = self._texts.get(job_id)
+            if parts is not None:
+                return dict(parts)
+        if self._db is None:
+            return None
+        with self._db_lock:
+            rows = self._db.execute("SELECT part, text FROM job_partials WHERE job_id = ?", (job_id,)).fetchall()
+        return dict(rows) if rows else None
+
+    def clear(self, job_id: str):
+        """Drop a job's parts, once it has finished or failed"""
+        with self._lock:
+            self._texts.pop(job_id, None)
+            self._published.pop(job_id, None)
+            self._stored.pop(job_id, None)
+            self._flushed_at.pop(job_id, None)
+        if self._writer is not None:
+            self._writer.submit(self._delete, job_id)
+
+    def close(self):
+        """Wait for the writes still queued"""
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+
+    def _store(self, writes: List[PartWrite]):
+        if writes and self._writer is not None:
+            self._writer.submit(self._write, writes)
+
+    def _connection(self) -> sqlite3.Connection:
+        # only ever used on the writer thread
+        if self._write_db is None:
+            self._write_db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        return self._write_db
+
+    def _write(self, writes: List[PartWrite]):
+        db = self._connection()
+        try:
+            for job_id, part, text, replace in writes:
+                if replace:
+                    db.execute(
+                        "INSERT OR REPLACE INTO job_partials (job_id, part, text) VALUES (?, ?, ?)",
+                        (job_id, part, text)
+                    )
+                else:
+                    db.execute(
+                        "INSERT INTO job_partials (job_id, part, text) VALUES (?, ?, ?) "
+                        "ON CONFLICT (job_id, part) DO UPDATE SET text = text || excluded.text",
+                        (job_id, part, text)
+                    )
+            db.commit()
+        except sqlite3.Error as e:
+            db.rollback()
+            logging.warning(f"Storing partial output of {len(writes)} parts failed: {e}")
+            # the appends are lost, the next flush writes those parts over whole
+            with self._lock:
+                for job_id, part, _, _ in writes:
+                    if job_id in self._stored:
+                        self._stored[job_id][part] = -1
+
+    def _delete(self, job_id: str):
+        db = self._connection()
+        try:
+            db.execute("DELETE FROM job_partials WHERE job_id = ?", (job_id,))
+            db.commit()
+        except sqlite3.Error as e:
+            db.rollback()
+            logging.warning(f"Clearing partial output of job {job_id} failed: {e}")
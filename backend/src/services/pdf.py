@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from ..config import PDF_DIR, PDF_WORKERS, ARTIFACT_TTL
+from ..utils.rendering import get_paper_renderer, paper_key
+
+
+def render_pdf(title: str, content: str, path: str):
+    """Render a paper to a PDF file, runs in the worker processes"""
+    from weasyprint import HTML
+
+    # write then rename, a reader never sees half a file
+    partial = f"{path}.{os.getpid()}.tmp"
+    page, _ = get_paper_renderer().render(title, content)
+    HTML(string=page).write_pdf(partial)
+    os.replace(partial, path)
+
+
+class PdfRenderer:
+    """Renders papers to PDF in worker processes and keeps the files
+
+    WeasyPrint takes seconds of CPU per paper, so it runs in a process pool
+    and never on the event loop. PDFs are stored by the paper's content hash,
+    a paper is rendered once and every later download is a file read. The
+    same paper asked for while it renders waits for that render.
+    """
+
+    def __init__(self, path: str = PDF_DIR, workers: int = PDF_WORKERS, ttl_seconds: float = ARTIFACT_TTL):
+        self.path = path
+        self.workers = max(workers, 1)
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(path, exist_ok=True)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._rendering: Dict[str, asyncio.Future] = {}
+        self._renders = 0
+        self.rendered = 0
+        self.hits = 0
+        self.gc()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.path, key + ".pdf")
+
+    def start(self, title: str, content: str) -> asyncio.Future:
+        """Make sure the paper is rendered or rendering, the future resolves to its file"""
+        key = paper_key(title, content)
+        future = self._rendering.get(key)
+        if future is not None:
+            return future
+
+        path = self.path_for(key)
+        future = asyncio.get_running_loop().create_future()
+        if os.path.exists(path):
+            self.hits += 1
+            future.set_result(path)
+            return future
+
+        self._rendering[key] = future
+        if self._executor is None:
+            # spawned, forking a process that runs threads and an event loop isn't safe
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        render = asyncio.wrap_future(self._executor.submit(render_pdf, title, content, path))
+        render.add_done_callback(lambda done: self._finished(key, path, done))
+        return future
+
+    def prerender(self, title: str, content: str):
+        """Start rendering a paper nobody asked for yet, failures are only logged"""
+        def log_failure(future: asyncio.Future):
+            if not future.cancelled() and future.exception() is not None:
+                logging.warning(f"Rendering the PDF of '{title}' failed: {future.exception()}")
+
+        self.start(title, content).add_done_callback(log_failure)
+
+    async def render(self, title: str, content: str) -> str:
+        """Path of the paper's PDF, rendering it first if that hasn't happened yet"""
+        # shielded, a client that goes away doesn't cancel the render for everyone else
+        return await asyncio.shield(self.start(title, content))
+
+    def gc(self) -> int:
+        """Remove PDFs older than the TTL, returns how many went"""
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        for entry in os.scandir(self.path):
+            if entry.name.endswith((".pdf", ".tmp")) and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "rendering": len(self._rendering),
+            "rendered": self.rendered,
+            "hits": self.hits,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _finished(self, key: str, path: str, done: asyncio.Future):
+        future = self._rendering.pop(key)
+        if done.cancelled():
+            future.cancel()
+        elif done.exception() is not None:
+            if isinstance(done.exception(), BrokenProcessPool):
+                # a worker died (out of memory most likely), the next render gets a fresh pool
+                self.shutdown()
+            future.set_exception(done.exception())
+        else:
+            self.rendered += 1
+            future.set_result(path)
+            self._renders += 1
+            if self._renders % 50 == 0:
+                self.gc()
+
+
+_renderer: Optional[PdfRenderer] = None
+
+
+def get_pdf_renderer() -> PdfRenderer:
+    """Get the process-wide PDF renderer"""
+    global _renderer
+    if _renderer is None:
+        _renderer = PdfRenderer()
+    return _renderer
+
+
+def shutdown_pdf_renderer():
+    if _renderer is not None:
+        _renderer.shutdown()
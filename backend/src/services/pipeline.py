@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .checkpoints import CheckpointStore
+
+
+@dataclass
+class Stage:
+    """One step of a pipeline
+
+    `fn` is called with the stage's inputs as keyword arguments. A stage with
+    a single output returns the value itself, otherwise a dict keyed by its
+    output names. `weight` is the stage's share of the progress bar and
+    `phase` is the name reported to clients while it runs.
+    """
+    name: str
+    fn: Callable[..., Awaitable[Any]]
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    weight: float = 1.0
+    phase: Optional[str] = None
+
+    def __post_init__(self):
+        if self.phase is None:
+            self.phase = self.name
+
+
+class StageError(Exception):
+    """A stage failed, the original exception is the __cause__"""
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+
+
+# called with (progress, current phase, per-stage report) whenever a stage starts or finishes
+ProgressCallback = Callable[[float, str, Dict[str, Dict[str, Any]]], None]
+
+
+class Pipeline:
+    """Runs a graph of stages, every stage starts as soon as its inputs exist
+
+    The graph comes from the stages' declared inputs and outputs, so adding a
+    stage is a matter of listing what it needs and what it makes. Independent
+    stages run concurrently on the event loop.
+
+    With a checkpoint store every finished stage's outputs are saved, and a
+    stage whose inputs (plus `salt`, e.g. the model) were seen before is
+    restored instead of run.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        checkpoints: Optional[CheckpointStore] = None,
+        salt: str = ""
+    ):
+        self.stages = stages
+        self.checkpoints = checkpoints
+        self.salt = salt
+        self._producers: Dict[str, str] = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in self._producers:
+                    raise ValueError(f"'{output}' is produced by both '{self._producers[output]}' and '{stage.name}'")
+                self._producers[output] = stage.name
+        self.total_weight = sum(stage.weight for stage in stages) or 1.0
+
+    def order(self, available: List[str]) -> List[str]:
+        """Stage names in an order that respects dependencies, fails on cycles and missing inputs"""
+        known = set(available)
+        remaining = list(self.stages)
+        ordered = []
+        while remaining:
+            ready = [stage for stage in remaining if set(stage.inputs) <= known]
+            if not ready:
+                missing = {
+                    stage.name: sorted(set(stage.inputs) - known - set(self._producers))
+                    for stage in remaining
+                }
+                raise ValueError(f"Stages can never run, missing inputs or a cycle: {missing}")
+            for stage in ready:
+                ordered.append(stage.name)
+                known.update(stage.outputs)
+                remaining.remove(stage)
+        return ordered
+
+    async def run(self, initial: Dict[str, Any], on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """Run every stage and return all values, initial ones included"""
+        order = self.order(list(initial))
+        rank = {name: i for i, name in enumerate(order)}
+        values = dict(initial)
+        report = {stage.name: {"status": "pending", "seconds": None} for stage in self.stages}
+        pending = sorted(self.stages, key=lambda stage: rank[stage.name])
+        running: Dict[asyncio.Task, Stage] = {}
+        started: Dict[str, float] = {}
+        done_weight = 0.0
+
+        def notify():
+            if on_progress is None:
+                return
+            # the earliest running stage is the one clients should see
+            current = min(running.values(), key=lambda stage: rank[stage.name]) if running else None
+            on_progress(done_weight / self.total_weight, current.phase if current else "completed", report)
+
+        try:
+            while pending or running:
+                for stage in [stage for stage in pending if set(stage.inputs) <= values.keys()]:
+                    pending.remove(stage)
+                    inputs = {name: values[name] for name in stage.inputs}
+                    key = None
+                    if self.checkpoints is not None:
+                        key = CheckpointStore.make_key(stage.name, self.salt, inputs)
+                        restored = await asyncio.to_thread(self.checkpoints.get, key)
+                        if restored is not None:
+                            report[stage.name] = {"status": "restored", "seconds": 0.0}
+                            done_weight += stage.weight
+                            values.update(restored)
+                            logging.info(f"Stage {stage.name} restored from checkpoint")
+                            continue
+                    report[stage.name]["status"] = "running"
+                    started[stage.name] = time.time()
+                    task = asyncio.ensure_future(self._run_stage(stage, inputs, key))
+                    running[task] = stage
+                    logging.info(f"Stage {stage.name} started")
+                notify()
+                if not running:
+                    # everything that was ready got restored, which may have readied more
+                    continue
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    stage = running.pop(task)
+                    entry = report[stage.name]
+                    entry["seconds"] = round(time.time() - started[stage.name], 3)
+                    error = task.exception()
+                    if error is not None:
+                        entry["status"] = "error"
+                        if isinstance(error, StageError):
+                            raise error
+                        raise StageError(stage.name, error) from error
+                    entry["status"] = "done"
+                    done_weight += stage.weight
+                    values.update(task.result())
+                    logging.info(f"Stage {stage.name} finished in {entry['seconds']:.2f} seconds")
+        finally:
+            for task in running:
+                task.cancel()
+
+        notify()
+        return values
+
+    async def _run_stage(self, stage: Stage, inputs: Dict[str, Any], key: Optional[str]) -> Dict[str, Any]:
+        outputs = self._outputs(stage, await stage.fn(**inputs))
+        if key is not None:
+            await asyncio.to_thread(self.checkpoints.set, key, stage.name, outputs)
+        return outputs
+
+    @staticmethod
+    def _outputs(stage: Stage, result: Any) -> Dict[str, Any]:
+        if len(stage.outputs) == 1:
+            return {stage.outputs[0]: result}
+        if not isinstance(result, dict) or set(result) != set(stage.outputs):
+            raise StageError(stage.name, ValueError(f"expected outputs {stage.outputs}"))
+        return result
@@ -1,137 +1,405 @@
+import asyncio
 import logging
 import uuid
-from typing import Dict, Any
-from ..models.schemas import ResearchRequest
+from typing import AsyncIterator, Callable, Dict, Any, Optional
+from ..models.schemas import ResearchRequest, ResearchStatus
 from ..core.literature_collector import LiteratureCollector
 from ..core.research_analyzer import ResearchAnalyzer
 from ..core.algorithm_developer import AlgorithmDeveloper
 from ..core.paper_writer import PaperWriter
+from ..core.ranking import PaperRanker
+from ..core.arxiv_corpus import get_arxiv_corpus
+from ..core.vector_index import get_vector_index
 from ..models.gemini import GeminiClient
+from ..utils.events import Event, get_job_events
+from ..utils.logging import current_job
+from ..config import EVENT_KEEPALIVE
+from .artifacts import ArtifactStore
+from .checkpoints import get_checkpoint_store
+from .job_store import JobStore, get_job_store
+from .partials import PartialOutputs
+from .pdf import PdfRenderer, get_pdf_renderer
+from .pipeline import Pipeline, Stage, StageError
+from .scheduler import JobScheduler
 import time
 
 class ResearchService:
-    def __init__(self):
-        self.research_jobs: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, job_store: Optional[JobStore] = None, artifacts: Optional[ArtifactStore] = None,
+                 pdfs: Optional[PdfRenderer] = None):
+        self.jobs = job_store or get_job_store()
+        self.artifacts = artifacts or ArtifactStore()
+        self.pdfs = pdfs or get_pdf_renderer()
+        self.scheduler = JobScheduler(self.process_research)
+        self.events = get_job_events()
+        # partial output sits next to the jobs, in a table of its own
+        self.partials = PartialOutputs(self.events, getattr(self.jobs, "db_path", None))
+        # set when a job this process runs changes, long polls wake on them
+        self._changed: Dict[str, asyncio.Event] = {}
+        recovered = self.jobs.recover()
+        if recovered:
+            logging.warning(f"Marked {recovered} jobs interrupted by a restart as failed, they can be resumed")
         
     def create_job(self, request: ResearchRequest) -> str:
         job_id = str(uuid.uuid4())
-        self.research_jobs[job_id] = {
+        self.jobs.create(job_id, {
             "status": "initializing",
             "current_stage": "literature_collection",
             "progress": 0.0,
+            "version": 0,
             "request": request.dict()
-        }
+        })
         return job_id
+    
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job as stored, None when there's no such job"""
+        return self.jobs.get(job_id)
+    
+    def get_status(self, job_id: str) -> Optional[ResearchStatus]:
+        """Small, fixed-size view of a job for polling"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        return self._status_of(job_id, job)
+    
+    def _status_of(self, job_id: str, job: Dict[str, Any]) -> ResearchStatus:
+        details = job.get("details") or {}
+        return ResearchStatus(
+            job_id=job_id,
+            status=job["status"],
+            current_stage=job["current_stage"],
+            progress=job["progress"],
+            version=job.get("version", 0),
+            queue_position=self.scheduler.position(job_id),
+            eta_seconds=self.scheduler.eta(job_id),
+            error=details.get("error"),
+            failed_stage=details.get("failed_stage")
+        )
+    
+    async def wait_for_status(
+        self,
+        job_id: str,
+        unchanged: Callable[[ResearchStatus], bool],
+        timeout: float
+    ) -> Optional[ResearchStatus]:
+        """Status once unchanged() turns false or timeout runs out, whichever is first"""
+        deadline = time.monotonic() + timeout
+        while True:
+            status = self.get_status(job_id)
+            remaining = deadline - time.monotonic()
+            if status is None or not unchanged(status) or remaining <= 0:
+                return status
+            event = self._changed.setdefault(job_id, asyncio.Event())
+            # jobs run by other worker processes don't wake us, so look again every second
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                pass
+    
+    def _save(self, job_id: str, job: Dict[str, Any]):
+        job["version"] = job.get("version", 0) + 1
+        self.jobs.save(job_id, job)
+        event = self._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+        self.events.publish(job_id, "status", self._status_of(job_id, job).dict())
+    
+    async def stream_events(self, job_id: str, last_id: Optional[int] = None) -> AsyncIterator[Optional[Event]]:
+        """Events of a job as they happen, ends once the job completes or fails
+
+        A client resuming from last_id first gets what it missed, otherwise the
+        current status comes first. None is yielded when nothing happened for
+        EVENT_KEEPALIVE seconds, so idle connections can be kept open.
+        """
+        queue, backlog = self.events.subscribe(job_id, last_id)
+        try:
+            sent_version = -1
+            if not backlog:
+                status = self.get_status(job_id)
+                if status is None:
+                    return
+                backlog = [(self.events.last_id(job_id) or None, "status", status.dict())]
+            
+            idle = 0.0
+            while True:
+                for event_id, event, data in backlog:
+                    if event == "status":
+                        # snapshots and pushed events can overlap, never go back a version
+                        if data["version"] <= sent_version:
+                            continue
+                        sent_version = data["version"]
+                    yield event_id, event, data
+                    if event == "status" and data["status"] in ("completed", "error"):
+                        return
+                
+                try:
+                    entry = await asyncio.wait_for(queue.get(), 1.0)
+                except asyncio.TimeoutError:
+                    # jobs run by other worker processes publish nothing here, so look at the store
+                    status = self.get_status(job_id)
+                    if status is None:
+                        return
+                    if status.version > sent_version:
+                        backlog = [(None, "status", status.dict())]
+                        idle = 0.0
+                        continue
+                    idle += 1.0
+                    if idle >= EVENT_KEEPALIVE:
+                        idle = 0.0
+                        yield None
+                    backlog = []
+                    continue
+                if entry is None:
+                    # cut off for falling behind, the client reconnects from its last id
+                    return
+                backlog = [entry]
+                idle = 0.0
+        finally:
+            self.events.unsubscribe(job_id, queue)
+    
+    async def get_results(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Results of a completed job, loaded from disk when they aren't hot"""
+        return await asyncio.to_thread(self.artifacts.get, job_id)
+        
+    def submit_job(self, request: ResearchRequest) -> str:
+        """Create a job and queue it, raises QueueFullError when the queue has no room"""
+        job_id = self.create_job(request)
+        try:
+            self.scheduler.submit(job_id, request, request.priority)
+        except Exception:
+            self.jobs.delete(job_id)
+            raise
+        job = self.jobs.get(job_id)
+        job["status"] = "queued"
+        self._save(job_id, job)
+        return job_id
+    
+    def resume_job(self, job_id: str):
+        """Queue a failed job again, process_research then skips its checkpointed stages"""
+        job = self.jobs.get(job_id)
+        request = ResearchRequest(**job["request"])
+        self.scheduler.submit(job_id, request, request.priority)
+        job["status"] = "queued"
+        for key in ("error", "failed_stage"):
+            job.get("details", {}).pop(key, None)
+        self._save(job_id, job)
         
+    def cancel_job(self, job_id: str) -> bool:
+        """Stop a queued or running job, False when another worker process runs it"""
+        waiting = self.scheduler.position(job_id) is not None
+        if not self.scheduler.cancel(job_id):
+            return False
+        if waiting:
+            # never started, so nothing else will record it
+            self.update_job_status(job_id, "error", "error", 0.0, {"error": "Cancelled"})
+        return True
+    
     def update_job_status(self, job_id: str, status: str, current_stage: str, 
                          progress: float, details: dict = None):
-        if job_id in self.research_jobs:
-            job = self.research_jobs[job_id]
+        job = self.jobs.get(job_id)
+        if job is not None:
             job["status"] = status
             job["current_stage"] = current_stage
             job["progress"] = progress
             
             if details:
-                if status == "completed":
-                    job["results"] = details
-                    job["details"] = details
-                elif "details" not in job:
+                if "details" not in job:
                     job["details"] = details
                 else:
                     job["details"].update(details)
+            self._save(job_id, job)
                     
             logging.info(f"Job {job_id} status updated: {status}, stage: {current_stage}, progress: {progress}")
         else:
             logging.error(f"Attempted to update non-existent job {job_id}")
     
-    async def process_research(self, job_id: str, request: ResearchRequest):
-        try:
-            gemini = GeminiClient(model=request.model_preference)
-            collector = LiteratureCollector(gemini)
-            analyzer = ResearchAnalyzer(gemini)
-            developer = AlgorithmDeveloper(gemini)
-            writer = PaperWriter(gemini)
-            
-            # Convert PaperRef objects to dictionaries
-            seed_papers_dicts = [paper.dict() for paper in request.seed_papers]
-            
-            # Phase 1: Literature Collection and Analysis
-            logging.info("PHASE 1: LITERATURE COLLECTION AND ANALYSIS")
-            self.update_job_status(job_id, "active", "literature_collection", 0.1)
+    def update_job_details(self, job_id: str, details: Dict[str, Any]):
+        """Merge details into a job without touching its status"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.setdefault("details", {}).update(details)
+            self._save(job_id, job)
+    
+    def build_pipeline(self, request: ResearchRequest, job_id: Optional[str] = None) -> Pipeline:
+        """Stage graph of a research job, see Pipeline for how it runs"""
+        gemini = GeminiClient(model=request.model_preference)
+        vector_index = get_vector_index()
+        collector = LiteratureCollector(gemini, vector_index=vector_index, corpus=get_arxiv_corpus())
+        analyzer = ResearchAnalyzer(gemini, vector_index=vector_index)
+        developer = AlgorithmDeveloper(gemini, vector_index=vector_index)
+        writer = PaperWriter(gemini)
+        
+        async def collect_literature(domain, seed_papers):
             logging.info("Collecting literature and relevant papers...")
-            phase_start = time.time()
-            
-            # Use the dictionary version instead of PaperRef objects
-            papers = await collector.gather_papers(request.domain, seed_papers_dicts)
-            logging.info(f"Collected {len(papers)} papers in {time.time() - phase_start:.2f} seconds")
-            
-            self.update_job_status(job_id, "active", "gap_analysis", 0.25)
+            papers = await collector.gather_papers(domain, seed_papers)
+            logging.info(f"Collected {len(papers)} papers")
+            return papers
+        
+        async def analyze_gaps(papers, domain):
             logging.info("Analyzing research gaps...")
-            phase_start = time.time()
-            research_gaps = await analyzer.identify_gaps(papers)
-            logging.info(f"Identified {len(research_gaps)} research gaps")
+            research_gaps = await analyzer.identify_gaps(papers, query=domain)
+            for level in research_gaps["levels"]:
+                logging.info(
+                    f"Gap analysis level {level['level']}: {level['inputs']} -> {level['outputs']} "
+                    f"in {level['seconds']:.2f} seconds"
+                )
+            logging.info(
+                f"Gap analysis covered {research_gaps['papers_analyzed']} of {research_gaps['papers_available']} papers"
+            )
+            return research_gaps
+        
+        async def generate_direction(research_gaps, research_focus):
             logging.info("Generating research direction...")
-            research_direction = await analyzer.generate_research_direction(research_gaps, request.research_focus)
-            logging.info(f"Research direction generated in {time.time() - phase_start:.2f} seconds")
-            
-            # Phase 2: Algorithm Development
-            logging.info("PHASE 2: ALGORITHM DEVELOPMENT")
-            self.update_job_status(job_id, "active", "algorithm_design", 0.4)
+            return await analyzer.generate_research_direction(research_gaps, research_focus)
+        
+        # papers come ranked against the domain, gaps are about the whole field.
+        # from the design on the work is about the focus, so rank against that too
+        async def rank_for_focus(papers, domain, research_focus, seed_papers):
+            if not research_focus:
+                return papers
+            # copies, gap analysis is reading the domain ranked papers meanwhile
+            papers = [dict(paper) for paper in papers]
+            return await asyncio.to_thread(PaperRanker().rank, papers, domain, research_focus, seed_papers)
+        
+        async def format_references(focused_papers):
+            return writer.format_references(focused_papers)
+        
+        # the long generations stream, what they have written so far is readable as the job's partial output
+        def streamed(part: str):
+            return self.partials.writer(job_id, part) if job_id is not None else None
+        
+        async def design_algorithm(research_direction, focused_papers):
             logging.info("Designing algorithm...")
-            phase_start = time.time()
-            algorithm_design = await developer.design_algorithm(research_direction, papers)
-            logging.info(f"Algorithm design complete in {time.time() - phase_start:.2f} seconds")
-            
-            self.update_job_status(job_id, "active", "implementation", 0.5)
+            return await developer.design_algorithm(research_direction, focused_papers, streamed("algorithm_design"))
+        
+        async def implement_algorithm(algorithm_design):
             logging.info("Implementing algorithm...")
-            phase_start = time.time()
-            implementation = await developer.implement_algorithm(algorithm_design)
-            logging.info(f"Implementation complete in {time.time() - phase_start:.2f} seconds")
-            
-            self.update_job_status(job_id, "active", "evaluation", 0.6)
+            return await developer.implement_algorithm(algorithm_design, streamed("implementation"))
+        
+        async def evaluate_algorithm(implementation):
             logging.info("Evaluating algorithm...")
-            phase_start = time.time()
-            evaluation_results = await developer.evaluate_algorithm(implementation)
-            logging.info(f"Evaluation complete in {time.time() - phase_start:.2f} seconds")
-            
-            self.update_job_status(job_id, "active", "refinement", 0.7)
+            return await developer.evaluate_algorithm(implementation, streamed("evaluation"))
+        
+        async def refine_algorithm(implementation, evaluation):
             logging.info("Refining implementation...")
-            phase_start = time.time()
-            refined_implementation = await developer.refine_algorithm(implementation, evaluation_results)
-            logging.info(f"Refinement complete in {time.time() - phase_start:.2f} seconds")
-            
-            # Phase 3: Paper Writing
-            logging.info("PHASE 3: PAPER WRITING")
-            self.update_job_status(job_id, "active", "paper_writing", 0.8)
+            return await developer.refine_algorithm(implementation, evaluation, streamed("refinement"))
+        
+        async def generate_title(research_direction, algorithm_design):
+            return await writer.generate_title(research_direction, algorithm_design)
+        
+        # finished sections are readable right away as partial output, readers see the paper take shape
+        def on_section(name: str, text: str):
+            logging.info(f"Wrote paper section: {name}")
+            if job_id is None:
+                return
+            self.partials.set(job_id, f"paper_sections/{name}", text)
+            self.events.publish(job_id, "section", {"stage": "paper_writing", "section": name, "content": text})
+        
+        async def write_paper(research_direction, algorithm_design, refined_implementation, evaluation, references):
             logging.info("Generating research paper...")
-            phase_start = time.time()
-            paper = await writer.generate_paper(
-                research_direction, 
-                algorithm_design,
-                refined_implementation,
-                evaluation_results,
-                papers
+            section_writers: Dict[str, Callable[[str], None]] = {}
+            
+            def on_text(section: str, piece: str):
+                if section not in section_writers:
+                    section_writers[section] = streamed(f"paper_writing/{section}")
+                section_writers[section](piece)
+            
+            return await writer.write(
+                research_direction, algorithm_design, refined_implementation, evaluation, references, on_section,
+                on_text if job_id is not None else None
             )
-            logging.info(f"Paper generated in {time.time() - phase_start:.2f} seconds")
+        
+        # weights are rough relative durations, phases are the stage names the frontend knows.
+        # the model is part of every checkpoint key, its outputs aren't interchangeable
+        return Pipeline(checkpoints=get_checkpoint_store(), salt=request.model_preference, stages=[
+            Stage("literature_collection", collect_literature, ("domain", "seed_papers"), ("papers",), weight=3),
+            Stage("gap_analysis", analyze_gaps, ("papers", "domain"), ("research_gaps",), weight=2),
+            Stage("research_direction", generate_direction, ("research_gaps", "research_focus"),
+                  ("research_direction",), phase="gap_analysis"),
+            Stage("focus_ranking", rank_for_focus, ("papers", "domain", "research_focus", "seed_papers"),
+                  ("focused_papers",), weight=0.1, phase="gap_analysis"),
+            Stage("references", format_references, ("focused_papers",), ("references",),
+                  weight=0.1, phase="paper_writing"),
+            Stage("algorithm_design", design_algorithm, ("research_direction", "focused_papers"), ("algorithm_design",)),
+            Stage("implementation", implement_algorithm, ("algorithm_design",), ("implementation",)),
+            Stage("title", generate_title, ("research_direction", "algorithm_design"), ("title",),
+                  weight=0.2, phase="paper_writing"),
+            Stage("evaluation", evaluate_algorithm, ("implementation",), ("evaluation",)),
+            Stage("refinement", refine_algorithm, ("implementation", "evaluation"), ("refined_implementation",)),
+            Stage("paper_writing", write_paper,
+                  ("research_direction", "algorithm_design", "refined_implementation", "evaluation", "references"),
+                  ("paper_content",), weight=2),
+        ])
+    
+    async def process_research(self, job_id: str, request: ResearchRequest):
+        # records logged from here on, by this task and the stage tasks it starts, are this job's
+        token = current_job.set(job_id)
+        try:
+            pipeline = self.build_pipeline(request, job_id)
+            
+            stage_report: Dict[str, Dict[str, Any]] = {}
+            
+            def on_progress(progress: float, phase: str, stages: Dict[str, Dict[str, Any]]):
+                # a stage finished, the last of what it streamed goes out now
+                self.partials.flush(job_id)
+                stage_report.update({name: dict(entry) for name, entry in stages.items()})
+                if phase != "completed":
+                    self.update_job_status(job_id, "active", phase, round(progress, 3),
+                                           details={"stages": {name: dict(entry) for name, entry in stages.items()}})
+            
+            pipeline_start = time.time()
+            values = await pipeline.run({
+                "domain": request.domain,
+                # Convert PaperRef objects to dictionaries
+                "seed_papers": [paper.dict() for paper in request.seed_papers],
+                "research_focus": request.research_focus,
+            }, on_progress=on_progress)
+            
+            paper = {
+                "title": values["title"],
+                "content": values["paper_content"],
+                "references": len(values["focused_papers"])
+            }
             logging.info(f"Paper title: {paper['title']}")
             
-            # Store results
-            logging.info("Research pipeline completed successfully!")
+            # Store results, they go to disk and the job only keeps a summary
+            results = {
+                "paper": paper,
+                "implementation": values["refined_implementation"],
+                "evaluation": values["evaluation"],
+                "research_direction": values["research_direction"],
+                "algorithm_design": values["algorithm_design"],
+                "stages": stage_report
+            }
+            stored_bytes = await asyncio.to_thread(self.artifacts.put, job_id, results)
+            # the PDF renders in the background, a download right after only waits for the rest of it
+            self.pdfs.prerender(paper["title"], paper["content"])
+            logging.info(f"Research pipeline completed successfully in {time.time() - pipeline_start:.2f} seconds!")
+            # the paper is in the results now, the sections and streamed text written on the way there can go
+            self.partials.clear(job_id)
             self.update_job_status(
                 job_id, 
                 "completed", 
                 "completed", 
                 1.0,
-                details={
-                    "paper": paper,
-                    "implementation": refined_implementation,
-                    "evaluation": evaluation_results,
-                    "research_direction": research_direction,
-                    "algorithm_design": algorithm_design
-                }
+                details={"title": paper["title"], "stages": stage_report, "results_bytes": stored_bytes}
             )
+        except asyncio.CancelledError:
+            # cancelled on request it fails like any other job and can be resumed. on shutdown
+            # it's left as it is, the next start marks it interrupted
+            if self.scheduler.cancelling(job_id):
+                logging.info("Research pipeline cancelled")
+                self.partials.clear(job_id)
+                self.update_job_status(job_id, "error", "error", self.jobs.get(job_id)["progress"],
+                                       {"error": "Cancelled"})
+            raise
         except Exception as e:
             logging.error(f"Error in research pipeline: {str(e)}", exc_info=True)
-            self.update_job_status(job_id, "error", "error", 0.0, {"error": str(e)})
+            # progress stays where it got to, finished stages are checkpointed and a resume skips them
+            details = {"error": str(e)}
+            if isinstance(e, StageError):
+                details["failed_stage"] = e.stage
+            self.partials.clear(job_id)
+            self.update_job_status(job_id, "error", "error", self.jobs.get(job_id)["progress"], details)
+        finally:
+            current_job.reset(token)
 
-            
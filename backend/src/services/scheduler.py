@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from ..config import PIPELINE_WORKERS, JOB_QUEUE_MAX, JOB_DURATION_ESTIMATE
+from ..models.schemas import ResearchRequest
+
+
+class QueueFullError(Exception):
+    """The pending queue is at capacity, the caller should retry later"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Job queue is full, retry in {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """Bounded priority queue of research jobs served by a fixed pool of workers
+
+    Only `workers` pipelines run at once no matter how many jobs come in, and
+    at most `max_pending` wait behind them. Higher priority jobs are served
+    first, equal priorities in arrival order. Wait estimates come from a
+    moving average of how long finished jobs took.
+    """
+
+    def __init__(
+        self,
+        run_job: Callable[[str, ResearchRequest], Awaitable[Any]],
+        workers: int = PIPELINE_WORKERS,
+        max_pending: int = JOB_QUEUE_MAX,
+        duration_estimate: float = JOB_DURATION_ESTIMATE
+    ):
+        self.run_job = run_job
+        self.workers = max(workers, 1)
+        self.max_pending = max_pending
+        self.avg_duration = float(duration_estimate)
+        self._pending: List[Tuple[int, int, str, ResearchRequest]] = []
+        self._sequence = itertools.count()
+        self._running: Dict[str, float] = {}
+        self._jobs: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+        # place in line of every waiting job, worked out again only after the line changed
+        self._positions: Optional[Dict[str, int]] = None
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self.completed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    def submit(self, job_id: str, request: ResearchRequest, priority: int = 0):
+        """Queue a job, raises QueueFullError when there's no room"""
+        if len(self._pending) >= self.max_pending:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after())
+        self._start()
+        # heapq pops the smallest, so priority is negated; the sequence keeps FIFO within a priority
+        heapq.heappush(self._pending, (-priority, next(self._sequence), job_id, request))
+        self._positions = None
+        asyncio.ensure_future(self._notify())
+
+    def cancel(self, job_id: str) -> bool:
+        """Take a job out of the line or stop it running, False when this process doesn't have it"""
+        for i, entry in enumerate(self._pending):
+            if entry[2] == job_id:
+                self._pending.pop(i)
+                heapq.heapify(self._pending)
+                self._positions = None
+                self.cancelled += 1
+                return True
+        task = self._jobs.get(job_id)
+        if task is None:
+            return False
+        self._cancelled.add(job_id)
+        task.cancel()
+        return True
+
+    def cancelling(self, job_id: str) -> bool:
+        """Whether a running job is being stopped by cancel(), rather than by close()"""
+        return job_id in self._cancelled
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based place of a waiting job in line, None once it runs"""
+        # status polls ask far more often than the line changes
+        if self._positions is None:
+            self._positions = {entry[2]: i + 1 for i, entry in enumerate(sorted(self._pending))}
+        return self._positions.get(job_id)
+
+    def eta(self, job_id: str) -> Optional[float]:
+        """Estimated seconds until a waiting job starts"""
+        position = self.position(job_id)
+        if position is None:
+            return None
+        now = time.time()
+        # every worker frees up once its current job is done, then works through the line
+        free_in = sorted(max(self.avg_duration - (now - started), 0.0) for started in self._running.values())
+        free_in += [0.0] * (self.workers - len(free_in))
+        slot = (position - 1) % self.workers
+        rounds = (position - 1) // self.workers
+        return round(free_in[slot] + rounds * self.avg_duration, 1)
+
+    def retry_after(self) -> float:
+        """Seconds until the queue is likely to have room again"""
+        return math.ceil(self.avg_duration / self.workers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "pending": len(self._pending),
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "avg_duration": round(self.avg_duration, 1),
+        }
+
+    async def close(self):
+        """Stop the workers, running pipelines are cancelled"""
+        jobs = list(self._jobs.values())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *jobs, return_exceptions=True)
+        self._tasks = []
+
+    def _start(self):
+        # workers need a running loop, so they start with the first job
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Condition()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def _notify(self):
+        async with self._wakeup:
+            self._wakeup.notify()
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: self._pending)
+                _, _, job_id, request = heapq.heappop(self._pending)
+                self._positions = None
+
+            started = time.time()
+            self._running[job_id] = started
+            # its own task, so cancel() can stop the job without stopping the worker
+            task = self._jobs[job_id] = asyncio.ensure_future(self.run_job(job_id, request))
+            try:
+                await asyncio.wait([task])
+                if not task.cancelled() and task.exception() is not None:
+                    # run_job records its own failures, this only keeps the worker alive
+                    e = task.exception()
+                    logging.error(f"Job {job_id} crashed its worker: {str(e)}", exc_info=e)
+            except asyncio.CancelledError:
+                # the worker itself is stopping, its job goes with it
+                task.cancel()
+                raise
+            finally:
+                del self._running[job_id]
+                del self._jobs[job_id]
+                self._cancelled.discard(job_id)
+                # exponential moving average, recent jobs say more about the current load.
+                # cancelled ones say nothing about how long a job takes
+                if task.cancelled():
+                    self.cancelled += 1
+                else:
+                    self.completed += 1
+                    self.avg_duration = 0.8 * self.avg_duration + 0.2 * (time.time() - started)
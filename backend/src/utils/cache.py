@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# a disk hit only records its access time when the stored one is older than this,
+# access times only decide what the size trim drops and don't need to be exact
+TOUCH_INTERVAL = 3600
+# recorded access times are written together, with the next write or once this many pile up
+TOUCH_BATCH = 100
+
+
+class ResponseCache:
+    """Two tier (memory LRU + optional SQLite) cache for LLM responses
+
+    The SQLite tier has a lock of its own, so a disk lookup never holds up
+    memory hits. aget/aset do the disk part on a thread for callers on the
+    event loop.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 7 * 24 * 3600,
+                 db_path: Optional[str] = None, max_db_entries: int = 20000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_db_entries = max_db_entries
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._db_writes = 0
+        # access times of disk hits not written yet
+        self._touched: Dict[str, float] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Content address for a request, parts must be JSON serializable"""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look a response up, memory first then disk"""
+        value = self._get_memory(key)
+        if value is None and self._db is not None:
+            value = self._get_disk(key)
+        if value is None:
+            self._miss()
+        return value
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get for callers on the event loop, the disk is read on a thread"""
+        value = self._get_memory(key)
+        if value is None and self._db is not None:
+            value = await asyncio.to_thread(self._get_disk, key)
+        if value is None:
+            self._miss()
+        return value
+
+    def set(self, key: str, value: str):
+        """Store a response in both tiers"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if self._db is not None:
+            self._set_disk(key, value, now)
+
+    async def aset(self, key: str, value: str):
+        """set for callers on the event loop, the disk is written on a thread"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, value, now)
+
+    def clear(self):
+        """Drop everything from both tiers"""
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._touched.clear()
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+            }
+        if self._db is not None:
+            with self._db_lock:
+                stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return stats
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if now - created_at <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._memory[key]
+            return None
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, created_at, accessed_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at, accessed_at = row
+            if now - created_at > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            if now - accessed_at >= TOUCH_INTERVAL:
+                self._touched[key] = now
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._write_touched()
+                    self._db.commit()
+        with self._lock:
+            self._remember(key, created_at, value)
+            self.hits += 1
+            self.disk_hits += 1
+        return value
+
+    def _set_disk(self, key: str, value: str, now: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._touched.pop(key, None)
+            self._write_touched()
+            self._db_writes += 1
+            # trimming on every write is wasteful, every 100 writes is plenty
+            if self._db_writes % 100 == 0:
+                self._trim_db(now)
+            self._db.commit()
+
+    def _write_touched(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _remember(self, key: str, created_at: float, value: str):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _trim_db(self, now: float):
+        expired = self._db.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        overflow = self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_db_entries,)
+        ).rowcount
+        with self._lock:
+            self.evictions += max(expired, 0) + max(overflow, 0)
@@ -0,0 +1,179 @@
+import math
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from .text import normalize_text
+from .tokens import estimate_tokens
+
+# units end at sentence punctuation or line breaks, the separator is kept so text rejoins as it was
+UNIT_RE = re.compile(r'((?<=[.!?])[ \t]+|\n+)')
+# a top level line in code starts a new block (def, class, import, ...)
+CODE_BLOCK_RE = re.compile(r'\n(?=\S)')
+# units shorter than this ("1.", "```", headings) are too generic to count as repeats
+MIN_REPEAT_CHARS = 24
+GAP = "[...]"
+CODE_GAP = "# ... (rest of the code omitted)"
+
+
+def _units(text: str) -> List[Tuple[str, str]]:
+    """(unit, separator) pairs that rejoin into text"""
+    parts = UNIT_RE.split(text)
+    parts.append("")
+    return [(parts[i], parts[i + 1]) for i in range(0, len(parts) - 1, 2) if parts[i] or parts[i + 1]]
+
+
+def _terms(text: str) -> Set[str]:
+    return {word for word in normalize_text(text).split() if len(word) > 2}
+
+
+def trim_text(text: str, max_tokens: int, query: Optional[str] = None) -> str:
+    """Text cut down to max_tokens on sentence and line boundaries
+
+    With a query, the sentences sharing the most words with it are kept,
+    otherwise the leading ones. Kept sentences stay in their original order
+    and every cut is marked, so the model knows something was left out.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    units = _units(text)
+    costs = [estimate_tokens(unit + sep) for unit, sep in units]
+
+    order = list(range(len(units)))
+    query_terms = _terms(query) if query else set()
+    if query_terms:
+        overlap = [len(query_terms & _terms(unit)) for unit, _ in units]
+        # most overlap first, earlier sentences win ties
+        order.sort(key=lambda i: (-overlap[i], i))
+
+    keep = set()
+    used = 0
+    for i in order:
+        if used + costs[i] <= max_tokens:
+            keep.add(i)
+            used += costs[i]
+
+    pieces = []
+    for i, (unit, sep) in enumerate(units):
+        if i in keep:
+            pieces.append(unit + sep)
+        elif not pieces or pieces[-1] != GAP + " ":
+            pieces.append(GAP + " ")
+    return "".join(pieces).strip()
+
+
+def trim_lines(text: str, max_tokens: int) -> str:
+    """Leading whole lines of text that fit max_tokens"""
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line + "\n")
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+
+def trim_code(code: str, max_tokens: int) -> str:
+    """Leading top level blocks of code that fit max_tokens, never half a function"""
+    if estimate_tokens(code) <= max_tokens:
+        return code
+    kept = []
+    used = estimate_tokens(CODE_GAP)
+    for block in CODE_BLOCK_RE.split(code):
+        cost = estimate_tokens(block + "\n")
+        if used + cost > max_tokens:
+            break
+        kept.append(block)
+        used += cost
+    return "\n".join(kept + [CODE_GAP])
+
+
+class ContextPacker:
+    """Fits named prompt sections into one token budget
+
+    Sections are added in priority order. A sentence that already appeared
+    in an earlier section is dropped from later ones. The budget is shared
+    out by weight, sections that need less than their share give the rest
+    back, and whatever is still too long is trimmed on sentence, line or
+    code block boundaries.
+    """
+
+    KINDS = ("text", "lines", "code")
+
+    def __init__(self, budget: int, query: Optional[str] = None):
+        self.budget = max(budget, 0)
+        self.query = query
+        self._sections: List[Dict] = []
+
+    def add(
+        self,
+        name: str,
+        text: Optional[str],
+        weight: float = 1.0,
+        kind: str = "text",
+        max_tokens: Optional[int] = None,
+        query: Optional[str] = None
+    ) -> "ContextPacker":
+        """Queue a section, max_tokens caps it below its share of the budget, query="" turns off relevance"""
+        if kind not in self.KINDS:
+            raise ValueError(f"kind must be one of {self.KINDS}")
+        self._sections.append({
+            "name": name,
+            "text": text or "",
+            "weight": weight,
+            "kind": kind,
+            "max_tokens": max_tokens,
+            "query": self.query if query is None else query,
+        })
+        return self
+
+    def pack(self) -> Dict[str, str]:
+        """Section name -> text that fits its slice of the budget"""
+        seen: Set[str] = set()
+        for section in self._sections:
+            if section["kind"] == "text":
+                section["text"] = self._drop_repeats(section["text"], seen)
+            need = estimate_tokens(section["text"])
+            if section["max_tokens"] is not None:
+                need = min(need, section["max_tokens"])
+            section["need"] = need
+
+        # water filling: settle the sections that fit their weighted share, re-share what's left
+        allocation = {}
+        remaining = self.budget
+        pending = list(self._sections)
+        while pending:
+            total_weight = math.fsum(section["weight"] for section in pending) or 1.0
+            fits = [s for s in pending if s["need"] <= remaining * s["weight"] / total_weight]
+            if not fits:
+                for section in pending:
+                    allocation[section["name"]] = int(remaining * section["weight"] / total_weight)
+                break
+            for section in fits:
+                allocation[section["name"]] = section["need"]
+                remaining -= section["need"]
+                pending.remove(section)
+
+        packed = {}
+        for section in self._sections:
+            text, limit = section["text"], allocation[section["name"]]
+            if section["kind"] == "code":
+                packed[section["name"]] = trim_code(text, limit)
+            elif section["kind"] == "lines":
+                packed[section["name"]] = trim_lines(text, limit)
+            else:
+                packed[section["name"]] = trim_text(text, limit, section["query"])
+        return packed
+
+    @staticmethod
+    def _drop_repeats(text: str, seen: Set[str]) -> str:
+        pieces = []
+        for unit, sep in _units(text):
+            key = normalize_text(unit)
+            if len(key) >= MIN_REPEAT_CHARS:
+                if key in seen:
+                    continue
+                seen.add(key)
+            pieces.append(unit + sep)
+        return "".join(pieces)
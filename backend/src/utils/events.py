@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from ..config import EVENT_HISTORY, EVENT_SUBSCRIBER_QUEUE
+
+# histories of this many jobs are kept, the ones that went quiet longest go first
+MAX_JOBS = 256
+
+# what a subscriber gets: (id, event type, data)
+Event = Tuple[int, str, Dict[str, Any]]
+
+
+class JobEvents:
+    """Per-job broadcast of status changes and log records
+
+    Every event gets the job's next sequence number and goes into a bounded
+    history, then onto the queue of every subscriber of that job. A client
+    that reconnects with the last id it saw gets the history after it
+    replayed. Publishing is safe from any thread, the fan out itself happens
+    on the event loop.
+    """
+
+    def __init__(self, history: int = EVENT_HISTORY, queue_size: int = EVENT_SUBSCRIBER_QUEUE):
+        self.history = history
+        self.queue_size = queue_size
+        self._events: "OrderedDict[str, Deque[Event]]" = OrderedDict()
+        self._next_id: Dict[str, int] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def publish(self, job_id: str, event: str, data: Dict[str, Any]) -> int:
+        """Record an event and fan it out, returns its id"""
+        with self._lock:
+            event_id = self._next_id.get(job_id, 0) + 1
+            self._next_id[job_id] = event_id
+            entry = (event_id, event, data)
+            events = self._events.get(job_id)
+            if events is None:
+                events = self._events[job_id] = deque(maxlen=self.history)
+                if len(self._events) > MAX_JOBS:
+                    # the least recently active job goes, numbering and all
+                    evicted, _ = self._events.popitem(last=False)
+                    self._next_id.pop(evicted, None)
+            else:
+                self._events.move_to_end(job_id)
+            events.append(entry)
+            waiting = job_id in self._subscribers
+
+        if waiting:
+            if self._on_loop():
+                self._deliver(job_id, entry)
+            elif self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._deliver, job_id, entry)
+        return event_id
+
+    def since(self, job_id: str, last_id: int = 0, event: Optional[str] = None) -> List[Event]:
+        """Recorded events after last_id, oldest first, only the newest ones are read"""
+        with self._lock:
+            events = self._events.get(job_id)
+            if not events:
+                return []
+            # ids are consecutive, so the tail holds exactly the ones after last_id
+            count = min(max(events[-1][0] - last_id, 0), len(events))
+            tail = [events[-1 - i] for i in range(count)]
+        tail.reverse()
+        return [entry for entry in tail if event is None or entry[1] == event]
+
+    def last_id(self, job_id: str) -> int:
+        """Id of the newest event of a job, 0 before the first"""
+        with self._lock:
+            return self._next_id.get(job_id, 0)
+
+    def subscribe(self, job_id: str, last_id: Optional[int] = None) -> Tuple[asyncio.Queue, List[Event]]:
+        """A queue of new events plus the recorded ones after last_id to send first"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        # subscribers live on this loop, publish() from other threads hands over to it
+        self._loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(queue)
+        backlog = self.since(job_id, last_id) if last_id is not None else []
+        return queue, backlog
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def _on_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _deliver(self, job_id: str, entry: Event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(job_id, ()))
+        for queue in subscribers:
+            try:
+                queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                # a reader this far behind gets cut off and reconnects from the last id it saw,
+                # the history has what it missed
+                self.unsubscribe(job_id, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+_job_events = JobEvents()
+
+
+def get_job_events() -> JobEvents:
+    """Get the process-wide job event broker"""
+    return _job_events
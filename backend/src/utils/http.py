@@ -0,0 +1,30 @@
+import aiohttp
+from typing import Optional
+from ..config import HTTP_POOL_SIZE, HTTP_TIMEOUT
+
+# One keep-alive pool for the whole app instead of a session per job
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Get the shared aiohttp session, creating it on first use"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            ttl_dns_cache=300,
+            keepalive_timeout=30
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+        )
+    return _session
+
+
+async def close_http_session():
+    """Close the shared session, called on app shutdown"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
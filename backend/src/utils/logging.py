@@ -1,42 +1,122 @@
+import atexit
 import logging
 import datetime
-from typing import Dict
-
-class JobLoggingHandler(logging.Handler):
-    def __init__(self, job_id: str, research_jobs: Dict):
-        super().__init__()
-        self.job_id = job_id
-        self.research_jobs = research_jobs
-        self.logs = []
-        
+import queue
+import threading
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from ..config import JOB_LOG_LINES
+from .events import MAX_JOBS, get_job_events
+
+# job the current task works for, tasks a pipeline starts inherit it
+current_job: ContextVar[Optional[str]] = ContextVar("current_job", default=None)
+
+# (seq, created, level, message)
+LogRecord = Tuple[int, float, str, str]
+
+class JobLogs:
+    """The last lines logged for each job, in a ring buffer per job
+
+    Lines are numbered from 1 per job and the numbers never repeat, so a
+    reader asks for what came after the last number it saw and gets exactly
+    that, however many lines the buffer dropped in between.
+    """
+
+    def __init__(self, max_lines: int = JOB_LOG_LINES):
+        self.max_lines = max_lines
+        self._lines: "OrderedDict[str, Deque[LogRecord]]" = OrderedDict()
+        self._last_seq: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def append(self, job_id: str, created: float, level: str, message: str) -> int:
+        with self._lock:
+            seq = self._last_seq.get(job_id, 0) + 1
+            self._last_seq[job_id] = seq
+            lines = self._lines.get(job_id)
+            if lines is None:
+                lines = self._lines[job_id] = deque(maxlen=self.max_lines)
+                if len(self._lines) > MAX_JOBS:
+                    # the least recently active job goes, numbering and all
+                    evicted, _ = self._lines.popitem(last=False)
+                    self._last_seq.pop(evicted, None)
+            else:
+                self._lines.move_to_end(job_id)
+            lines.append((seq, created, level, message))
+        return seq
+
+    def after(self, job_id: str, after_seq: int = 0) -> Tuple[List[LogRecord], int]:
+        """Lines after after_seq oldest first, and the last seq so far"""
+        with self._lock:
+            last_seq = self._last_seq.get(job_id, 0)
+            lines = self._lines.get(job_id)
+            if not lines:
+                return [], last_seq
+            # numbers are consecutive, so walking back from the end reads only the new lines
+            count = min(max(last_seq - after_seq, 0), len(lines))
+            new = [lines[-1 - i] for i in range(count)]
+        new.reverse()
+        return new, last_seq
+
+def as_dict(line: LogRecord) -> Dict[str, Any]:
+    seq, created, level, message = line
+    return {
+        "seq": seq,
+        "timestamp": datetime.datetime.fromtimestamp(created).isoformat(),
+        "level": level,
+        "message": message
+    }
+
+_job_logs = JobLogs()
+
+def get_job_logs() -> JobLogs:
+    """Get the process-wide job log buffers"""
+    return _job_logs
+
+class JobQueueHandler(QueueHandler):
+    """Hands records to the logging thread, tagged with the job they were logged for"""
+
+    def prepare(self, record):
+        # the contextvar belongs to the caller, the listener thread can't see it
+        job_id = current_job.get()
+        record = super().prepare(record)
+        record.job_id = job_id
+        return record
+
+class JobLogHandler(logging.Handler):
+    """Keeps a job's records in its ring buffer and pushes them as the job's log events"""
+
     def emit(self, record):
+        job_id = getattr(record, "job_id", None)
+        if job_id is None:
+            return
         try:
-            log_entry = self.format(record)
-            if self.job_id in self.research_jobs:
-                if "logs" not in self.research_jobs[self.job_id]:
-                    self.research_jobs[self.job_id]["logs"] = []
-                
-                self.research_jobs[self.job_id]["logs"].append(log_entry)
-                
-                self.research_jobs[self.job_id]["structured_logs"] = self.research_jobs[self.job_id].get("structured_logs", [])
-                self.research_jobs[self.job_id]["structured_logs"].append({
-                    "timestamp": datetime.datetime.now().isoformat(),
-                    "level": record.levelname,
-                    "message": record.getMessage(),
-                    "log_id": len(self.research_jobs[self.job_id]["logs"])
-                })
-                
-                if len(self.research_jobs[self.job_id]["logs"]) > 500:
-                    self.research_jobs[self.job_id]["logs"] = self.research_jobs[self.job_id]["logs"][-500:]
-                
-                print(f"JOB LOG [{self.job_id}]: {log_entry}")
-                self.flush()
-        except Exception as e:
-            print(f"Error logging to job {self.job_id}: {str(e)}")
+            message = record.getMessage()
+            seq = _job_logs.append(job_id, record.created, record.levelname, message)
+            get_job_events().publish(job_id, "log", as_dict((seq, record.created, record.levelname, message)))
+        except Exception:
+            self.handleError(record)
+
+_listener: Optional[QueueListener] = None
 
 def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s [%(levelname)s] %(message)s',
-        handlers=[logging.StreamHandler()]
-    )
+    """Log through a queue, a listener thread formats and writes the records
+
+    Logging calls on the event loop then cost a queue put, stdout and the
+    job buffers are dealt with off the loop.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(records, stream, JobLogHandler(), respect_handler_level=True)
+    _listener.start()
+    # stop() drains the queue, so the last records still get written on exit
+    atexit.register(_listener.stop)
+    handler = JobQueueHandler(records)
+    # the listener formats, here only the message is rendered
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logging.basicConfig(level=logging.INFO, handlers=[handler])
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+
+class RateLimiter:
+    """Async token bucket, `rate` tokens per second with room for `burst`"""
+
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1):
+        """Wait until `amount` tokens are available and take them"""
+        # waiters queue up on the lock, so they are served in arrival order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+    def charge(self, amount: float):
+        """Take tokens without waiting, the bucket may go below zero and later callers wait it off"""
+        self._refill()
+        self._tokens -= amount
+
+    def set_rate(self, rate: float):
+        self._refill()
+        self.rate = rate
+
+    def drain(self):
+        """Drop whatever burst has built up"""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class AdaptiveRateLimiter:
+    """Requests and tokens per minute for one API, slowed down when the API pushes back
+
+    Both budgets are token buckets. A throttled call (429/503) halves the
+    rate it allows, every successful call adds back a hundredth of the
+    configured maximum (AIMD), so the rate settles just under what the API
+    actually sustains rather than what it is documented to.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, min_fraction: float = 0.05):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_fraction = min_fraction
+        self.fraction = 1.0
+        # ten seconds' worth may go out at once
+        self.requests = RateLimiter(requests_per_minute / 60, burst=max(requests_per_minute / 6, 1))
+        self.tokens = RateLimiter(tokens_per_minute / 60, burst=max(tokens_per_minute / 6, 1))
+        self._last_decrease = 0.0
+        self.throttled = 0
+
+    async def acquire(self, tokens: float):
+        """Wait for a request slot and the prompt's tokens"""
+        await self.requests.acquire()
+        # bigger than the whole burst would never fit, it waits for a full bucket instead
+        await self.tokens.acquire(min(tokens, self.tokens.capacity))
+
+    def on_success(self, output_tokens: float = 0):
+        """A call went through, output_tokens are charged now that they are known"""
+        self.tokens.charge(output_tokens)
+        if self.fraction < 1.0:
+            self._set_fraction(self.fraction + 0.01)
+
+    def on_throttle(self):
+        """The API said slow down"""
+        self.throttled += 1
+        now = time.monotonic()
+        # calls in flight together get throttled together, that's one signal and one cut
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self._set_fraction(self.fraction / 2)
+        # a saved up burst would go straight into the same wall
+        self.requests.drain()
+
+    def stats(self):
+        return {
+            "requests_per_minute": round(self.requests.rate * 60, 1),
+            "tokens_per_minute": round(self.tokens.rate * 60),
+            "throttled": self.throttled,
+        }
+
+    def _set_fraction(self, fraction: float):
+        self.fraction = min(max(fraction, self.min_fraction), 1.0)
+        self.requests.set_rate(self.requests_per_minute * self.fraction / 60)
+        self.tokens.set_rate(self.tokens_per_minute * self.fraction / 60)
@@ -0,0 +1,216 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from html import escape
+from string import Template
+from typing import Tuple
+
+import markdown
+
+from ..config import HTML_CACHE_ENTRIES
+
+MARKDOWN_EXTENSIONS = ['extra', 'codehilite', 'nl2br', 'toc']
+
+# IEEE styling of a paper page, only the title and body change between papers
+PAPER_CSS = """
+    @page {
+        size: letter;
+        margin: 2.54cm;
+    }
+    body {
+        font-family: 'Times New Roman', Times, serif;
+        line-height: 1.5;
+        font-size: 10pt;
+        column-count: 2;
+        column-gap: 0.5cm;
+        margin: 0;
+        padding: 0;
+    }
+    .header {
+        column-span: all;
+        text-align: center;
+        margin-bottom: 1cm;
+        padding-bottom: 0.5cm;
+        border-bottom: 1px solid black;
+    }
+    h1 {
+        font-size: 18pt;
+        font-weight: bold;
+        text-align: center;
+        margin-bottom: 0.3cm;
+        column-span: all;
+    }
+    .author {
+        font-size: 11pt;
+        text-align: center;
+        margin-bottom: 0.5cm;
+        column-span: all;
+    }
+    .abstract {
+        font-size: 9pt;
+        font-style: italic;
+        margin-bottom: 0.5cm;
+        text-align: justify;
+        column-span: all;
+    }
+    h2 {
+        font-size: 12pt;
+        font-weight: bold;
+        margin-top: 0.5cm;
+        margin-bottom: 0.3cm;
+        text-transform: uppercase;
+        break-after: avoid;
+        column-span: all;
+    }
+    h3 {
+        font-size: 11pt;
+        font-weight: bold;
+        margin-top: 0.5cm;
+        margin-bottom: 0.3cm;
+        break-after: avoid;
+        column-span: all;
+    }
+    p {
+        text-align: justify;
+        margin-top: 0;
+        margin-bottom: 0.3cm;
+        hyphens: auto;
+    }
+    pre {
+        font-family: 'Courier New', Courier, monospace;
+        font-size: 8pt;
+        background-color: #f5f5f5;
+        padding: 0.4cm;
+        margin: 0.5cm 0;
+        border: 1px solid #ddd;
+        white-space: pre-wrap;
+        overflow-x: auto;
+        page-break-inside: avoid;
+        column-span: all;
+    }
+    code {
+        font-family: 'Courier New', Courier, monospace;
+        font-size: 8pt;
+        background-color: #f5f5f5;
+        padding: 0 3px;
+    }
+    .references {
+        font-size: 9pt;
+        margin-top: 1cm;
+        border-top: 1px solid black;
+        padding-top: 0.3cm;
+        column-span: all;
+    }
+    ol {
+        padding-left: 1.5em;
+    }
+    ul {
+        padding-left: 1.5em;
+    }
+    li {
+        margin-bottom: 0.2cm;
+        text-align: justify;
+    }
+    figure {
+        margin: 0.5cm 0;
+        text-align: center;
+        page-break-inside: avoid;
+        column-span: all;
+    }
+    figcaption {
+        font-size: 9pt;
+        font-style: italic;
+        text-align: center;
+    }
+    table {
+        width: 100%;
+        border-collapse: collapse;
+        margin: 0.5cm 0;
+        page-break-inside: avoid;
+        column-span: all;
+    }
+    th, td {
+        border: 1px solid black;
+        padding: 0.2cm;
+        font-size: 9pt;
+        text-align: center;
+    }
+    th {
+        background-color: #f0f0f0;
+    }
+    img {
+        max-width: 100%;
+        height: auto;
+    }
+
+"""
+
+PAGE_START = Template(
+    '<!DOCTYPE html>\n<html>\n<head>\n    <meta charset="UTF-8">\n    <title>$title</title>\n'
+    '    <style>' + PAPER_CSS + '    </style>\n</head>\n<body>\n'
+    '    <div class="header">\n        <h1>$title</h1>\n    </div>\n'
+)
+PAGE_END = '\n</body>\n</html>\n'
+
+
+def paper_key(title: str, content: str) -> str:
+    """Content hash of a paper, a new revision gets a new key"""
+    digest = hashlib.sha256()
+    digest.update(title.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PaperRenderer:
+    """Turns papers in markdown into styled HTML pages, remembering the recent ones
+
+    Building the markdown converter loads every extension and codehilite
+    runs Pygments over each code block, so a converter is kept per thread and
+    reset between papers, and pages are memoized by the paper's content hash.
+    """
+
+    def __init__(self, max_entries: int = HTML_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._pages: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Markdown instances keep state while converting, threads can't share one
+        self._local = threading.local()
+        self.hits = 0
+        self.renders = 0
+
+    def render(self, title: str, content: str) -> Tuple[str, str]:
+        """The page of a paper and its key"""
+        key = paper_key(title, content)
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return page, key
+
+        converter = getattr(self._local, "markdown", None)
+        if converter is None:
+            converter = self._local.markdown = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+        body = converter.reset().convert(content)
+        page = PAGE_START.substitute(title=escape(title)) + body + PAGE_END
+
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+            self.renders += 1
+        return page, key
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._pages), "hits": self.hits, "renders": self.renders}
+
+
+_renderer = PaperRenderer()
+
+
+def get_paper_renderer() -> PaperRenderer:
+    """Get the process-wide paper page renderer"""
+    return _renderer
@@ -0,0 +1,33 @@
+import unicodedata
+from typing import Optional
+
+import numpy as np
+
+# lowercases ascii letters and turns every other ascii char that isn't a digit into a space.
+# a bytes table, bytes.translate is several times faster than str.translate with a dict
+PUNCTUATION_TABLE = bytes(
+    c + 32 if 65 <= c <= 90 else c if c >= 128 or chr(c).isalnum() else 32
+    for c in range(256)
+)
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    if not text:
+        return ""
+    text = str(text)
+    if text.isascii():
+        data = text.encode("ascii")
+    else:
+        # decomposing then dropping non-ascii strips the accents off letters
+        data = unicodedata.normalize("NFKD", text).encode("ascii", "ignore")
+    return b" ".join(data.translate(PUNCTUATION_TABLE).split()).decode("ascii")
+
+
+def mix64(h: np.ndarray) -> np.ndarray:
+    """murmur3 finalizer, spreads packed shingle bytes over all 64 bits"""
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xFF51AFD7ED558CCD)
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xC4CEB9FE1A85EC53)
+    return h ^ (h >> np.uint64(33))
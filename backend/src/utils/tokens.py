@@ -0,0 +1,38 @@
+import math
+from typing import Optional
+
+from ..config import PROMPT_MAX_TOKENS
+
+# Gemini averages about 4 characters of English per token, close enough for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Rough token count of text, no tokenizer round trip"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+# input limits of the models we offer, matched by prefix so dated versions work too
+MODEL_CONTEXT_TOKENS = {
+    "gemini-1.5-pro": 2_097_152,
+    "gemini-1.5-flash": 1_048_576,
+    "gemini-2.0-flash": 1_048_576,
+    "gemini-1.0-pro": 30_720,
+    "gemini-pro": 30_720,
+}
+DEFAULT_CONTEXT_TOKENS = 30_720
+
+
+def context_window(model: Optional[str]) -> int:
+    """Context window of model in tokens, conservative for models we don't know"""
+    for name, tokens in MODEL_CONTEXT_TOKENS.items():
+        if model and model.startswith(name):
+            return tokens
+    return DEFAULT_CONTEXT_TOKENS
+
+
+def prompt_budget(model: Optional[str], max_output_tokens: int, cap: int = PROMPT_MAX_TOKENS) -> int:
+    """Tokens a prompt may use: what the window leaves after the output, at most cap"""
+    return max(min(context_window(model) - max_output_tokens, cap), 0)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import the backend as src.*, the way main.py and the benchmarks do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
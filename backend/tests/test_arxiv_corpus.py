@@ -0,0 +1,143 @@
+import gzip
+import time
+
+import pytest
+
+from src.core import arxiv_corpus
+from src.core.arxiv_corpus import ArxivCorpus
+
+ATOM_FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+<entry>
+  <id>http://arxiv.org/abs/2401.00001v2</id>
+  <published>2024-01-02T00:00:00Z</published>
+  <title>Graph Neural Networks for Molecule Property Prediction</title>
+  <summary>We predict molecule properties with message passing networks.</summary>
+  <author><name>Ada Lovelace</name></author>
+</entry>
+<entry>
+  <id>http://arxiv.org/abs/2401.00002v1</id>
+  <published>2024-01-03T00:00:00Z</published>
+  <title>Scheduling Batch Jobs on Clusters</title>
+  <summary>A planner for queued work. Graph coloring decides which tasks share a node.</summary>
+  <author><name>Alan Turing</name></author>
+</entry>
+</feed>
+"""
+
+OAI_DUMP = b"""<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+<ListRecords>
+<record>
+  <header><identifier>oai:arXiv.org:2301.00003</identifier></header>
+  <metadata>
+    <arXiv xmlns="http://arxiv.org/OAI/arXiv/">
+      <id>2301.00003</id>
+      <created>2023-01-05</created>
+      <authors><author><keyname>Hopper</keyname><forenames>Grace</forenames></author></authors>
+      <title>Compilers for Quantum Circuits</title>
+      <abstract>  We compile quantum circuits to hardware gates.  </abstract>
+    </arXiv>
+  </metadata>
+</record>
+<record>
+  <header status="deleted"><identifier>oai:arXiv.org:2301.00004</identifier></header>
+</record>
+<record>
+  <header><identifier>oai:arXiv.org:2301.00005</identifier></header>
+  <metadata>
+    <oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" xmlns:dc="http://purl.org/dc/elements/1.1/">
+      <dc:title>Graph Transformers at Scale</dc:title>
+      <dc:creator>Lamport, Leslie</dc:creator>
+      <dc:description>Attention over graph neighbourhoods, trained on billions of edges.</dc:description>
+      <dc:date>2023-02-01</dc:date>
+      <dc:identifier>http://arxiv.org/abs/2301.00005v1</dc:identifier>
+    </oai_dc:dc>
+  </metadata>
+</record>
+</ListRecords>
+</OAI-PMH>
+"""
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    atom = tmp_path / "feed.xml"
+    atom.write_bytes(ATOM_FEED)
+    oai = tmp_path / "oai.xml.gz"
+    oai.write_bytes(gzip.compress(OAI_DUMP))
+    corpus = ArxivCorpus(str(tmp_path / "corpus.db"))
+    assert corpus.import_dump(str(atom)) == 2
+    assert corpus.import_dump(str(oai)) == 2
+    return corpus
+
+
+def titles(papers):
+    return [paper["title"] for paper in papers]
+
+
+def test_import_reads_atom_and_both_oai_formats(corpus):
+    assert corpus.stats() == {"papers": 4, "queries": 0}
+    [paper] = corpus.search("quantum compilers")
+    assert paper == {
+        "title": "Compilers for Quantum Circuits",
+        "authors": "Grace Hopper",
+        "abstract": "We compile quantum circuits to hardware gates.",
+        "year": 2023,
+        "url": "http://arxiv.org/abs/2301.00003",
+        "source": "arXiv",
+    }
+
+
+def test_search_ranks_title_matches_first(corpus):
+    # "graph" is in two titles and in one abstract only
+    found = titles(corpus.search("graph"))
+    assert set(found[:2]) == {"Graph Neural Networks for Molecule Property Prediction", "Graph Transformers at Scale"}
+    assert found[2:] == ["Scheduling Batch Jobs on Clusters"]
+    # more of the query's words matched beats fewer, stemming matches "molecules" and "predicting"
+    assert titles(corpus.search("graph molecules predicting"))[0] == "Graph Neural Networks for Molecule Property Prediction"
+    assert titles(corpus.search("graph", limit=1)) == found[:1]
+
+
+def test_search_ignores_stopwords_and_fts_syntax(corpus):
+    assert corpus.search("the of and") == []
+    assert corpus.search("") == []
+    # quotes, operators and column filters are just words
+    assert titles(corpus.search('quantum" OR title:* NEAR(')) == ["Compilers for Quantum Circuits"]
+
+
+def test_reimport_updates_the_index(corpus, tmp_path):
+    updated = ATOM_FEED.replace(b"Scheduling Batch Jobs on Clusters", b"Fair Queueing for Shared Clusters")
+    feed = tmp_path / "updated.xml"
+    feed.write_bytes(updated)
+    corpus.import_dump(str(feed))
+
+    assert corpus.stats()["papers"] == 4
+    assert corpus.search("scheduling") == []
+    assert titles(corpus.search("queueing")) == ["Fair Queueing for Shared Clusters"]
+    corpus._db.execute("INSERT INTO papers_fts (papers_fts) VALUES ('integrity-check')")
+
+
+def test_delete_removes_from_the_index(corpus):
+    with corpus._lock:
+        corpus._db.execute("DELETE FROM papers WHERE key = ?", ("arxiv:2301.00003",))
+        corpus._db.commit()
+    assert corpus.search("quantum") == []
+    assert corpus.stats()["papers"] == 3
+    corpus._db.execute("INSERT INTO papers_fts (papers_fts) VALUES ('integrity-check')")
+
+
+def test_is_fresh_follows_the_ttl(corpus, monkeypatch):
+    assert not corpus.is_fresh("graph neural networks", 3600)
+    corpus.mark_query("Graph  Neural-Networks")
+    # the query is normalized, spacing and punctuation don't matter
+    assert corpus.is_fresh("graph neural networks", 3600)
+    assert not corpus.is_fresh("graph neural networks", 0)
+
+    later = time.time() + 7200
+    monkeypatch.setattr(arxiv_corpus.time, "time", lambda: later)
+    assert not corpus.is_fresh("graph neural networks", 3600)
+    assert corpus.is_fresh("graph neural networks", 3 * 3600)
+    corpus.mark_query("graph neural networks")
+    assert corpus.is_fresh("graph neural networks", 3600)
+    assert corpus.stats()["queries"] == 1
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import aiohttp
+import pytest
+
+from src.core import arxiv_harvester
+from src.core.arxiv_harvester import ArxivHarvester
+from src.utils.rate_limit import RateLimiter
+from src.utils.singleflight import SingleFlight
+
+# results the stand-in has for each query, anything else has RESULTS
+RESULTS = 100
+SHORT = {"all:short": 45}
+BROKEN = "all:broken"
+
+
+def atom_page(query: str, start: int, count: int) -> bytes:
+    tag = query.split(":")[-1]
+    entries = "".join(
+        f"<entry><id>http://arxiv.org/abs/{tag}/{i:07d}v1</id>"
+        f"<published>2024-01-01T00:00:00Z</published>"
+        f"<title>{tag} paper {i}</title><summary>About {tag}, number {i}.</summary>"
+        f"<author><name>Author {i}</name></author></entry>"
+        for i in range(start, start + count)
+    )
+    return f'<?xml version="1.0"?><feed xmlns="http://www.w3.org/2005/Atom">{entries}</feed>'.encode()
+
+
+class FakeArxiv(BaseHTTPRequestHandler):
+    """arXiv API stand-in, pages through RESULTS synthetic papers per query"""
+    requests = []
+    lock = threading.Lock()
+    # held a little so concurrent requests for the same page overlap
+    delay = 0.0
+
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        query, start, size = params["search_query"], int(params["start"]), int(params["max_results"])
+        with self.lock:
+            FakeArxiv.requests.append((query, start))
+        time.sleep(self.delay)
+        if query == BROKEN:
+            self.send_response(503)
+            self.end_headers()
+            return
+        total = SHORT.get(query, RESULTS)
+        body = atom_page(query, start, max(min(size, total - start), 0))
+        self.send_response(200)
+        self.send_header("content-type", "application/atom+xml")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url(monkeypatch):
+    FakeArxiv.requests = []
+    FakeArxiv.delay = 0.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeArxiv)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # a fresh single-flight, the counters start at zero
+    monkeypatch.setattr(arxiv_harvester, "_arxiv_inflight", SingleFlight())
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/api/query"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+async def harvest(url, queries, harvesters=1, failed=None):
+    """Papers each of `harvesters` concurrent harvesters got for queries"""
+    async with aiohttp.ClientSession() as session:
+        limiter = RateLimiter(1000, burst=100)
+
+        async def one():
+            harvester = ArxivHarvester(url, max_results=100, page_size=30, rate_limiter=limiter, session=session)
+            return [paper async for paper in harvester.harvest(queries, failed)]
+
+        return await asyncio.gather(*(one() for _ in range(harvesters)))
+
+
+def test_pages_through_every_query(server_url):
+    [papers] = asyncio.run(harvest(server_url, ["graphs", "short", "proteins"]))
+
+    titles = {paper["title"] for paper in papers}
+    assert len(papers) == len(titles) == 100 + 45 + 100
+    assert {f"graphs paper {i}" for i in range(100)} <= titles
+    # 30 + 30 + 30 + 10 for a full query, the short page of "short" ends it early
+    starts = sorted(start for query, start in FakeArxiv.requests if query == "all:graphs")
+    assert starts == [0, 30, 60, 90]
+    assert sorted(start for query, start in FakeArxiv.requests if query == "all:short") == [0, 30]
+
+
+def test_concurrent_harvests_share_requests(server_url):
+    FakeArxiv.delay = 0.05
+    first, second = asyncio.run(harvest(server_url, ["graphs", "proteins"], harvesters=2))
+
+    assert len(first) == len(second) == 200
+    # every page was fetched once, the second harvester joined the first one's requests
+    assert len(FakeArxiv.requests) == len(set(FakeArxiv.requests)) == 8
+    stats = arxiv_harvester.get_arxiv_inflight_stats()
+    assert stats == {"calls": 8, "shared": 8, "in_flight": 0}
+    # shared pages are handed out as copies, a job changing its papers doesn't touch the other's
+    first[0]["title"] = "changed"
+    assert "changed" not in {paper["title"] for paper in second}
+
+
+def test_failed_query_is_reported_and_logged(server_url, caplog):
+    failed = set()
+    with caplog.at_level(logging.WARNING):
+        [papers] = asyncio.run(harvest(server_url, ["graphs", "broken"], failed=failed))
+
+    assert len(papers) == 100
+    assert failed == {"broken"}
+    assert "Error searching arXiv for 'broken'" in caplog.text
+    assert "HTTP 503" in caplog.text
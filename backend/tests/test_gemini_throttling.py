@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from benchmarks.bench_gemini_throttling import BAD_REQUEST, CLIENT_RPM, FakeGemini, run
+from src.models import gemini
+
+CALLS = 40
+RECOVERY_CALLS = 100
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """GeminiClient talking to a FakeGemini, with its own limiter and no cache"""
+    FakeGemini.reset()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("GEMINI_API_KEY", "fake")
+    # the settings were read when src was imported, the client reads them from its module
+    monkeypatch.setattr(gemini, "GEMINI_API_ENDPOINT", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(gemini, "GEMINI_RPM", CLIENT_RPM)
+    monkeypatch.setattr(gemini, "GEMINI_MAX_RETRIES", 8)
+    monkeypatch.setattr(gemini, "GEMINI_RETRY_BASE", 0.5)
+    monkeypatch.setattr(gemini, "GEMINI_RETRY_MAX", 8)
+    monkeypatch.setattr(gemini, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(gemini, "_response_cache", None)
+    monkeypatch.setattr(gemini, "_limiters", {})
+    try:
+        yield gemini.GeminiClient()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_limiter_finds_the_servers_rate_and_recovers(client):
+    # one loop for both rounds, the limiter's lock belongs to the loop it was first used on
+    asyncio.run(throttle_and_recover(client))
+
+
+async def throttle_and_recover(client):
+    configured = client.rate_limiter.requests_per_minute
+
+    _, _, failed, lowest = await run(client, "throttled", CALLS)
+    throttled_rate = client.rate_limiter.stats()["requests_per_minute"]
+    assert not failed, f"{len(failed)} calls failed: {failed[0]!r}"
+    assert FakeGemini.throttled, "the fake never throttled, nothing was tested"
+    assert lowest < configured / 2, "the limiter didn't slow down on 429s"
+
+    # the fake stops throttling, successes should bring the rate back up
+    FakeGemini.reset(10 ** 6)
+    _, _, failed, _ = await run(client, "recovering", RECOVERY_CALLS)
+    assert not failed, f"{len(failed)} calls failed: {failed[0]!r}"
+    assert client.rate_limiter.stats()["requests_per_minute"] > throttled_rate, "the limiter didn't speed up again"
+
+
+def test_bad_request_raises_without_retrying(client):
+    with pytest.raises(gemini.GeminiError):
+        asyncio.run(client.generate_text(f"{BAD_REQUEST} please"))
+    assert FakeGemini.rejected == 1, f"a 400 was sent {FakeGemini.rejected} times"
+    assert not FakeGemini.throttled
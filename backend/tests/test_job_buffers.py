@@ -0,0 +1,29 @@
+from src.utils import events as events_module
+from src.utils import logging as logging_module
+from src.utils.events import JobEvents
+from src.utils.logging import JobLogs
+
+
+def test_evicted_job_logs_take_their_numbering_along(monkeypatch):
+    monkeypatch.setattr(logging_module, "MAX_JOBS", 2)
+    logs = JobLogs(max_lines=10)
+    logs.append("a", 0.0, "INFO", "one")
+    logs.append("b", 0.0, "INFO", "one")
+    # "a" is the most recently active, so "b" is the one evicted
+    logs.append("a", 0.0, "INFO", "two")
+    logs.append("c", 0.0, "INFO", "one")
+
+    assert set(logs._lines) == set(logs._last_seq) == {"a", "c"}
+    assert logs.after("b") == ([], 0)
+    assert [line[3] for line in logs.after("a")[0]] == ["one", "two"]
+
+
+def test_evicted_job_events_take_their_ids_along(monkeypatch):
+    monkeypatch.setattr(events_module, "MAX_JOBS", 2)
+    events = JobEvents(history=10)
+    for job_id in ("a", "b", "c", "d"):
+        events.publish(job_id, "status", {})
+
+    assert set(events._events) == set(events._next_id) == {"c", "d"}
+    assert events.last_id("a") == 0
+    assert events.since("d") == [(1, "status", {})]
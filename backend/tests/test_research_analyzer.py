@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from src.core.research_analyzer import ResearchAnalyzer
+from src.models.gemini import GeminiError
+
+PAPERS = [
+    {"title": f"Paper {i}", "authors": "A. Author", "year": 2024, "abstract": "word " * 200}
+    for i in range(40)
+]
+
+
+class StubModel:
+    """Answers every prompt, except that summaries fail for the chunks in `failing` (all when None)"""
+
+    def __init__(self, failing=None):
+        self.failing = failing
+        self.summaries = 0
+
+    async def generate_text(self, prompt, **kwargs):
+        if prompt.lstrip().startswith("Summarize"):
+            self.summaries += 1
+            if self.failing is None or self.summaries in self.failing:
+                raise GeminiError("throttled")
+        return "notes"
+
+
+def analyzer(model):
+    # small chunks so the 40 papers need the map step
+    return ResearchAnalyzer(model, max_papers=40, chunk_tokens=1000, fan_in=8)
+
+
+def test_every_summary_failing_fails_the_analysis():
+    with pytest.raises(GeminiError, match="Every summary"):
+        asyncio.run(analyzer(StubModel()).identify_gaps(PAPERS))
+
+
+def test_failed_summaries_only_cost_their_papers():
+    model = StubModel(failing={1})
+    result = asyncio.run(analyzer(model).identify_gaps(PAPERS))
+
+    chunks = model.summaries
+    assert chunks > 1
+    assert result["analysis"] == "notes"
+    assert result["papers_available"] == 40
+    assert 0 < result["papers_analyzed"] < 40
+    first_level = result["levels"][0]
+    assert (first_level["inputs"], first_level["outputs"]) == (40, chunks - 1)
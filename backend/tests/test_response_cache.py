@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from src.utils import cache as cache_module
+from src.utils.cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    # two entries in memory, so the disk tier is easy to reach
+    return ResponseCache(max_entries=2, db_path=str(tmp_path / "cache.db"))
+
+
+def accessed_at(cache, key):
+    with cache._db_lock:
+        return cache._db.execute("SELECT accessed_at FROM responses WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_disk_tier_answers_what_memory_evicted(cache):
+    for key in "abc":
+        cache.set(key, key.upper())
+    assert list(cache._memory) == ["b", "c"]
+
+    assert cache.get("a") == "A"
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"], stats["disk_entries"]) == (1, 1, 1, 3)
+
+
+def test_async_lookups_go_through_both_tiers(cache):
+    async def main():
+        for key in "abc":
+            await cache.aset(key, key.upper())
+        return [await cache.aget(key) for key in "abcd"]
+
+    assert asyncio.run(main()) == ["A", "B", "C", None]
+    # each one read back into memory pushes out the next one asked for
+    assert cache.stats()["disk_hits"] == 3
+
+
+def test_access_times_are_only_written_when_stale_and_in_batches(cache, monkeypatch):
+    for key in "abc":
+        cache.set(key, key.upper())
+    stored = accessed_at(cache, "a")
+
+    # a fresh access time isn't rewritten at all
+    cache._memory.clear()
+    assert cache.get("a") == "A"
+    assert not cache._touched
+
+    # a stale one is recorded but waits for the next write
+    later = stored + cache_module.TOUCH_INTERVAL + 1
+    monkeypatch.setattr(cache_module.time, "time", lambda: later)
+    cache._memory.clear()
+    assert cache.get("a") == "A"
+    assert cache._touched == {"a": later}
+    assert accessed_at(cache, "a") == stored
+
+    cache.set("d", "D")
+    assert not cache._touched
+    assert accessed_at(cache, "a") == later
+
+
+def test_full_touch_batch_is_written_right_away(cache, monkeypatch):
+    monkeypatch.setattr(cache_module, "TOUCH_BATCH", 2)
+    for key in "abc":
+        cache.set(key, key.upper())
+    later = accessed_at(cache, "a") + cache_module.TOUCH_INTERVAL + 1
+    monkeypatch.setattr(cache_module.time, "time", lambda: later)
+
+    cache._memory.clear()
+    cache.get("a")
+    cache.get("b")
+    assert not cache._touched
+    assert accessed_at(cache, "a") == accessed_at(cache, "b") == later
+
+
+def test_expired_entries_are_dropped(cache, monkeypatch):
+    cache.set("a", "A")
+    later = accessed_at(cache, "a") + cache.ttl_seconds + 1
+    monkeypatch.setattr(cache_module.time, "time", lambda: later)
+
+    assert cache.get("a") is None
+    cache._memory.clear()
+    assert cache.get("a") is None
+    assert cache.stats()["disk_entries"] == 0
@@ -0,0 +1,61 @@
+import asyncio
+
+from src.services.scheduler import JobScheduler
+
+
+async def run_jobs(check):
+    """Runs check against a one-worker scheduler whose jobs wait on their own event"""
+    gates = {}
+
+    async def run_job(job_id, request):
+        await gates.setdefault(job_id, asyncio.Event()).wait()
+
+    scheduler = JobScheduler(run_job, workers=1, max_pending=10)
+    try:
+        await check(scheduler, gates)
+    finally:
+        await scheduler.close()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_positions_follow_priority_and_queue_changes():
+    async def check(scheduler, gates):
+        scheduler.submit("running", None)
+        await settle()
+        scheduler.submit("low", None)
+        scheduler.submit("high", None, priority=5)
+        scheduler.submit("low-2", None)
+        assert [scheduler.position(job) for job in ("running", "high", "low", "low-2")] == [None, 1, 2, 3]
+
+        scheduler.cancel("low")
+        assert scheduler.position("low-2") == 2
+        scheduler.submit("urgent", None, priority=9)
+        assert [scheduler.position(job) for job in ("urgent", "high", "low-2")] == [1, 2, 3]
+
+        gates.setdefault("running", asyncio.Event()).set()
+        await settle()
+        assert scheduler.position("urgent") is None
+        assert scheduler.position("high") == 1
+
+    asyncio.run(run_jobs(check))
+
+
+def test_cancelled_jobs_are_not_counted_as_completed():
+    async def check(scheduler, gates):
+        for job_id in ("done", "stopped", "dropped"):
+            scheduler.submit(job_id, None)
+        await settle()
+        gates.setdefault("done", asyncio.Event()).set()
+        await settle()
+        # "stopped" runs now and is cancelled there, "dropped" is taken out of the line
+        assert scheduler.cancel("stopped")
+        assert scheduler.cancel("dropped")
+        await settle()
+        stats = scheduler.stats()
+        assert (stats["completed"], stats["cancelled"], stats["running"], stats["pending"]) == (1, 2, 0, 0)
+
+    asyncio.run(run_jobs(check))